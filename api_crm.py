@@ -1,13 +1,11 @@
-from pymongo import MongoClient
-from config import Config
+from database import buscar_leads, get_db, lead_por_vista
+from chatbot.utils import normalizar_phone_key
+from chatbot.catalog import property_catalog
+from chatbot.message_store import message_store
 from datetime import datetime
 import re
 import uuid
 
-def get_db():
-    client = MongoClient(Config.MONGO_URI)
-    return client[Config.DB_NAME]
-
 def format_relative_time(dt_obj):
     if isinstance(dt_obj, str):
         try: dt_obj = datetime.fromisoformat(dt_obj.replace('Z', ''))
@@ -32,7 +30,7 @@ def format_relative_time(dt_obj):
 def get_real_property_data(db, codigo_propiedad):
     if not codigo_propiedad or codigo_propiedad == "S/N":
         return None
-    prop = db["universo_obelix"].find_one({"codigo": str(codigo_propiedad)})
+    prop = property_catalog.buscar_codigo(codigo_propiedad)
     if not prop: return None
     return {
         "codigo": prop.get("codigo"),
@@ -50,6 +48,10 @@ def get_real_property_data(db, codigo_propiedad):
         "url": f"https://www.procasa.cl/propiedad/{prop.get('codigo')}"
     }
 
+def _filtro_lead(phone):
+    """Match exacto por la clave canónica indexada (antes era un $regex sin ancla → collection scan)."""
+    return {"phone_key": normalizar_phone_key(phone)}
+
 def detect_property_code(lead):
     code = lead.get("prospecto", {}).get("codigo")
     if code: return code
@@ -119,7 +121,7 @@ def get_crm_leads_list(filtro_estado=None, busqueda=None, ordenar_por="prioridad
     query = {"$and": query_parts} if query_parts else {}
     
     # 1. TRAER LEADS (Ejecutar query inmediata)
-    leads_list = list(db["leads"].find(query).limit(200))
+    leads_list = list(buscar_leads("fila_lista", query).limit(200))
     
     # 2. OPTIMIZACIÓN: Obtener lista de teléfonos para hacer UNA SOLA consulta de eventos
     phones_in_page = [l.get("phone", "").replace("+","").strip() for l in leads_list if l.get("phone")]
@@ -185,6 +187,8 @@ def get_crm_leads_list(filtro_estado=None, busqueda=None, ordenar_por="prioridad
                 estado_final = "gestion"
             elif estado_db == "nuevo": 
                 estado_final = "gestion"
+        elif lead.get("last_message_at"):
+             last_ts = lead["last_message_at"]
         else:
              msgs = lead.get("messages", [])
              if msgs:
@@ -246,7 +250,7 @@ def get_lead_detail_data(phone):
     db = get_db()
     phone_clean = phone.replace(" ", "").replace("+", "").strip()
     
-    lead = db["leads"].find_one({"phone": {"$regex": phone_clean}})
+    lead = lead_por_vista("detalle", _filtro_lead(phone))
     if not lead: return None
     
     codigo = detect_property_code(lead)
@@ -287,7 +291,7 @@ def get_lead_detail_data(phone):
             "channel": meta.get("interaction_type") # p.ej. 'wa', 'phone', 'email'
         })
         
-    timeline = process_chat_timeline(lead.get("messages", []))
+    timeline = process_chat_timeline(message_store.historial(lead.get("phone") or phone, lead.get("messages", [])))
     prospecto = lead.get("prospecto", {})
 
     # Buscar próxima tarea pendiente (Auditoría Canónica)
@@ -317,7 +321,7 @@ def update_lead_crm_data(phone, data):
     db = get_db()
     phone_clean = phone.replace(" ", "").replace("+", "").strip()
     
-    current_lead = db["leads"].find_one({"phone": {"$regex": phone_clean}})
+    current_lead = db["leads"].find_one(_filtro_lead(phone), {"crm_estado": 1})
     if not current_lead: return False
     
     # --- VALIDACIÓN DEL TRIÁNGULO DE CONTROL (CRITICA 1 & 3) ---
@@ -366,7 +370,7 @@ def update_lead_crm_data(phone, data):
     })
 
     db["leads"].update_one(
-        {"phone": {"$regex": phone_clean}},
+        _filtro_lead(phone),
         {"$set": {
             "crm_estado": new_state,
             "last_crm_update": datetime.now()
@@ -382,7 +386,6 @@ def update_lead_crm_data(phone, data):
 
 def manage_crm_notes(phone, note_data, action="add"):
     db = get_db()
-    phone_clean = phone.replace(" ", "").replace("+", "").strip()
     
     if action == "add":
         note_id = str(uuid.uuid4())[:8]
@@ -393,9 +396,9 @@ def manage_crm_notes(phone, note_data, action="add"):
             "created_at_str": datetime.now().strftime("%d/%m/%Y"),
             "timestamp_iso": datetime.now().isoformat()
         }
-        db["leads"].update_one({"phone": {"$regex": phone_clean}}, {"$push": {"sticky_notes": note}})
+        db["leads"].update_one(_filtro_lead(phone), {"$push": {"sticky_notes": note}})
         return note
     elif action == "delete":
-        db["leads"].update_one({"phone": {"$regex": phone_clean}}, {"$pull": {"sticky_notes": {"id": note_data.get("id")}}})
+        db["leads"].update_one(_filtro_lead(phone), {"$pull": {"sticky_notes": {"id": note_data.get("id")}}})
         return True
     return False
\ No newline at end of file
@@ -1,5 +1,6 @@
-from pymongo import MongoClient
-from config import Config
+import database
+from chatbot.message_store import message_store
+from chatbot.utils import normalizar_phone_key
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
 
@@ -98,13 +99,9 @@ def determine_strongest_intent(messages):
 # --------------------------------------------------
 def get_leads_executive_report():
     try:
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-
         # Traemos leads ordenados por fecha descendente
         documentos = list(
-            db["leads"]
-            .find({})
+            database.buscar_leads("fila_reporte")
             .sort("_id", -1)
             .limit(2000)
         )
@@ -417,14 +414,12 @@ def get_leads_executive_report():
 
 def get_specific_lead_chat(phone):
     try:
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-        doc = db["leads"].find_one({"phone": phone})
+        doc = database.lead_por_vista("chat", {"phone_key": normalizar_phone_key(phone)})
         if not doc: return None
         return {
             "phone": doc.get("phone"),
             "prospecto": doc.get("prospecto", {}),
-            "messages": doc.get("messages", []),
+            "messages": message_store.historial(doc.get("phone") or phone, doc.get("messages", [])),
             "bi_analytics_global": doc.get("bi_analytics_global", {})
         }
     except Exception as e:
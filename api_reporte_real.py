@@ -1,13 +1,10 @@
 # api_reporte_real.py → CON CHECKBOX QUE SE GUARDA EN MONGO
 
-from pymongo import MongoClient
-from config import Config
+import database
 from datetime import datetime
 
 def get_reporte_real():
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    col = db[Config.COLLECTION_CONTACTOS]
+    col = database.contactos()
 
     enviados = col.count_documents({
         "update_price.campana_nombre": {"$in": ["ajuste_precio_202512", "ajuste_precio_regiones_202512"]},
@@ -0,0 +1,155 @@
+# benchmarks/bench_entity_extractor.py
+"""
+Micro-benchmark de extracción de entidades por mensaje.
+
+Compara el camino anterior (extraer_rut + extraer_email + extraer_nombre_explicito
++ URLs/MLC/Yapo del link_extractor + el r"\\b(\\d{4,6})\\b" de core.py, cada uno
+con su propio re.search sobre el mensaje) contra EntityExtractor.extraer, que
+recorre el mensaje una sola vez. No consulta el catálogo: solo mide el parseo.
+
+Corpus: mensajes típicos de WhatsApp incluidos aquí, o mensajes reales de
+clientes leídos de leads.messages (--mongo N, solo lectura).
+
+Uso:
+    python -m benchmarks.bench_entity_extractor --repeticiones 2000
+    python -m benchmarks.bench_entity_extractor --mongo 5000
+"""
+import argparse
+import re
+import statistics
+import time
+
+from chatbot.entities import entity_extractor
+from chatbot.utils import validar_rut
+
+CORPUS = [
+    "Hola, vi esta propiedad Procasa Código 54321 en Portal Inmobiliario y me gustaría más información.",
+    "Hola! Me interesa https://departamento.mercadolibre.cl/MLC-3083856576-departamento-camino-mirasol-_JM",
+    "https://www.portalinmobiliario.com/MLC-1520938475-casa-en-venta-las-condes-_JM sigue disponible?",
+    "Vi este aviso https://www.yapo.cl/bienes-raices/departamento-en-arriendo-nunoa/28546597",
+    "ok gracias",
+    "Perfecto, me llamo Carolina Muñoz y mi rut es 12.345.678-5",
+    "mi correo es carolina.munoz@gmail.com",
+    "Busco depto en Ñuñoa o Providencia, 2 dormitorios, hasta 18 millones de arriendo",
+    "¿Acepta mascotas? tengo un perro pequeño",
+    "Soy Pedro, quiero agendar una visita para el sábado en la mañana",
+    "cuanto son los gastos comunes?",
+    "Necesito vender mi casa en La Florida, Av. Vicuña Mackenna 7255",
+    "Tienen algo en Viña del Mar cerca de la playa? presupuesto 4500 UF",
+    "mi nombre es Juan Pablo Rojas, rut 9.876.543-3, juanpablo.rojas@outlook.com",
+    "Hola buenas tardes, sigue disponible la propiedad 12890?",
+    "La ficha por favor",
+    "No gracias, ya encontré",
+    "Me pueden llamar al +56 9 8765 4321 después de las 18:00",
+    "Tengo preaprobado crédito hipotecario por 3.200 UF, busco casa en Maipú o Puente Alto",
+    "Hola, quisiera arrendar el departamento de https://www.procasa.cl/propiedad/45678 ¿cuál es el requisito de renta?",
+    "👍",
+    "es posible visitarla mañana a las 11?",
+    "Quiero comprar para inversión, algo en Santiago centro cerca del metro, 1 dormitorio",
+    "Mi pareja trabaja en Las Condes, ¿tienen algo en Vitacura o Lo Barnechea bajo 15.000 UF?",
+]
+
+# ==========================================
+# CAMINO ANTERIOR (un re.search por dato)
+# ==========================================
+def _legacy_rut(texto):
+    match = re.search(r'\b(\d{1,2}\.?\d{3}\.?\d{3}-?[\dkK])\b', texto, re.IGNORECASE)
+    if not match:
+        return None
+    rut_raw = match.group(1).replace(".", "").replace("-", "").upper()
+    return f"{rut_raw[:-1]}-{rut_raw[-1]}" if validar_rut(rut_raw) else None
+
+
+def _legacy_email(texto):
+    match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', texto)
+    return match.group(0).lower() if match else None
+
+
+def _legacy_nombre(texto):
+    for patron in (r"me llamo\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})", r"mi nombre es\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})",
+                   r"soy\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})"):
+        match = re.search(patron, texto.strip(), re.IGNORECASE)
+        if match and len(match.group(1).split()) <= 4:
+            return match.group(1).strip().title()
+    return None
+
+
+def _legacy_link(texto):
+    for url in re.findall(r'https?://[^\s]+', texto, re.IGNORECASE):
+        url = url.split("?")[0].split("#")[0].rstrip("/")
+        if "yapo.cl" in url.lower():
+            match = re.search(r"/(\d{8,12})$", url)
+            if match:
+                return match.group(1)
+            continue
+        match = re.search(r"MLC[-_]?(\d+)", url.upper().replace("_", "-"))
+        if match:
+            return f"MLC{match.group(1)}"
+    return None
+
+
+def _legacy_codigo(texto):
+    match = re.search(r"\b(\d{4,6})\b", texto)
+    return match.group(1) if match else None
+
+
+def extraer_anterior(texto):
+    return (_legacy_rut(texto), _legacy_email(texto), _legacy_nombre(texto), _legacy_link(texto), _legacy_codigo(texto))
+
+
+def extraer_nuevo(texto):
+    ent = entity_extractor.extraer(texto)
+    portal = ent.codigos_portal[0].codigo if ent.codigos_portal else None
+    return (ent.rut, ent.email, ent.nombre, portal, ent.codigo_procasa)
+
+
+def _corpus_mongo(n: int) -> list:
+    import database
+    database.connect()
+    pipeline = [
+        {"$sort": {"updated_at": -1}},
+        {"$limit": n},
+        {"$project": {"messages": {"$slice": ["$messages", -20]}}},
+        {"$unwind": "$messages"},
+        {"$match": {"messages.role": "user"}},
+        {"$limit": n},
+        {"$project": {"_id": 0, "content": "$messages.content"}},
+    ]
+    return [str(d["content"]) for d in database.leads().aggregate(pipeline) if d.get("content")]
+
+
+def _medir(fn, corpus: list, repeticiones: int) -> list:
+    """µs por mensaje, una muestra por pasada completa del corpus."""
+    muestras = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for mensaje in corpus:
+            fn(mensaje)
+        muestras.append((time.perf_counter() - inicio) * 1e6 / len(corpus))
+    return muestras
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    parser.add_argument("--mongo", type=int, default=0, help="Usar N mensajes reales de leads en vez del corpus incluido")
+    args = parser.parse_args()
+
+    corpus = _corpus_mongo(args.mongo) if args.mongo else CORPUS
+    repeticiones = max(1, args.repeticiones * len(CORPUS) // len(corpus)) if args.mongo else args.repeticiones
+
+    diferencias = [m for m in corpus if extraer_anterior(m) != extraer_nuevo(m)]
+    print(f"Corpus: {len(corpus)} mensajes | {repeticiones} pasadas | resultados distintos: {len(diferencias)}")
+    for m in diferencias[:10]:
+        print(f"   ≠ {m[:70]!r}\n     antes={extraer_anterior(m)}\n     ahora={extraer_nuevo(m)}")
+
+    print(f"{'Modo':<22} {'p50 (µs/msg)':>14} {'p95 (µs/msg)':>14}")
+    print("-" * 52)
+    for nombre, fn in (("re.search por dato", extraer_anterior), ("EntityExtractor", extraer_nuevo)):
+        muestras = sorted(_medir(fn, corpus, repeticiones))
+        p95 = muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))]
+        print(f"{nombre:<22} {statistics.median(muestras):>14.2f} {p95:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_mongo_conexiones.py
+"""
+Latencia por request: MongoClient nuevo por llamada (patrón anterior de
+api_crm.get_db, /login, /crm/lead, etc.) vs el pool compartido de database.py.
+
+Necesita MONGO_URI/DB_NAME apuntando a una base real (solo hace lecturas).
+
+Uso:
+    python -m benchmarks.bench_mongo_conexiones --requests 30
+"""
+import argparse
+import statistics
+import time
+
+from pymongo import MongoClient
+
+import database
+from config import Config
+
+
+def _request_cliente_nuevo():
+    client = MongoClient(Config.MONGO_URI)
+    try:
+        client[Config.DB_NAME]["usuarios"].find_one({"username": "admin"})
+    finally:
+        client.close()
+
+
+def _request_pool_compartido():
+    database.usuarios().find_one({"username": "admin"})
+
+
+def _medir(fn, n: int) -> list:
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    database.connect()  # Calentamos el pool como lo hace el lifespan del webhook
+
+    print(f"{'Modo':<20} {'p50 (ms)':>10} {'p95 (ms)':>10} {'max (ms)':>10}")
+    print("-" * 54)
+    for nombre, fn in (("cliente por request", _request_cliente_nuevo), ("pool compartido", _request_pool_compartido)):
+        tiempos = sorted(_medir(fn, args.requests))
+        p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+        print(f"{nombre:<20} {statistics.median(tiempos):>10.1f} {p95:>10.1f} {tiempos[-1]:>10.1f}")
+
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_pipeline_async.py
+"""
+Benchmark de carga del pipeline del chatbot con N teléfonos simultáneos.
+
+Compara el camino antiguo (process_user_message síncrono llamado dentro del
+event loop, como hacía webhook.delayed_process) contra process_user_message_async.
+Mongo y Grok se simulan con latencias fijas para aislar el efecto de la
+concurrencia; no se conecta a ningún servicio externo.
+
+Uso:
+    python -m benchmarks.bench_pipeline_async --phones 20 --mongo-ms 40 --grok-ms 1500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("XAI_API_KEY", "benchmark")
+
+from chatbot import core
+from chatbot.storage import ConversationContext
+from config import Config
+
+
+def _instalar_simulacion(mongo_s: float, grok_s: float):
+    def cargar(cls, phone):
+        time.sleep(mongo_s)
+        return cls(phone, {})
+
+    def flush(self):
+        time.sleep(mongo_s)
+
+    def es_propietario(phone):
+        time.sleep(mongo_s)
+        return False, None
+
+    respuesta = {"intencion": "consulta_general", "respuesta_bot": "ok", "datos_extraidos": {}, "bi_analytics": {}}
+
+    def grok_sync(messages, prospecto=None):
+        time.sleep(grok_s)
+        return respuesta
+
+    async def grok_async(messages, prospecto=None):
+        await asyncio.sleep(grok_s)
+        return respuesta
+
+    # Cada turno debe llegar a Grok: sin cache de respuestas ni fast path
+    Config.RESPONSE_CACHE_ENABLED = False
+    Config.FAST_PATH_ENABLED = False
+    ConversationContext.cargar = classmethod(cargar)
+    ConversationContext.flush = flush
+    core.es_propietario = es_propietario
+    core.generar_respuesta_estructurada = grok_sync
+    core.generar_respuesta_estructurada_async = grok_async
+
+
+async def _correr(n_phones: int, modo: str) -> float:
+    async def conversacion(i: int):
+        phone = f"+5690000{i:04d}"
+        mensaje = f"hola, consulta por la propiedad {1000 + i}"
+        if modo == "bloqueante":
+            return core.process_user_message(phone, mensaje)
+        return await core.process_user_message_async(phone, mensaje)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(conversacion(i) for i in range(n_phones)))
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phones", type=int, default=20)
+    parser.add_argument("--mongo-ms", type=float, default=40)
+    parser.add_argument("--grok-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    _instalar_simulacion(args.mongo_ms / 1000, args.grok_ms / 1000)
+
+    print(f"{'Modo':<12} {'Teléfonos':>10} {'Total (s)':>10} {'Turnos/s':>10}")
+    print("-" * 46)
+    for modo in ("bloqueante", "async"):
+        total = asyncio.run(_correr(args.phones, modo))
+        print(f"{modo:<12} {args.phones:>10} {total:>10.2f} {args.phones / total:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,10 @@
 import logging
 import re
 from datetime import datetime
-from pymongo import MongoClient
 from fastapi import Request  # ← AÑADIDO
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from config import Config
+import database
 from .utils import get_accion_config
 from .email_service import enviar_alerta_equipo
 
@@ -29,10 +28,8 @@ async def handle_campana_respuesta(
     config_accion = get_accion_config(accion)
 
     try:
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-        contactos = db[Config.COLLECTION_CONTACTOS]
-        respuestas = db[Config.COLLECTION_RESPUESTAS]
+        contactos = database.contactos()
+        respuestas = database.respuestas_campana()
 
         # === BUSCAMOS EL CONTACTO PRIMERO ===
         contacto = contactos.find_one({
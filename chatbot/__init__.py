@@ -1,3 +1,3 @@
-from .core import process_user_message
+from .core import process_user_message, process_user_message_async
 
-__all__ = ["process_user_message"]
\ No newline at end of file
+__all__ = ["process_user_message", "process_user_message_async"]
\ No newline at end of file
@@ -1,21 +1,18 @@
 # chatbot/alert_service.py
 import logging
-import json
 from datetime import datetime, timedelta
-from .storage import obtener_prospecto, actualizar_prospecto
+import metrics
+from .storage import obtener_prospecto, actualizar_prospecto, normalizar_alerts
 from .email_utils import send_gmail_alert
 
 logger = logging.getLogger(__name__)
 
-def should_send_alert(phone: str, lead_type: str, window_minutes: int) -> bool:
-    prospecto = obtener_prospecto(phone) or {}
-    alerts = prospecto.get("alerts_sent", {})
-    
-    if isinstance(alerts, str):
-        try:
-            alerts = json.loads(alerts.replace("'", "\""))
-        except:
-            alerts = {}
+def should_send_alert(phone: str, lead_type: str, window_minutes: int, contexto=None) -> bool:
+    if contexto is not None:
+        alerts = contexto.alerts_sent
+    else:
+        prospecto = obtener_prospecto(phone) or {}
+        alerts = normalizar_alerts(prospecto.get("alerts_sent", {}))
     
     ts_iso = alerts.get(lead_type)
     
@@ -31,16 +28,14 @@ def should_send_alert(phone: str, lead_type: str, window_minutes: int) -> bool:
     return elapsed > timedelta(minutes=window_minutes)
 
 
-def mark_alert_sent(phone: str, lead_type: str) -> None:
+def mark_alert_sent(phone: str, lead_type: str, contexto=None) -> None:
+    if contexto is not None:
+        # Se persiste junto al resto del turno en ConversationContext.flush()
+        contexto.marcar_alerta(lead_type)
+        return
+
     prospecto = obtener_prospecto(phone) or {}
-    alerts = prospecto.get("alerts_sent", {})
-    
-    if isinstance(alerts, str):
-        try:
-            alerts = json.loads(alerts.replace("'", "\""))
-        except:
-            alerts = {}
-    
+    alerts = normalizar_alerts(prospecto.get("alerts_sent", {}))
     alerts[lead_type] = datetime.utcnow().isoformat()
     actualizar_prospecto(phone, {"alerts_sent": alerts})
 
@@ -54,11 +49,13 @@ def send_alert_once(
     last_user_msg: str,
     full_history: list,
     window_minutes: int = 3, # DEFAULT AUMENTADO A 60 MINUTOS
-    lead_type_label: str | None = None
+    lead_type_label: str | None = None,
+    contexto=None
 ):
     """
     Gestiona el envío de la alerta para evitar spam.
     window_minutes: Tiempo mínimo entre correos del MISMO tipo.
+    contexto: ConversationContext del turno (evita releer el prospecto desde Mongo).
     """
     
     # Lógica extra: Si es solo un agradecimiento ("gracias"), aumentamos la restricción
@@ -66,10 +63,12 @@ def send_alert_once(
     msg_lower = last_user_msg.lower().strip()
     if len(msg_lower) < 10 and any(w in msg_lower for w in ["gracias", "ok", "bueno", "listo"]):
         logger.info(f"[EMAIL] SKIPPED LOW VALUE MSG: {msg_lower}")
+        metrics.ALERTAS.inc(tipo=lead_type, resultado="omitida_bajo_valor")
         return
 
-    if not should_send_alert(phone, lead_type, window_minutes):
+    if not should_send_alert(phone, lead_type, window_minutes, contexto):
         logger.info(f"[EMAIL] SKIPPED DUPLICATE ALERT {lead_type} for {phone} (Wait {window_minutes}m)")
+        metrics.ALERTAS.inc(tipo=lead_type, resultado="omitida_duplicada")
         return
 
     try:
@@ -83,8 +82,10 @@ def send_alert_once(
             lead_type=lead_type_label or lead_type
         )
         # Marcamos envío exitoso
-        mark_alert_sent(phone, lead_type)
+        mark_alert_sent(phone, lead_type, contexto)
+        metrics.ALERTAS.inc(tipo=lead_type, resultado="enviada")
         print(f"[EMAIL] Enviado a ejecutivo | Score: {lead_score} | Tipo: {lead_type}")
 
     except Exception as e:
-        logger.error(f"[EMAIL] ERROR sending alert: {e}")
\ No newline at end of file
+        logger.error(f"[EMAIL] ERROR sending alert: {e}")
+        metrics.ALERTAS.inc(tipo=lead_type, resultado="error")
\ No newline at end of file
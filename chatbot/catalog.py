@@ -0,0 +1,225 @@
+# chatbot/catalog.py → SNAPSHOT EN MEMORIA DE universo_obelix
+"""
+Catálogo de propiedades en memoria (unos pocos miles de filas que cambian
+pocas veces al día). Reemplaza los find_one por mensaje de rag, link_extractor,
+core y api_crm.
+
+- Columnas NumPy con los campos filtrables (operación y tipo plegados,
+  comuna como ID canónico de chatbot/comunas.py, precios, dormitorios,
+  baños, oficina prioritaria).
+- Índices hash codigo / codigo_yapo / codigo_mercadolibre → fila.
+- Cada recarga arma un CatalogSnapshot nuevo e inmutable y lo publica con
+  una sola asignación: los lectores nunca ven un catálogo a medio armar.
+
+Si el catálogo no se pudo cargar (Mongo caído al arrancar), las búsquedas
+por código vuelven a consultar Mongo directamente.
+
+Cada carga completa antes universo_obelix.comuna_norm (completar_comuna_norm):
+la carga de propiedades no lo escribe y la búsqueda del RAG en Mongo filtra
+solo por ese campo indexado.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+import database
+from config import Config
+from .comunas import normalizar_comuna
+from .utils import plegar, safe_int_conversion
+
+logger = logging.getLogger(__name__)
+
+# Campos que se devuelven al RAG (mismos que la proyección de la búsqueda en Mongo)
+CAMPOS_RESULTADO = (
+    "codigo", "operacion", "tipo", "comuna", "precio_uf", "precio_clp",
+    "dormitorios", "banos", "m2_utiles", "descripcion_clean", "nombre_calle", "amenities"
+)
+
+
+def _num(valor) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def completar_comuna_norm(lote: int = 500) -> int:
+    """Escribe comuna_norm donde falta o quedó desfasado de comuna. Retorna cuántas propiedades cambió."""
+    coleccion = database.propiedades()
+    operaciones = []
+    for doc in coleccion.find({}, {"comuna": 1, "comuna_norm": 1}):
+        cid = normalizar_comuna(doc.get("comuna"))
+        if cid and doc.get("comuna_norm") != cid:
+            operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"comuna_norm": cid}}))
+    for i in range(0, len(operaciones), lote):
+        coleccion.bulk_write(operaciones[i:i + lote], ordered=False)
+    return len(operaciones)
+
+
+def _clave(valor) -> Optional[str]:
+    if valor is None or valor == "":
+        return None
+    return str(valor).strip()
+
+
+class CatalogSnapshot:
+    """Foto inmutable del catálogo. No modificar los docs: se comparten entre requests."""
+
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+        self.creado_en = time.monotonic()
+
+        self.codigo = np.array([str(d.get("codigo")) for d in docs], dtype=object)
+        self.operacion = np.array([plegar(d.get("operacion")) for d in docs], dtype=object)
+        self.tipo = np.array([plegar(d.get("tipo")) for d in docs], dtype=object)
+        self.comuna = np.array([d.get("comuna_norm") or normalizar_comuna(d.get("comuna")) or "" for d in docs], dtype=object)
+        self.precio_uf = np.array([_num(d.get("precio_uf")) for d in docs])
+        self.precio_clp = np.array([_num(d.get("precio_clp")) for d in docs])
+        self.dormitorios = np.array([_num(d.get("dormitorios")) for d in docs])
+        self.banos = np.array([_num(d.get("banos")) for d in docs])
+        self.prioridad = np.array([(d.get("info") or {}).get("oficina") == Config.PRIORITY_OFICINA for d in docs])
+
+        self.por_codigo: Dict[str, int] = {}
+        self.por_yapo: Dict[str, int] = {}
+        self.por_mercadolibre: Dict[str, int] = {}
+        for fila, d in enumerate(docs):
+            for indice, valor in ((self.por_codigo, d.get("codigo")),
+                                  (self.por_yapo, d.get("codigo_yapo")),
+                                  (self.por_mercadolibre, d.get("codigo_mercadolibre"))):
+                clave = _clave(valor)
+                if clave:
+                    indice.setdefault(clave, fila)
+
+    def __len__(self):
+        return len(self.docs)
+
+    # --- Búsquedas puntuales ---
+    def fila_por_codigo(self, codigo) -> Optional[int]:
+        clave = _clave(codigo)
+        if not clave:
+            return None
+        fila = self.por_codigo.get(clave)
+        if fila is None:
+            fila = self.por_codigo.get(str(safe_int_conversion(clave)))  # '01234' vs 1234
+        return fila
+
+    def doc(self, fila: Optional[int]) -> Optional[dict]:
+        return dict(self.docs[fila]) if fila is not None else None
+
+    def resultado(self, fila: int) -> dict:
+        d = self.docs[fila]
+        return {k: d.get(k) for k in CAMPOS_RESULTADO}
+
+    # --- Filtros estructurados ---
+    def filtrar(self, criterios: Dict, exclude_codes: Optional[List[str]] = None) -> np.ndarray:
+        """Filas que cumplen los criterios normalizados de rag.normalizar_criterios."""
+        mask = np.ones(len(self.docs), dtype=bool)
+        if criterios.get("operacion"):
+            mask &= self.operacion == plegar(criterios["operacion"])
+        if criterios.get("tipo"):
+            mask &= self.tipo == plegar(criterios["tipo"])
+        if criterios.get("comunas"):
+            mask &= np.isin(self.comuna, criterios["comunas"])
+        presupuesto = criterios.get("presupuesto") or 0
+        if presupuesto > 0:
+            precios = self.precio_uf if presupuesto < 30000 else self.precio_clp
+            with np.errstate(invalid="ignore"):
+                mask &= precios <= presupuesto * 1.2
+        if criterios.get("dormitorios"):
+            with np.errstate(invalid="ignore"):
+                mask &= self.dormitorios >= criterios["dormitorios"]
+        if exclude_codes:
+            mask &= ~np.isin(self.codigo, [str(c) for c in exclude_codes])
+        return np.flatnonzero(mask)
+
+
+class PropertyCatalog:
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._fallo_en = 0.0
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        inicio = time.perf_counter()
+        try:
+            completadas = completar_comuna_norm()
+            if completadas:
+                logger.info(f"[CATALOG] comuna_norm completado en {completadas} propiedades")
+        except Exception as e:
+            logger.error(f"[CATALOG] No se pudo completar comuna_norm: {e}")
+        docs = list(database.propiedades().find({"codigo": {"$nin": [None, ""]}}, {"_id": 0}))
+        nuevo = CatalogSnapshot(docs)
+        self._snapshot = nuevo
+        logger.info(f"[CATALOG] {len(nuevo)} propiedades cargadas en {time.perf_counter() - inicio:.2f}s")
+
+    def _recargar(self):
+        try:
+            self.cargar()
+        except Exception as e:
+            self._fallo_en = time.monotonic()
+            logger.error(f"[CATALOG] Error recargando catálogo: {e}")
+        finally:
+            self._lock.release()
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """Snapshot vigente. La primera vez carga en línea; después refresca en segundo plano al vencer el TTL."""
+        snap = self._snapshot
+        if snap is None:
+            # Si Mongo está caído no se reintenta en cada mensaje
+            if time.monotonic() - self._fallo_en < 60:
+                return None
+            with self._lock:
+                if self._snapshot is None:
+                    try:
+                        self.cargar()
+                    except Exception as e:
+                        self._fallo_en = time.monotonic()
+                        logger.error(f"[CATALOG] No se pudo cargar el catálogo: {e}")
+            return self._snapshot
+        ahora = time.monotonic()
+        vencido = ahora - snap.creado_en > Config.CATALOG_REFRESH_SECONDS and ahora - self._fallo_en > 60
+        if vencido and self._lock.acquire(blocking=False):
+            threading.Thread(target=self._recargar, name="catalog-refresh", daemon=True).start()
+        return snap
+
+    # --- Búsquedas por código (con fallback a Mongo si no hay snapshot) ---
+    def buscar_codigo(self, codigo) -> Optional[dict]:
+        snap = self.snapshot
+        if snap is not None:
+            return snap.doc(snap.fila_por_codigo(codigo))
+        if not _clave(codigo):
+            return None
+        return database.propiedades().find_one(
+            {"$or": [{"codigo": str(codigo)}, {"codigo": safe_int_conversion(codigo)}]}, {"_id": 0}
+        )
+
+    def buscar_codigo_yapo(self, codigo_yapo) -> Optional[dict]:
+        snap = self.snapshot
+        if snap is not None:
+            return snap.doc(snap.por_yapo.get(_clave(codigo_yapo)))
+        return database.propiedades().find_one({"codigo_yapo": codigo_yapo}, {"_id": 0})
+
+    def buscar_codigo_mercadolibre(self, codigo_ml) -> Optional[dict]:
+        snap = self.snapshot
+        if snap is not None:
+            return snap.doc(snap.por_mercadolibre.get(_clave(codigo_ml)))
+        return database.propiedades().find_one({"codigo_mercadolibre": codigo_ml}, {"_id": 0})
+
+    @property
+    def generacion(self) -> Optional[float]:
+        """Cambia con cada recarga; sirve para invalidar caches derivados del catálogo."""
+        snap = self._snapshot
+        return snap.creado_en if snap else None
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {"propiedades": len(snap) if snap else 0,
+                "edad_segundos": round(time.monotonic() - snap.creado_en) if snap else None}
+
+
+property_catalog = PropertyCatalog()
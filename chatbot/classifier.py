@@ -2,9 +2,8 @@
 import logging
 import re
 from config import Config
-from .utils import limpiar_telefono
 from .grok_client import client # NECESARIO para usar la IA de Grok
-from pymongo import MongoClient
+from .owner_directory import owner_directory
 
 logger = logging.getLogger(__name__)
 
@@ -15,35 +14,13 @@ logger = logging.getLogger(__name__)
 def es_propietario(phone: str) -> tuple[bool, str]:
     """
     Retorna (es_propietario: bool, nombre_encontrado: str o None)
-    Busca en colección universo_obelix → campo movil_propietario
+    Consulta el directorio en memoria de universo_obelix → campo movil_propietario
+    (ver owner_directory.py); solo va a Mongo si el índice está vencido o en un miss no cacheado.
     """
-    # Conexión Mongo dentro de la función para manejo de recursos
-    mongo_client = None
     try:
-        mongo_client = MongoClient(Config.MONGO_URI)
-        db = mongo_client[Config.DB_NAME]
-        
-        limpio = limpiar_telefono(phone)
-        if not limpio:
-            return False, None
-
-        variantes = [
-            limpio,
-            "56" + limpio,
-            "+56" + limpio,
-            "0" + limpio,
-        ]
-        if len(limpio) == 9:
-            variantes.append(limpio[1:])  # por si guardaron sin el 9 inicial
-
-        resultado = db[Config.COLLECTION_NAME].find_one(
-            {"movil_propietario": {"$in": variantes}},
-            {"nombre_propietario": 1, "apellido_paterno_propietario": 1}
-        )
+        nombre = owner_directory.buscar(phone)
 
-        if resultado:
-            nombre = f"{resultado.get('nombre_propietario', '')} {resultado.get('apellido_paterno_propietario', '')}".strip()
-            nombre = nombre or "Propietario"
+        if nombre:
             logger.info(f"PROPIETARIO detectado: {phone} → {nombre}")
             return True, nombre
 
@@ -53,10 +30,6 @@ def es_propietario(phone: str) -> tuple[bool, str]:
     except Exception as e:
         logger.error(f"Error en es_propietario: {e}")
         return False, None
-    finally:
-        if mongo_client:
-            try: mongo_client.close()
-            except: pass
 
 # ==========================================
 # 2. CLASIFICADOR DE INTENCIÓN (IA)
@@ -0,0 +1,76 @@
+# chatbot/comunas.py → NORMALIZACIÓN DE COMUNAS
+"""
+Resuelve el texto de una comuna (del cliente o de universo_obelix) a un ID
+canónico: minúsculas, sin tildes, alias resueltos y typos corregidos.
+
+    'Ñuñoa' / 'nunoa' / 'Nuñoa '  → 'nunoa'
+    'Stgo Centro'                 → 'santiago'
+    'Las Condez'                  → 'las condes'
+
+El ID se guarda en universo_obelix.comuna_norm (lo completa cada carga del
+catálogo, ver catalog.completar_comuna_norm y migrar_comuna_norm.py) y
+las búsquedas pasan de $regex a {"comuna_norm": {"$in": [...]}} indexado.
+"""
+import difflib
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from .utils import plegar
+
+COMUNAS = [
+    # Región Metropolitana
+    "Alhué", "Buin", "Calera de Tango", "Cerrillos", "Cerro Navia", "Colina", "Conchalí",
+    "Curacaví", "El Bosque", "El Monte", "Estación Central", "Huechuraba", "Independencia",
+    "Isla de Maipo", "La Cisterna", "La Florida", "La Granja", "La Pintana", "La Reina",
+    "Lampa", "Las Condes", "Lo Barnechea", "Lo Espejo", "Lo Prado", "Macul", "Maipú",
+    "María Pinto", "Melipilla", "Ñuñoa", "Padre Hurtado", "Paine", "Pedro Aguirre Cerda",
+    "Peñaflor", "Peñalolén", "Pirque", "Providencia", "Pudahuel", "Puente Alto", "Quilicura",
+    "Quinta Normal", "Recoleta", "Renca", "San Bernardo", "San Joaquín", "San José de Maipo",
+    "San Miguel", "San Pedro", "San Ramón", "Santiago", "Talagante", "Tiltil", "Vitacura",
+    # Regiones
+    "Viña del Mar", "Valparaíso", "Concón", "Quilpué", "Villa Alemana", "Algarrobo",
+    "El Quisco", "Santo Domingo", "San Antonio", "Zapallar", "Papudo", "Rancagua", "Machalí",
+    "Talca", "Curicó", "Concepción", "San Pedro de la Paz", "Talcahuano", "Chillán",
+    "Los Ángeles", "Temuco", "Pucón", "Villarrica", "Valdivia", "Osorno", "Puerto Varas",
+    "Puerto Montt", "La Serena", "Coquimbo", "Antofagasta", "Iquique", "Arica",
+]
+
+ALIAS = {
+    "stgo": "santiago", "stgo centro": "santiago", "santiago centro": "santiago", "centro": "santiago",
+    "la dehesa": "lo barnechea", "barnechea": "lo barnechea",
+    "pac": "pedro aguirre cerda", "est central": "estacion central", "estacion": "estacion central",
+    "quinta": "quinta normal", "til til": "tiltil",
+    "vina": "vina del mar", "valpo": "valparaiso", "conce": "concepcion",
+    "chicureo": "colina", "piedra roja": "colina",
+}
+
+CANONICAS = {plegar(c): c for c in COMUNAS}
+_SEPARADORES = re.compile(r",|/|;|\s+y\s+|\s+o\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalizar_comuna(texto) -> Optional[str]:
+    """ID canónico de una comuna, o el texto plegado si no se reconoce (None si viene vacío)."""
+    base = plegar(texto)
+    if not base:
+        return None
+    if base in CANONICAS:
+        return base
+    if base in ALIAS:
+        return ALIAS[base]
+    # Typos ('las condez', 'providensia'); solo contra nombres conocidos
+    parecida = difflib.get_close_matches(base, list(CANONICAS) + list(ALIAS), n=1, cutoff=0.8)
+    if parecida:
+        return ALIAS.get(parecida[0], parecida[0])
+    return base
+
+
+def resolver_comunas(texto) -> List[str]:
+    """'Ñuñoa, providencia y las condez' → ['nunoa', 'providencia', 'las condes'] (sin repetidos)."""
+    ids = []
+    for parte in _SEPARADORES.split(str(texto or "")):
+        cid = normalizar_comuna(parte)
+        if cid and cid not in ids:
+            ids.append(cid)
+    return ids
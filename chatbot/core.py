@@ -1,33 +1,44 @@
 # chatbot/core.py
+import asyncio
+import contextvars
+import functools
 import logging
-import re
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Dict, List, Optional
 
 from config import Config
-from .storage import (
-    guardar_mensaje, 
-    obtener_conversacion, 
-    get_db, 
-    actualizar_prospecto, 
-    obtener_prospecto,
-    establecer_nombre_usuario,
-    registrar_propiedades_vistas, # NUEVA IMPORTACIÓN (Anti-repetición)
-    obtener_propiedades_vistas    # NUEVA IMPORTACIÓN (Anti-repetición)
+from .storage import ConversationContext
+from .grok_client import (
+    generar_respuesta,
+    generar_respuesta_estructurada,
+    generar_respuesta_async,
+    generar_respuesta_estructurada_async,
+    generar_respuesta_estructurada_stream
 )
-from .grok_client import generar_respuesta, generar_respuesta_estructurada
 from .link_extractor import analizar_mensaje_para_link
-from .utils import extraer_rut, extraer_email, safe_int_conversion, extraer_nombre_explicito
+from .utils import safe_int_conversion
+from .entities import Entidades, entity_extractor
 from .alert_service import send_alert_once
 from .classifier import es_propietario 
 
 # RAG IMPORT
 from .rag import buscar_propiedades, formatear_resultados_texto
+from .prompt_builder import armar_propietario, armar_prospecto
+from .response_cache import response_cache, clave as clave_respuesta, es_plantilla as es_plantilla_cache
+from .intent_router import resolver as resolver_turno_rapido, router_stats
+from .catalog import property_catalog
+from . import tracing
 # Importamos el prompt maestro con las reglas estrictas (No horarios, no inventar)
-from .prompts import SYSTEM_PROMPT_PROSPECTO 
 
 logger = logging.getLogger(__name__)
 
+# Pool acotado para las llamadas bloqueantes (pymongo, SMTP) de la variante async
+_executor = ThreadPoolExecutor(max_workers=Config.CHATBOT_MAX_WORKERS, thread_name_prefix="chatbot")
+
 # ==========================================
 #   LEAD SCORE
 # ==========================================
@@ -79,54 +90,150 @@ def formatear_ficha_tecnica(propiedad):
 #   PROCESADOR PRINCIPAL
 # ==========================================
 
+@dataclass
+class TurnoPreparado:
+    """Resultado de la fase previa al LLM: lo que hay que enviar a Grok y lo necesario para cerrar el turno."""
+    original_message: str
+    historial: List[Dict]
+    messages_para_grok: List[Dict]
+    es_propietario: bool = False
+    propiedad: Optional[dict] = None
+    segmentos: Dict[str, int] = field(default_factory=dict)  # tokens estimados por segmento del prompt
+    clave_cache: Optional[str] = None  # Solo primer contacto sin búsqueda RAG (ver response_cache)
+    respuesta_rapida: Optional[dict] = None  # Turno resuelto sin LLM (ver intent_router)
+    entidades: Optional[Entidades] = None  # Barrido único del mensaje (ver entities)
+
 def process_user_message(phone: str, message: str) -> str:
+    with tracing.turno(phone):
+        # Una sola lectura del lead al inicio; se escribe el mensaje entrante y el resto al final del turno
+        with tracing.span("cargar_contexto"):
+            contexto = ConversationContext.cargar(phone)
+        try:
+            turno = _preparar_turno(contexto, message)
+            # El mensaje del cliente se guarda antes de Grok (hasta 30s): si el turno se cae, no se pierde
+            with tracing.span("guardar_mensaje", tipo="entrante"):
+                contexto.flush()
+            if turno.es_propietario:
+                with tracing.span("grok", tipo="propietario"):
+                    respuesta = generar_respuesta(turno.messages_para_grok, "propietario", turno.segmentos)
+                return _cerrar_turno(contexto, turno, respuesta)
+            resultado_grok = turno.respuesta_rapida or response_cache.obtener(turno.clave_cache, turno.propiedad)
+            if resultado_grok is None:
+                try:
+                    inicio = time.perf_counter()
+                    with tracing.span("grok", tipo="estructurada"):
+                        resultado_grok = generar_respuesta_estructurada(turno.messages_para_grok, turno.segmentos)
+                    router_stats.registrar_llm(time.perf_counter() - inicio)
+                    response_cache.guardar(turno.clave_cache, resultado_grok, turno.propiedad)
+                except Exception as e:
+                    logger.error(f"Error Grok: {e}")
+                    resultado_grok = None
+            return _cerrar_turno(contexto, turno, resultado_grok)
+        finally:
+            with tracing.span("guardar_mensaje"):
+                contexto.flush()
+
+async def process_user_message_async(phone: str, message: str, on_respuesta=None) -> str:
+    """
+    Variante async de process_user_message para usar dentro del event loop de uvicorn.
+    Mongo (pymongo) corre en un pool de hilos acotado y Grok usa AsyncOpenAI, así que
+    varias conversaciones avanzan en paralelo sin bloquear el loop.
+
+    on_respuesta: corrutina opcional (texto) → se llama con respuesta_bot apenas
+    Grok la termina de generar (streaming), antes de procesar el resto del JSON.
+    """
+    with tracing.turno(phone):
+        with tracing.span("cargar_contexto"):
+            contexto = await _en_executor(ConversationContext.cargar, phone)
+        try:
+            turno = await _en_executor(_preparar_turno, contexto, message)
+            # El mensaje del cliente se guarda antes de Grok (hasta 30s): si el turno se cae, no se pierde
+            with tracing.span("guardar_mensaje", tipo="entrante"):
+                await _en_executor(contexto.flush)
+            if turno.es_propietario:
+                with tracing.span("grok", tipo="propietario"):
+                    respuesta = await generar_respuesta_async(turno.messages_para_grok, "propietario", turno.segmentos)
+                return _cerrar_turno(contexto, turno, respuesta)
+            resultado_grok = turno.respuesta_rapida or response_cache.obtener(turno.clave_cache, turno.propiedad)
+            if turno.respuesta_rapida is not None:
+                logger.info(f"[FAST_PATH] Turno resuelto sin LLM para {phone}: {resultado_grok['bi_analytics']}")
+            elif resultado_grok is not None:
+                logger.info(f"[CACHE] Respuesta de primer contacto desde cache para {phone}")
+            else:
+                try:
+                    inicio = time.perf_counter()
+                    if on_respuesta and Config.GROK_STREAMING and not _fuerza_ficha(turno):
+                        # Incluye el envío temprano de respuesta_bot (también queda como span envio_whatsapp)
+                        with tracing.span("grok", tipo="stream"):
+                            resultado_grok = await generar_respuesta_estructurada_stream(turno.messages_para_grok, turno.segmentos, on_respuesta)
+                    else:
+                        with tracing.span("grok", tipo="estructurada"):
+                            resultado_grok = await generar_respuesta_estructurada_async(turno.messages_para_grok, turno.segmentos)
+                    router_stats.registrar_llm(time.perf_counter() - inicio)
+                    response_cache.guardar(turno.clave_cache, resultado_grok, turno.propiedad)
+                except Exception as e:
+                    logger.error(f"Error Grok: {e}")
+                    resultado_grok = None
+            # El cierre puede enviar alertas por SMTP → también fuera del loop
+            return await _en_executor(_cerrar_turno, contexto, turno, resultado_grok)
+        finally:
+            with tracing.span("guardar_mensaje"):
+                await _en_executor(contexto.flush)
+
+async def _en_executor(fn, *args):
+    loop = asyncio.get_running_loop()
+    # run_in_executor no propaga contextvars: sin esto los spans del hilo pierden el turno
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, fn, *args))
+
+def _preparar_turno(contexto: ConversationContext, message: str) -> TurnoPreparado:
+    phone = contexto.phone
     original_message = message
     msg_lower = original_message.lower()
     
     # 1. Guardar mensaje usuario
-    guardar_mensaje(phone, "user", original_message)
+    contexto.agregar_mensaje("user", original_message)
 
-    historial = obtener_conversacion(phone)
+    historial = contexto.messages
 
     # === OBTENEMOS PROSPECTO TEMPRANO PARA PODER USARLO EN ORIGEN Y EN TODO EL FLUJO ===
-    prospecto_actual = obtener_prospecto(phone) or {}
+    prospecto_actual = contexto.prospecto
 
     # Solo forzar WhatsApp como fallback si no hay origen previo (permite Yapo, MercadoLibre, etc.)
     if not prospecto_actual.get("origen"):
-        actualizar_prospecto(phone, {"origen": "WhatsApp"})
+        contexto.actualizar_prospecto({"origen": "WhatsApp"})
 
     # =======================================================
     # 2. FLUJO PROPIETARIO
     # =======================================================
-    es_prop, nombre_prop = es_propietario(phone) 
+    with tracing.span("clasificar_propietario"):
+        es_prop, nombre_prop = es_propietario(phone)
     if es_prop:
-        prompt_propietario = f"Eres asistente Procasa para propietarios. Habla directo y claro con {nombre_prop}. Responde cualquier consulta sobre su propiedad o venta."
-        respuesta = generar_respuesta(
-            [{"role": "system", "content": prompt_propietario}, *historial[-20:], {"role": "user", "content": original_message}],
-            "propietario"
+        prompt = armar_propietario(historial, original_message, nombre_prop)
+        return TurnoPreparado(
+            original_message=original_message,
+            historial=historial,
+            messages_para_grok=prompt.messages,
+            es_propietario=True,
+            segmentos=prompt.segmentos
         )
-        guardar_mensaje(phone, "assistant", respuesta, {"tipo": "propietario_atencion"})
-        return respuesta
 
     # =======================================================
     # 3. ANÁLISIS PRELIMINAR DE DATOS Y EXTRACCIÓN PROACTIVA
     # =======================================================
-    prospecto_actual = obtener_prospecto(phone) or {} 
     updates_datos = {}
+    # Un solo barrido del mensaje: RUT, email, nombre, links de portal y códigos Procasa
+    entidades = entity_extractor.extraer(original_message)
     
     # A) EXTRACCIÓN PROACTIVA DE DATOS PERSONALES
-    if not prospecto_actual.get("email"):
-        nuevo_email = extraer_email(original_message)
-        if nuevo_email: updates_datos["email"] = nuevo_email
+    if not prospecto_actual.get("email") and entidades.email:
+        updates_datos["email"] = entidades.email
 
-    if not prospecto_actual.get("rut"):
-        nuevo_rut = extraer_rut(original_message)
-        if nuevo_rut: updates_datos["rut"] = nuevo_rut
+    if not prospecto_actual.get("rut") and entidades.rut:
+        updates_datos["rut"] = entidades.rut
 
-    if not prospecto_actual.get("nombre"):
-        nombre_explicito = extraer_nombre_explicito(original_message)
-        if nombre_explicito:
-            updates_datos["nombre"] = nombre_explicito
+    if not prospecto_actual.get("nombre") and entidades.nombre:
+        updates_datos["nombre"] = entidades.nombre
 
     # B) EXTRACCIÓN RÁPIDA DE INTENCIÓN DE BÚSQUEDA (Heurística)
     if not prospecto_actual.get("operacion"):
@@ -134,8 +241,7 @@ def process_user_message(phone: str, message: str) -> str:
         elif "arriendo" in msg_lower or "arrendar" in msg_lower: updates_datos["operacion"] = "Arriendo"
 
     if updates_datos:
-        actualizar_prospecto(phone, updates_datos)
-        prospecto_actual.update(updates_datos)
+        contexto.actualizar_prospecto(updates_datos)
 
     # =======================================================
     # 4. ANÁLISIS DE PROPIEDAD (LINK O CÓDIGO) - VERSIÓN CORREGIDA
@@ -146,7 +252,8 @@ def process_user_message(phone: str, message: str) -> str:
     codigo_detectado = None
     
     # 1. Intentar detectar Link o Código en el mensaje actual
-    es_link, temp_prop, plataforma_origen, codigo_externo_raw = analizar_mensaje_para_link(original_message)
+    inicio_link = time.perf_counter()
+    es_link, temp_prop, plataforma_origen, codigo_externo_raw = analizar_mensaje_para_link(original_message, entidades)
 
     if es_link and temp_prop:
         propiedad = temp_prop
@@ -159,10 +266,9 @@ def process_user_message(phone: str, message: str) -> str:
 
     if not propiedad:
         # Buscar código numérico explícito en el mensaje (código Procasa interno)
-        match = re.search(r"\b(\d{4,6})\b", original_message)
-        if match:
-            cod = match.group(1)
-            propiedad = get_db()[Config.COLLECTION_NAME].find_one({"$or": [{"codigo": cod}, {"codigo": safe_int_conversion(cod)}]})
+        cod = entidades.codigo_procasa
+        if cod:
+            propiedad = property_catalog.buscar_codigo(cod)
             if propiedad:
                 codigo_detectado = str(propiedad.get("codigo"))
                 if not prospecto_actual.get("origen"):
@@ -172,7 +278,8 @@ def process_user_message(phone: str, message: str) -> str:
     if not propiedad and not any(x in msg_lower for x in ["busco", "otra", "tienes", "opciones"]):
         codigo_guardado = prospecto_actual.get("codigo")
         if codigo_guardado:
-            propiedad = get_db()[Config.COLLECTION_NAME].find_one({"$or": [{"codigo": codigo_guardado}, {"codigo": safe_int_conversion(codigo_guardado)}]})
+            propiedad = property_catalog.buscar_codigo(codigo_guardado)
+    tracing.registrar("resolver_link", inicio_link, encontrada=bool(propiedad))
 
     # Actualizar prospecto si encontramos propiedad nueva
     if propiedad and codigo_detectado:
@@ -193,24 +300,37 @@ def process_user_message(phone: str, message: str) -> str:
             elif plataforma_origen in ["MercadoLibre", "PortalInmobiliario", "Otro Portal (MLC code)"]:
                 updates_prop["codigo_mercadolibre"] = codigo_externo
         
-        actualizar_prospecto(phone, updates_prop)
+        contexto.actualizar_prospecto(updates_prop)
         
         # Registrar para anti-repetición en RAG
-        registrar_propiedades_vistas(phone, [codigo_detectado])
+        contexto.registrar_propiedades_vistas([codigo_detectado])
 
     # =======================================================
-    # 5. PREPARACIÓN DE MESSAGES PARA GROK
+    # 4.5 RUTA RÁPIDA: "ok", "gracias", datos sueltos, ficha → sin LLM
     # =======================================================
-    messages_para_grok = []
-    
-    # 1. AGREGAMOS EL PROMPT DE SISTEMA ESTRICTO
-    messages_para_grok.append({"role": "system", "content": SYSTEM_PROMPT_PROSPECTO})
-    
-    # 2. Agregamos el historial reciente
-    for m in historial[-6:]: # Usamos los últimos 6 para contexto
-        messages_para_grok.append(m)
+    if Config.FAST_PATH_ENABLED:
+        respuesta_rapida = resolver_turno_rapido(
+            original_message, historial, contexto.prospecto,
+            ficha=formatear_ficha_tecnica(propiedad) if propiedad else None,
+            propiedad_nueva=bool(codigo_detectado or es_link),
+            entidades=entidades
+        )
+        router_stats.registrar(respuesta_rapida["bi_analytics"]["fast_path"] if respuesta_rapida else None)
+        if respuesta_rapida:
+            return TurnoPreparado(
+                original_message=original_message,
+                historial=historial,
+                messages_para_grok=[],
+                propiedad=propiedad,
+                respuesta_rapida=respuesta_rapida,
+                entidades=entidades
+            )
 
+    # =======================================================
+    # 5. CONTEXTO DINÁMICO DEL TURNO (va al final del prompt, ver prompt_builder)
+    # =======================================================
     system_parts = []
+    usa_rag = False
     
     # --- CONTEXTO 1: ESTADO DE DATOS PERSONALES ---
     datos_necesarios = {
@@ -257,14 +377,18 @@ def process_user_message(phone: str, message: str) -> str:
         if criterios_rag["operacion"] and criterios_rag["comuna"] and (is_search_intent or is_initial_search):
             
             # --- LÓGICA CLAVE: ANTI-REPETICIÓN Y LÍMITE ---
-            codigos_vistos = obtener_propiedades_vistas(phone)
+            codigos_vistos = contexto.propiedades_vistas
             
             # Buscamos excluyendo lo visto y limitando a 3 (o el límite que se defina)
-            resultados_rag = buscar_propiedades(
-                criterios_rag, 
-                exclude_codes=codigos_vistos, 
-                limit=3
-            )
+            usa_rag = True
+            with tracing.span("busqueda_rag") as span_rag:
+                resultados_rag = buscar_propiedades(
+                    criterios_rag, 
+                    exclude_codes=codigos_vistos, 
+                    limit=3,
+                    texto_consulta=original_message
+                )
+                span_rag["resultados"] = len(resultados_rag)
             
             texto_rag = formatear_resultados_texto(resultados_rag)
             
@@ -273,9 +397,9 @@ def process_user_message(phone: str, message: str) -> str:
                 # Usamos p.get() para seguridad y forzamos str() para que coincida con MongoDB
                 nuevos_codigos = [str(p.get("codigo")) for p in resultados_rag if p.get("codigo")]
                 
-                # Guardamos inmediatamente en Mongo para que la próxima búsqueda los excluya
+                # Se persisten con el flush del turno para que la próxima búsqueda los excluya
                 if nuevos_codigos:
-                    registrar_propiedades_vistas(phone, nuevos_codigos)
+                    contexto.registrar_propiedades_vistas(nuevos_codigos)
                     logger.info(f"[RAG] Propiedades registradas como vistas para {phone}: {nuevos_codigos}")
                 # ---------------------------------------------
                 
@@ -305,27 +429,61 @@ def process_user_message(phone: str, message: str) -> str:
             INSTRUCCIÓN: Pregunta amablemente por estos datos.
             """)
 
-    # Insertar Contexto Dinámico al final del System Prompt
-    if system_parts:
-        full_context = "\n\n".join(system_parts)
-        messages_para_grok.append({"role": "system", "content": full_context})
-
-    # Mensaje final del usuario
-    messages_para_grok.append({"role": "user", "content": original_message})
+    # Prefijo estático + historial + contexto dinámico + mensaje del usuario
+    prompt = armar_prospecto(historial, original_message, contexto.prospecto, system_parts)
+
+    # Cache de respuestas: solo el primer turno (sin respuestas previas del bot), sin listado RAG
+    # (depende del stock del momento) y solo para el mensaje de plantilla del portal
+    clave_cache = None
+    primer_contacto = not any(m.get("role") == "assistant" for m in historial)
+    if (Config.RESPONSE_CACHE_ENABLED and primer_contacto and not usa_rag
+            and es_plantilla_cache(entidades, codigo_detectado, contexto.prospecto)):
+        clave_cache = clave_respuesta(original_message, codigo_detectado)
+
+    return TurnoPreparado(
+        original_message=original_message,
+        historial=historial,
+        messages_para_grok=prompt.messages,
+        propiedad=propiedad,
+        segmentos=prompt.segmentos,
+        clave_cache=clave_cache,
+        entidades=entidades
+    )
+
+def _fuerza_ficha(turno: TurnoPreparado) -> bool:
+    """Si el cliente pide la ficha, la respuesta de Grok se reemplaza por la ficha completa (no se puede adelantar)."""
+    return bool(turno.propiedad) and "ficha" in turno.original_message.lower()
+
+def _alerta_trazada(**kwargs):
+    """send_alert_once medido como etapa "alertas" del turno (SMTP + registro anti-duplicados)."""
+    with tracing.span("alertas", lead_type=kwargs.get("lead_type")):
+        send_alert_once(**kwargs)
+
+def _cerrar_turno(contexto: ConversationContext, turno: TurnoPreparado, resultado_grok) -> str:
+    """Aplica la respuesta de Grok al contexto: datos extraídos, alertas y mensaje del asistente."""
+    phone = contexto.phone
+    original_message = turno.original_message
+    historial = turno.historial
+    propiedad = turno.propiedad
+
+    if turno.es_propietario:
+        contexto.agregar_mensaje("assistant", resultado_grok, {"tipo": "propietario_atencion"})
+        return resultado_grok
 
     # =======================================================
     # 6. RESPUESTA CON GROK (Generación + Extracción)
     # =======================================================
     try:
-        resultado_grok = generar_respuesta_estructurada(messages_para_grok, prospecto_actual)
-        
+        if resultado_grok is None:
+            raise ValueError("sin respuesta de Grok")
+
         intencion = resultado_grok["intencion"]
         respuesta = resultado_grok["respuesta_bot"]
         datos_extraidos = resultado_grok.get("datos_extraidos", {})
         
         # Guardar nuevos datos detectados por IA
         if datos_extraidos:
-            actualizar_prospecto(phone, datos_extraidos)
+            contexto.actualizar_prospecto(datos_extraidos)
 
     except Exception as e:
         logger.error(f"Error Grok: {e}")
@@ -335,7 +493,7 @@ def process_user_message(phone: str, message: str) -> str:
     # =======================================================
     # 7. EXCEPCIÓN: FORZAR FICHA (RESPALDO ORIGINAL)
     # =======================================================
-    if propiedad and "ficha" in original_message.lower():
+    if _fuerza_ficha(turno):
          ficha_completa = formatear_ficha_tecnica(propiedad)
          respuesta = f"Aquí tienes el resumen técnico completo:\n\n{ficha_completa}"
 
@@ -343,39 +501,42 @@ def process_user_message(phone: str, message: str) -> str:
     # 8. POST-PROCESO DE EMAIL (RESPALDO ORIGINAL)
     # =======================================================
     # Esto es redundante con la extracción proactiva, pero lo dejamos como seguro
-    if not prospecto_actual.get("email"):
-        email_detectado = extraer_email(original_message)
+    if not contexto.prospecto.get("email"):
+        email_detectado = (turno.entidades or entity_extractor.extraer(original_message)).email
         if email_detectado:
-             actualizar_prospecto(phone, {"email": email_detectado.lower()})
+             contexto.actualizar_prospecto({"email": email_detectado})
 
     # =======================================================
     # 9. ENVÍO DE ALERTAS Y METADATA (LÓGICA MEJORADA ANTI-DUPLICADOS)
     # =======================================================
     metadata_tipo = {"tipo": "respuesta_general", "intencion": intencion}
-    prospecto_actual = obtener_prospecto(phone) or {} # Recargamos prospecto para lead score
+    prospecto_actual = contexto.prospecto # Ya incluye los cambios del turno (sin releer Mongo)
     lead_score = calcular_lead_score(intencion, prospecto_actual)
 
     # CORRECCIÓN DE TIEMPOS: 60 minutos para evitar spam de correo
     if intencion == "escalado_urgente":
-        send_alert_once(phone=phone, lead_type="EscaladoUrgente", lead_score=lead_score,
+        _alerta_trazada(phone=phone, lead_type="EscaladoUrgente", lead_score=lead_score,
                         criteria=prospecto_actual, last_response=respuesta, last_user_msg=original_message,
-                        full_history=historial, window_minutes=3, lead_type_label="ESCALADO URGENTE")
+                        full_history=historial, window_minutes=3, lead_type_label="ESCALADO URGENTE",
+                        contexto=contexto)
         metadata_tipo = {"tipo": "escalado_urgente", "intencion": intencion}
 
     elif intencion == "agendar_visita":
-        send_alert_once(phone=phone, lead_type="InteresVisita", lead_score=lead_score,
+        _alerta_trazada(phone=phone, lead_type="InteresVisita", lead_score=lead_score,
                         criteria=prospecto_actual, last_response=respuesta, last_user_msg=original_message,
-                        full_history=historial, window_minutes=3, lead_type_label="Interés de Visita") # AJUSTADO A 60 MIN
+                        full_history=historial, window_minutes=3, lead_type_label="Interés de Visita", # AJUSTADO A 60 MIN
+                        contexto=contexto)
         metadata_tipo = {"tipo": "gestion_visita", "intencion": intencion}
 
     elif intencion == "contacto_directo":
-        send_alert_once(phone=phone, lead_type="SolicitudContacto", lead_score=lead_score,
+        _alerta_trazada(phone=phone, lead_type="SolicitudContacto", lead_score=lead_score,
                         criteria=prospecto_actual, last_response=respuesta, last_user_msg=original_message,
-                        full_history=historial, window_minutes=3, lead_type_label="Solicitud de Contacto") # AJUSTADO A 60 MIN
+                        full_history=historial, window_minutes=3, lead_type_label="Solicitud de Contacto", # AJUSTADO A 60 MIN
+                        contexto=contexto)
         metadata_tipo = {"tipo": "contacto_directo", "intencion": intencion}
 
     # =======================================================
     # 10. GUARDAR Y RETORNAR (COMPLETO)
     # =======================================================
-    guardar_mensaje(phone, "assistant", respuesta, metadata_tipo)
+    contexto.agregar_mensaje("assistant", respuesta, metadata_tipo)
     return respuesta
\ No newline at end of file
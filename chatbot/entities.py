@@ -0,0 +1,154 @@
+# chatbot/entities.py → EXTRACCIÓN DE ENTIDADES EN UN SOLO BARRIDO
+"""
+Antes cada turno recorría el mensaje una vez por dato: extraer_rut,
+extraer_email, extraer_nombre_explicito, las URLs del link_extractor (y
+dentro de cada una MLC / Yapo) y el r"\\b(\\d{4,6})\\b" de core.py.
+iniciar_chat.extraer_codigo_referencia repetía la misma lógica de portales.
+
+EntityExtractor compila todo en una sola alternancia y la recorre una vez:
+
+    url     → https://...  (dentro: código MLC / Yapo, o código Procasa si no hay)
+    email   → juan@correo.cl
+    rut     → 12.345.678-5 (solo si el DV es válido)
+    codigo  → 4 a 6 dígitos sueltos (código Procasa)
+    nombre  → "me llamo ...", "mi nombre es ...", "soy ..." (en ese orden de prioridad)
+
+El orden de la alternancia resuelve los solapes: un código dentro de un email
+o de una URL de portal no se confunde con un código Procasa.
+Micro-benchmark: python -m benchmarks.bench_entity_extractor
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional, Tuple
+
+from .utils import DISPARADORES_NOMBRE, PATRON_NOMBRE, RE_EMAIL, RE_RUT, formatear_rut, limpiar_nombre
+
+RE_URL = re.compile(r"https?://[^\s]+", re.IGNORECASE)
+RE_CODIGO_PROCASA = re.compile(r"\b(\d{4,6})\b")
+RE_MLC = re.compile(r"MLC[-_]?(\d+)")
+RE_YAPO = re.compile(r"/(\d{8,12})$")
+
+
+class CodigoPortal(NamedTuple):
+    plataforma: str  # "Yapo", "MercadoLibre", "PortalInmobiliario", "Otro Portal (MLC code)"
+    codigo: str      # "28546597" o "MLC1234567890"
+    url: str
+
+
+@dataclass
+class Entidades:
+    texto: str
+    ruts: List[str] = field(default_factory=list)
+    emails: List[str] = field(default_factory=list)
+    nombre: Optional[str] = None
+    urls: List[str] = field(default_factory=list)
+    codigos_portal: List[CodigoPortal] = field(default_factory=list)
+    codigos_procasa: List[str] = field(default_factory=list)
+    # Tramos (inicio, fin) de RUT, email y "me llamo X": lo que sobra se revisa en la ruta rápida
+    tramos_personales: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def rut(self) -> Optional[str]:
+        return self.ruts[0] if self.ruts else None
+
+    @property
+    def email(self) -> Optional[str]:
+        return self.emails[0] if self.emails else None
+
+    @property
+    def codigo_procasa(self) -> Optional[str]:
+        return self.codigos_procasa[0] if self.codigos_procasa else None
+
+    def sin_datos_personales(self) -> str:
+        """El texto sin RUT, email ni "me llamo ..." (ej: 'mi rut es 12.345.678-5' → 'mi rut es  ')."""
+        partes, cursor = [], 0
+        for inicio, fin in self.tramos_personales:
+            partes.append(self.texto[cursor:inicio])
+            cursor = fin
+        partes.append(self.texto[cursor:])
+        return " ".join(partes)
+
+
+def codigo_portal(url: str) -> Optional[CodigoPortal]:
+    """Código externo de una URL de Yapo / MercadoLibre / Portal Inmobiliario (None si no trae)."""
+    url = url.split("?")[0].split("#")[0].rstrip("/")
+    url_lower = url.lower()
+
+    # === YAPO.CL (primero): si no tiene código no se prueba MLC ===
+    if "yapo.cl" in url_lower:
+        match = RE_YAPO.search(url)
+        return CodigoPortal("Yapo", match.group(1), url) if match else None
+
+    # === MERCADO LIBRE / PORTAL INMOBILIARIO ===
+    match = RE_MLC.search(url.upper().replace("_", "-"))
+    if not match:
+        return None
+    if "portalinmobiliario.com" in url_lower:
+        plataforma = "PortalInmobiliario"
+    elif "mercadolibre.cl" in url_lower or "mercadolibre.com" in url_lower:
+        plataforma = "MercadoLibre"
+    else:
+        plataforma = "Otro Portal (MLC code)"
+    return CodigoPortal(plataforma, f"MLC{match.group(1)}", url)
+
+
+class EntityExtractor:
+    def __init__(self):
+        alternativas = [
+            rf"(?P<url>{RE_URL.pattern})",
+            rf"(?P<email>{RE_EMAIL.pattern})",
+            rf"(?P<rut>{RE_RUT.pattern})",
+            rf"(?P<codigo>{RE_CODIGO_PROCASA.pattern})",
+        ]
+        alternativas += [rf"{d}\s+(?P<nombre{i}>{PATRON_NOMBRE})" for i, d in enumerate(DISPARADORES_NOMBRE)]
+        self.patron = re.compile("|".join(alternativas), re.IGNORECASE)
+
+    def extraer(self, texto: str) -> Entidades:
+        texto = texto or ""
+        ent = Entidades(texto)
+        nombres = {}  # prioridad → nombre (gana "me llamo" sobre "soy" aunque venga después)
+
+        for m in self.patron.finditer(texto):
+            tipo = m.lastgroup
+            valor = m.group(tipo)
+            if tipo == "url":
+                ent.urls.append(valor)
+                portal = codigo_portal(valor)
+                if portal:
+                    ent.codigos_portal.append(portal)
+                else:
+                    # Link propio o de otro sitio: un código Procasa puede venir en la ruta
+                    ent.codigos_procasa.extend(RE_CODIGO_PROCASA.findall(valor))
+            elif tipo == "email":
+                ent.emails.append(valor.lower())
+                ent.tramos_personales.append(m.span())
+            elif tipo == "rut":
+                rut = formatear_rut(valor)
+                if rut:
+                    ent.ruts.append(rut)
+                    ent.tramos_personales.append(m.span())
+            elif tipo == "codigo":
+                ent.codigos_procasa.append(valor)
+            else:
+                nombre = limpiar_nombre(valor)
+                prioridad = int(tipo[len("nombre"):])
+                if nombre and prioridad not in nombres:
+                    nombres[prioridad] = nombre
+                    ent.tramos_personales.append(m.span())
+
+        if nombres:
+            ent.nombre = nombres[min(nombres)]
+        return ent
+
+    def codigo_de_link(self, link: str) -> Optional[str]:
+        """Código de referencia de un link suelto (MLC, Yapo o código Procasa en la ruta)."""
+        if not link:
+            return None
+        portal = codigo_portal(link)
+        if portal:
+            return portal.codigo
+        match = RE_CODIGO_PROCASA.search(link)
+        return match.group(1) if match else None
+
+
+entity_extractor = EntityExtractor()
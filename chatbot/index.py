@@ -0,0 +1,181 @@
+# chatbot/index.py → ÍNDICE DE EMBEDDINGS OFFLINE (universo_obelix)
+"""
+Construye en disco los embeddings que usa semantic_index, para no recalcularlos
+en cada arranque ni en cada worker de gunicorn.
+
+Archivos en Config.SEMANTIC_INDEX_DIR:
+    ACTUAL              nombre de la versión vigente (puntero)
+    v<fecha>/embeddings.npy  matriz float16 (N x EMBEDDING_DIM), se abre con mmap
+    v<fecha>/meta.json       modelo, dimensión, filas y codigo → {fila, hash del texto}
+
+Uso:
+    python -m chatbot.index build    # recodifica todo el catálogo
+    python -m chatbot.index update   # solo propiedades nuevas o con texto cambiado
+
+Cada build escribe una versión nueva completa y recién entonces cambia ACTUAL
+con un solo os.replace: un lector siempre abre matriz y meta de la misma
+versión. Los procesos que ya tienen el índice abierto siguen leyendo la
+versión anterior hasta su próximo refresco; se conservan VERSIONES_GUARDADAS.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import database
+from config import Config
+from .semantic_index import PROJECTION, codificar, get_model, texto_para_embedding
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_EMB = "embeddings.npy"
+ARCHIVO_META = "meta.json"
+ARCHIVO_ACTUAL = "ACTUAL"
+VERSIONES_GUARDADAS = 3
+BATCH = 128
+
+
+def _ruta(*partes: str) -> str:
+    return os.path.join(Config.SEMANTIC_INDEX_DIR, *partes)
+
+
+def version_actual() -> Optional[str]:
+    """Versión publicada en ACTUAL (None si no hay índice en disco)."""
+    try:
+        with open(_ruta(ARCHIVO_ACTUAL), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def hash_texto(texto: str) -> str:
+    return hashlib.sha1(f"{Config.EMBEDDING_MODEL}|{texto}".encode("utf-8")).hexdigest()
+
+
+def cargar(mmap: bool = True) -> Optional[Tuple[Dict[str, int], np.ndarray, str]]:
+    """
+    Abre el índice en disco. Retorna (codigo → fila, matriz, versión) o None si no existe
+    o fue generado con otro modelo. Con mmap=True la matriz queda mapeada (solo
+    lectura): todos los workers comparten las mismas páginas del page cache.
+    """
+    abierto = _abrir(mmap)
+    if not abierto:
+        return None
+    meta, matriz = abierto
+    filas = {codigo: info["fila"] for codigo, info in meta["propiedades"].items()}
+    return filas, matriz, meta["version"]
+
+
+def _abrir(mmap: bool) -> Optional[Tuple[dict, np.ndarray]]:
+    """(meta, matriz) de la versión a la que apunta ACTUAL, verificando que correspondan."""
+    version = version_actual()
+    if not version:
+        return None
+    try:
+        with open(_ruta(version, ARCHIVO_META), encoding="utf-8") as f:
+            meta = json.load(f)
+        matriz = np.load(_ruta(version, ARCHIVO_EMB), mmap_mode="r" if mmap else None)
+    except FileNotFoundError:
+        logger.warning(f"[INDEX] Versión {version} incompleta o ya borrada, se ignora")
+        return None
+    if meta.get("modelo") != Config.EMBEDDING_MODEL or meta.get("dim") != Config.EMBEDDING_DIM:
+        logger.warning("[INDEX] Índice en disco generado con otro modelo, se ignora")
+        return None
+    if matriz.shape != (meta.get("filas"), Config.EMBEDDING_DIM):
+        logger.warning(f"[INDEX] Versión {version}: la matriz {matriz.shape} no corresponde al meta, se ignora")
+        return None
+    meta["version"] = version
+    return meta, matriz
+
+
+def _limpiar_versiones(vigente: str):
+    """Borra versiones viejas; las últimas quedan para lectores que aún no refrescan."""
+    versiones = sorted(v for v in os.listdir(Config.SEMANTIC_INDEX_DIR)
+                       if v.startswith("v") and os.path.isdir(_ruta(v)) and v != vigente)
+    for v in versiones[:-(VERSIONES_GUARDADAS - 1) or None]:
+        shutil.rmtree(_ruta(v), ignore_errors=True)
+
+
+def construir(incremental: bool = False) -> dict:
+    """Genera el índice. incremental=True reutiliza los vectores cuyo hash no cambió."""
+    if get_model() is None:
+        raise RuntimeError("sentence-transformers no está instalado")
+    inicio = time.perf_counter()
+    os.makedirs(Config.SEMANTIC_INDEX_DIR, exist_ok=True)
+
+    docs = list(database.propiedades().find({"codigo": {"$nin": [None, ""]}}, PROJECTION))
+    textos = {}
+    for d in docs:
+        textos.setdefault(str(d["codigo"]), texto_para_embedding(d))
+    codigos = sorted(textos)
+
+    anterior_meta, anterior_emb = {}, None
+    if incremental:
+        previo = _abrir(mmap=True)
+        if previo:
+            anterior_meta, anterior_emb = previo[0]["propiedades"], previo[1]
+
+    version = f"{time.strftime('v%Y%m%dT%H%M%S')}-{os.getpid()}"
+    os.makedirs(_ruta(version), exist_ok=True)
+    matriz = np.lib.format.open_memmap(_ruta(version, ARCHIVO_EMB), mode="w+", dtype=np.float16,
+                                       shape=(len(codigos), Config.EMBEDDING_DIM))
+    meta_props = {}
+    pendientes = []  # (fila, codigo) a recodificar
+    reutilizados = 0
+    for fila, codigo in enumerate(codigos):
+        h = hash_texto(textos[codigo])
+        meta_props[codigo] = {"fila": fila, "hash": h}
+        previo = anterior_meta.get(codigo)
+        if anterior_emb is not None and previo and previo["hash"] == h:
+            matriz[fila] = anterior_emb[previo["fila"]]
+            reutilizados += 1
+        else:
+            pendientes.append((fila, codigo))
+
+    for i in range(0, len(pendientes), BATCH):
+        lote = pendientes[i:i + BATCH]
+        emb = codificar([textos[c] for _, c in lote], batch_size=BATCH)
+        matriz[[f for f, _ in lote]] = emb.astype(np.float16)
+        print(f"   🧮 Codificadas {min(i + BATCH, len(pendientes))}/{len(pendientes)}")
+
+    matriz.flush()
+    del matriz, anterior_emb
+
+    meta = {
+        "modelo": Config.EMBEDDING_MODEL,
+        "dim": Config.EMBEDDING_DIM,
+        "generado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "filas": len(codigos),
+        "propiedades": meta_props
+    }
+    with open(_ruta(version, ARCHIVO_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # La versión queda completa antes de publicarla: un solo os.replace cambia matriz y meta juntos
+    tmp_actual = _ruta(ARCHIVO_ACTUAL + ".tmp")
+    with open(tmp_actual, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_actual, _ruta(ARCHIVO_ACTUAL))
+    _limpiar_versiones(version)
+
+    resumen = {
+        "propiedades": len(codigos),
+        "codificadas": len(pendientes),
+        "reutilizadas": reutilizados,
+        "segundos": round(time.perf_counter() - inicio, 1)
+    }
+    logger.info(f"[INDEX] Índice {version} publicado en {Config.SEMANTIC_INDEX_DIR}: {resumen}")
+    return resumen
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Índice de embeddings de universo_obelix")
+    parser.add_argument("accion", choices=["build", "update"])
+    args = parser.parse_args()
+    print(f"📦 {construir(incremental=args.accion == 'update')}")
@@ -0,0 +1,164 @@
+# chatbot/intent_router.py → RUTA RÁPIDA SIN LLM PARA TURNOS TRIVIALES
+"""
+Responde con plantillas los turnos que no necesitan a Grok:
+
+- cierre:  "gracias", "ok gracias", "chao"... (solo si el bot no dejó una pregunta
+           abierta). Un "ok", "dale" o "ya" solo puede ser un sí a lo que ofreció
+           el bot ("te envío la ficha"), así que esos van siempre a Grok
+- datos:   el mensaje es solo un RUT, un email y/o "me llamo ..." → se registran
+           y se pide lo que falta para la orden de visita
+- ficha:   "mándame la ficha" con una propiedad activa
+
+Todo lo demás escala a Grok. Cada resultado tiene el mismo formato que
+generar_respuesta_estructurada, así _cerrar_turno lo procesa igual.
+"""
+import logging
+import re
+import threading
+from typing import Dict, List, Optional
+
+from .entities import Entidades, entity_extractor
+from .utils import plegar
+
+logger = logging.getLogger(__name__)
+
+# Solo despedidas inequívocas: los afirmativos sueltos ("ok", "dale", "perfecto") escalan a Grok
+CIERRES = {
+    "gracias", "muchas gracias", "mil gracias", "ok gracias", "gracias ok", "listo gracias",
+    "perfecto gracias", "ya gracias", "gracias chao", "chao", "chau", "adios", "chao gracias", "🙏",
+}
+
+# Palabras que pueden acompañar a un dato sin cambiar el sentido del mensaje
+RELLENO = {
+    "mi", "mis", "es", "son", "el", "la", "y", "rut", "correo", "email", "mail", "e", "nombre",
+    "datos", "aqui", "aca", "van", "te", "dejo", "envio", "mando", "seria", "ok", "gracias",
+    "hola", "listo", "de", "electronico",
+}
+
+CAMPOS_VISITA = (("nombre", "tu nombre"), ("rut", "tu RUT"), ("email", "tu correo"))
+
+
+def _palabras(texto: str) -> List[str]:
+    return re.sub(r"[^\w@.\-👍🙏👌 ]+", " ", plegar(texto)).split()
+
+
+def _resultado(regla: str, respuesta: str, intencion: str = "consulta_general", datos: Optional[dict] = None) -> dict:
+    return {
+        "intencion": intencion,
+        "respuesta_bot": respuesta,
+        "datos_extraidos": datos or {},
+        "bi_analytics": {"fast_path": regla},
+    }
+
+
+def _ultima_respuesta_bot(historial: List[Dict]) -> Optional[Dict]:
+    for m in reversed(historial):
+        if m.get("role") == "assistant":
+            return m
+    return None
+
+
+def _es_cierre(mensaje: str) -> bool:
+    texto = " ".join(_palabras(mensaje)).strip(" .!")
+    return texto in CIERRES
+
+
+def _datos_sueltos(mensaje: str, entidades: Entidades) -> Optional[dict]:
+    """Si el mensaje es solo datos personales retorna {campo: valor}; si trae algo más, None."""
+    datos = {}
+    if entidades.rut:
+        datos["rut"] = entidades.rut
+    if entidades.email:
+        datos["email"] = entidades.email
+    # "soy Juan" solo cuenta si viene junto a otro dato; "me llamo / mi nombre es" siempre
+    if entidades.nombre and (datos or re.match(r"\s*(me llamo|mi nombre es)\s+", mensaje, re.IGNORECASE)):
+        datos["nombre"] = entidades.nombre
+    if not datos:
+        return None
+    sobrante = [p for p in _palabras(entidades.sin_datos_personales()) if p.strip(".-") and p not in RELLENO]
+    return datos if not sobrante else None
+
+
+def _respuesta_datos(datos: dict, prospecto: dict, hubo_interes_visita: bool) -> tuple:
+    registrados = [etiqueta for campo, etiqueta in CAMPOS_VISITA if campo in datos]
+    completo = {**{k: v for k, v in prospecto.items() if v}, **datos}
+    faltan = [etiqueta for campo, etiqueta in CAMPOS_VISITA if not completo.get(campo)]
+
+    nombre = (completo.get("nombre") or "").split(" ")[0]
+    saludo = f"¡Gracias, {nombre}!" if nombre else "¡Gracias!"
+    texto = f"{saludo} Registré {' y '.join(registrados)}."
+    if faltan:
+        return f"{texto} Para coordinar la visita me faltaría {' y '.join(faltan)}. ¿Me lo compartes?", "consulta_general"
+    texto += " Con esto ya tengo todos tus datos. Un ejecutivo te escribirá por aquí para confirmar el día y horario de la visita."
+    # Con los datos completos y una visita pedida antes, se mantiene la alerta al ejecutivo
+    return texto, "agendar_visita" if hubo_interes_visita else "consulta_general"
+
+
+def resolver(mensaje: str, historial: List[Dict], prospecto: dict, ficha: Optional[str] = None,
+             propiedad_nueva: bool = False, entidades: Optional[Entidades] = None) -> Optional[dict]:
+    """
+    Retorna la respuesta estructurada si el turno se puede resolver sin LLM, o None para escalar.
+    propiedad_nueva: el mensaje trajo un link/código → siempre va a Grok para presentarla.
+    entidades: barrido del mensaje ya hecho en core (si no viene, se extrae aquí).
+    """
+    if propiedad_nueva or not mensaje or len(mensaje) > 200:
+        return None
+    ultima = _ultima_respuesta_bot(historial)
+    if ultima is None:
+        return None  # Primer contacto: el saludo lo arma Grok
+
+    palabras = _palabras(mensaje)
+    if ficha and "ficha" in palabras and len(palabras) <= 6:
+        return _resultado("ficha", f"Aquí tienes el resumen técnico completo:\n\n{ficha}")
+
+    datos = _datos_sueltos(mensaje, entidades or entity_extractor.extraer(mensaje))
+    if datos:
+        hubo_visita = any(m.get("intencion") == "agendar_visita" for m in historial if m.get("role") == "assistant")
+        texto, intencion = _respuesta_datos(datos, prospecto or {}, hubo_visita)
+        return _resultado("datos", texto, intencion, datos)
+
+    if _es_cierre(mensaje) and not str(ultima.get("content", "")).rstrip().endswith("?"):
+        nombre = ((prospecto or {}).get("nombre") or "").split(" ")[0]
+        texto = f"¡Gracias a ti{', ' + nombre if nombre else ''}! Quedo atenta por si necesitas algo más. 😊"
+        return _resultado("cierre", texto)
+
+    return None
+
+
+# ==========================================
+# MÉTRICAS
+# ==========================================
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.evaluados = 0
+        self.por_regla: Dict[str, int] = {}
+        self.llm_llamadas = 0
+        self.llm_segundos = 0.0
+
+    def registrar(self, regla: Optional[str]):
+        with self._lock:
+            self.evaluados += 1
+            if regla:
+                self.por_regla[regla] = self.por_regla.get(regla, 0) + 1
+
+    def registrar_llm(self, segundos: float):
+        with self._lock:
+            self.llm_llamadas += 1
+            self.llm_segundos += segundos
+
+    def resumen(self) -> dict:
+        with self._lock:
+            hits = sum(self.por_regla.values())
+            promedio_llm = self.llm_segundos / self.llm_llamadas if self.llm_llamadas else 0.0
+            return {
+                "evaluados": self.evaluados,
+                "hits": hits,
+                "hit_rate": round(hits / self.evaluados, 3) if self.evaluados else 0.0,
+                "por_regla": dict(self.por_regla),
+                "latencia_llm_promedio_s": round(promedio_llm, 3),
+                "segundos_ahorrados_estimados": round(hits * promedio_llm, 1),
+            }
+
+
+router_stats = _Stats()
@@ -1,106 +1,117 @@
 # chatbot/link_extractor.py → VERSIÓN CORREGIDA CON YAPO + FIX url_lower
-import re
+"""
+Resuelve el link de portal del mensaje (Yapo / MercadoLibre / Portal
+Inmobiliario) a la propiedad de universo_obelix.
+
+Cuando el cliente pega un aviso que no tenemos, el código queda en un cache
+negativo (LINK_MISS_TTL_SECONDS, se vacía al recargar el catálogo) y se
+cuenta en link_resolver.stats() en vez de imprimirse: /metrics/links muestra
+qué avisos piden los clientes y faltan en el catálogo.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 from typing import Tuple, Optional
-from .storage import get_db
-from config import Config
-
-def extraer_codigo_mercadolibre(url: str) -> Optional[str]:
-    url = url.upper().replace("_", "-")
-    match = re.search(r"MLC[-_]?(\d+)", url)
-    if match:
-        codigo = f"MLC{match.group(1)}"
-        print(f"[EXTRACCIÓN] Código MLC detectado → Código extraído: {codigo}")
-        return codigo
-    return None
 
-def extraer_codigo_yapo(url: str) -> Optional[str]:
-    """
-    Extrae el código numérico al final de una URL de Yapo.cl
-    Ejemplo: .../28546597 → "28546597"
-    """
-    match = re.search(r"/(\d{8,12})$", url)
-    if match:
-        codigo = match.group(1)
-        print(f"[EXTRACCIÓN] Código Yapo detectado → Código extraído: {codigo}")
-        return codigo
-    return None
-
-def analizar_mensaje_para_link(mensaje: str) -> Tuple[bool, Optional[dict], str, Optional[str]]:
+from config import Config
+from .catalog import property_catalog
+from .entities import CodigoPortal, Entidades, entity_extractor
+
+logger = logging.getLogger(__name__)
+
+
+class LinkResolver:
+    def __init__(self, ttl_segundos: float, max_sin_resolver: int):
+        self.ttl = ttl_segundos
+        self.max_sin_resolver = max_sin_resolver
+        self._lock = threading.Lock()
+        self._negativos = {}  # (plataforma, codigo) → expira (monotonic)
+        self._generacion = None  # Catálogo con el que se armó el cache negativo
+        self._sin_resolver: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.resueltos = 0
+        self.no_resueltos = 0
+        self.cache_negativo_hits = 0
+
+    def _buscar(self, portal: CodigoPortal) -> Optional[dict]:
+        if portal.plataforma == "Yapo":
+            return property_catalog.buscar_codigo_yapo(portal.codigo)
+        return property_catalog.buscar_codigo_mercadolibre(portal.codigo)
+
+    def resolver(self, portal: CodigoPortal) -> Optional[dict]:
+        clave = (portal.plataforma, portal.codigo)
+        generacion = property_catalog.generacion
+        with self._lock:
+            if generacion != self._generacion:
+                # Catálogo nuevo: un aviso que faltaba puede haber llegado
+                self._negativos.clear()
+                self._generacion = generacion
+            negativo = self._negativos.get(clave, 0) > time.monotonic()
+
+        propiedad = None if negativo else self._buscar(portal)
+        with self._lock:
+            if propiedad:
+                self.resueltos += 1
+                return propiedad
+            if negativo:
+                self.cache_negativo_hits += 1
+            else:
+                self._negativos[clave] = time.monotonic() + self.ttl
+            self._registrar_fallo(clave, portal)
+        return None
+
+    def _registrar_fallo(self, clave: tuple, portal: CodigoPortal):
+        self.no_resueltos += 1
+        ahora = datetime.utcnow().isoformat()
+        entrada = self._sin_resolver.pop(clave, None) or {
+            "plataforma": portal.plataforma, "codigo": portal.codigo, "url": portal.url,
+            "veces": 0, "primera_vez": ahora,
+        }
+        entrada["veces"] += 1
+        entrada["ultima_vez"] = ahora
+        self._sin_resolver[clave] = entrada  # Al final = más reciente
+        while len(self._sin_resolver) > self.max_sin_resolver:
+            self._sin_resolver.popitem(last=False)
+
+    def stats(self, top: int = 50) -> dict:
+        with self._lock:
+            sin_resolver = sorted(self._sin_resolver.values(), key=lambda e: e["veces"], reverse=True)
+            por_plataforma = {}
+            for e in sin_resolver:
+                por_plataforma[e["plataforma"]] = por_plataforma.get(e["plataforma"], 0) + e["veces"]
+            return {
+                "resueltos": self.resueltos,
+                "no_resueltos": self.no_resueltos,
+                "cache_negativo_hits": self.cache_negativo_hits,
+                "cache_negativo_entradas": len(self._negativos),
+                "no_resueltos_por_plataforma": por_plataforma,
+                "codigos_sin_resolver": [dict(e) for e in sin_resolver[:top]],
+            }
+
+
+link_resolver = LinkResolver(Config.LINK_MISS_TTL_SECONDS, Config.LINK_MISS_MAX)
+
+
+def analizar_mensaje_para_link(mensaje: str, entidades: Optional[Entidades] = None) -> Tuple[bool, Optional[dict], str, Optional[str]]:
     """
     Retorna: (encontrado_link, propiedad_encontrada, plataforma_origen, codigo_externo)
     plataforma_origen: ej. "Yapo", "MercadoLibre", "PortalInmobiliario"
     codigo_externo: ej. "28546597" o "MLC1234567890"
+    entidades: resultado de entity_extractor.extraer si el llamador ya lo tiene (evita re-escanear)
     """
-    urls = re.findall(r'https?://[^\s]+', mensaje, re.IGNORECASE)
-    
-    for url in urls:
-        url = url.split("?")[0].split("#")[0].rstrip("/")
-        url_lower = url.lower()  # ← DEFINIDO AQUÍ PARA TODO EL LOOP
-
-        # === YAPO.CL (primero) ===
-        if "yapo.cl" in url_lower:
-            plataforma_origen = "Yapo"
-            codigo_yapo = extraer_codigo_yapo(url)
-
-            if codigo_yapo:
-                print(f"\n[INFO] BUSCANDO EN universo_obelix")
-                print(f"[INFO] Campo usado → codigo_yapo")
-                print(f"[INFO] Valor buscado → '{codigo_yapo}'")
-
-                db = get_db()
-                coleccion = db[Config.COLLECTION_NAME]
-
-                propiedad = coleccion.find_one({"codigo_yapo": codigo_yapo})
-
-                if propiedad:
-                    print(f"[ÉXITO] ¡PROPIEDAD ENCONTRADA en Yapo! Código Procasa: {propiedad.get('codigo')}")
-                    return True, propiedad, plataforma_origen, codigo_yapo
-                else:
-                    print(f"[FALLO] NO se encontró propiedad con codigo_yapo = '{codigo_yapo}'")
-                    # Debug rápido
-                    cursor = coleccion.find({"codigo_yapo": {"$exists": True}}).limit(3)
-                    print(f"[DEBUG] Algunos codigo_yapo existentes: {[doc.get('codigo_yapo') for doc in cursor]}")
-
-                    return True, None, plataforma_origen, codigo_yapo
-            else:
-                # Es yapo.cl pero no tiene código válido → continuar con otros checks
-                continue
-
-        # === MERCADO LIBRE / PORTAL INMOBILIARIO ===
-        codigo_ml = extraer_codigo_mercadolibre(url)
-
-        if codigo_ml:
-            # Determinación de plataforma (ya no redefine url_lower)
-            if "portalinmobiliario.com" in url_lower:
-                plataforma_origen = "PortalInmobiliario"
-            elif "mercadolibre.cl" in url_lower or "mercadolibre.com" in url_lower:
-                plataforma_origen = "MercadoLibre"
-            else:
-                plataforma_origen = "Otro Portal (MLC code)"
-            
-            print(f"\n[INFO] BUSCANDO EN universo_obelix")
-            print(f"[INFO] Campo usado → codigo_mercadolibre")
-            print(f"[INFO] Valor buscado → '{codigo_ml}'")
-
-            db = get_db()
-            coleccion = db[Config.COLLECTION_NAME]
-
-            propiedad = coleccion.find_one({"codigo_mercadolibre": codigo_ml})
-
-            if propiedad:
-                print(f"[ÉXITO] ¡PROPIEDAD ENCONTRADA! Desde: {plataforma_origen}")
-                print(f"[ÉXITO] Código Procasa: {propiedad.get('codigo')}")
-                print(f"[ÉXITO] Comuna: {propiedad.get('comuna')}")
-                return True, propiedad, plataforma_origen, codigo_ml
-            else:
-                print(f"[FALLO] NO se encontró con codigo_mercadolibre = '{codigo_ml}'")
-                cursor = coleccion.find({"codigo_mercadolibre": {"$exists": True}}).limit(5)
-                print(f"[DEBUG] Últimos 5 codigo_mercadolibre guardados:")
-                for doc in cursor:
-                    valor = doc.get("codigo_mercadolibre")
-                    print(f"   → '{valor}' (tipo: {type(valor)})")
-
-                return True, None, plataforma_origen, codigo_ml
-
-    # Ningún enlace reconocido
-    return False, None, "", None
\ No newline at end of file
+    if entidades is None:
+        entidades = entity_extractor.extraer(mensaje)
+
+    # El primer link con código de portal manda (Yapo sin código se salta, como antes)
+    if not entidades.codigos_portal:
+        # Ningún enlace reconocido
+        return False, None, "", None
+
+    portal = entidades.codigos_portal[0]
+    propiedad = link_resolver.resolver(portal)
+    if propiedad:
+        logger.info(f"[LINK] {portal.plataforma} {portal.codigo} → Código Procasa {propiedad.get('codigo')}")
+    else:
+        logger.debug(f"[LINK] {portal.plataforma} {portal.codigo} no está en universo_obelix")
+    return True, propiedad, portal.plataforma, portal.codigo
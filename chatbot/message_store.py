@@ -0,0 +1,113 @@
+# chatbot/message_store.py → HISTORIAL COMPLETO EN lead_messages (BUCKETS)
+"""
+El historial va a lead_messages, append-only, en documentos de hasta
+LEAD_MESSAGES_BUCKET mensajes; el turno del chatbot lee de aquí su contexto
+(ultimos) y leads.messages queda como una cola corta (ver storage.MAX_MENSAJES)
+para la fila del CRM y como respaldo de leads sin migrar:
+
+    {phone_key, seq, count, messages: [...], primer_ts, ultimo_ts}
+
+Índice único (phone_key, seq): el bucket abierto es el de mayor seq con
+count < LEAD_MESSAGES_BUCKET (los que deja la migración van cerrados). Un lote de mensajes nunca se reparte entre
+buckets, así que uno puede pasarse un poco del tamaño.
+
+La migración (migrar_lead_messages.py) carga los mensajes anteriores con seq
+negativos, sin pisar los buckets que ya se escribieron después del deploy.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+import database
+from config import Config
+from .utils import normalizar_phone_key
+
+logger = logging.getLogger(__name__)
+
+REINTENTOS_BUCKET = 3
+
+
+def mensajes_anteriores(embebidos: List[Dict], desde_ts) -> List[Dict]:
+    """Mensajes de leads.messages previos al primer bucket (lo que falta migrar)."""
+    if desde_ts is None:
+        return list(embebidos)
+    return [m for m in embebidos if str(m.get("timestamp", "")) < str(desde_ts)]
+
+
+class MessageStore:
+    def __init__(self, tamano_bucket: int):
+        self.tamano_bucket = tamano_bucket
+
+    def _col(self):
+        return database.lead_messages()
+
+    def agregar(self, phone: str, mensajes: List[Dict]):
+        """Agrega mensajes al bucket abierto del teléfono (o abre uno nuevo)."""
+        phone_key = normalizar_phone_key(phone)
+        if not phone_key or not mensajes:
+            return
+        col = self._col()
+        cambios = {
+            "$push": {"messages": {"$each": mensajes}},
+            "$inc": {"count": len(mensajes)},
+            "$set": {"ultimo_ts": mensajes[-1].get("timestamp"), "updated_at": datetime.utcnow()},
+        }
+        for _ in range(REINTENTOS_BUCKET):
+            abierto = col.find_one_and_update(
+                {"phone_key": phone_key, "count": {"$lt": self.tamano_bucket}, "cerrado": {"$ne": True}},
+                cambios, sort=[("seq", DESCENDING)], projection={"_id": 1}
+            )
+            if abierto:
+                return
+            ultimo = col.find_one({"phone_key": phone_key}, {"seq": 1}, sort=[("seq", DESCENDING)])
+            try:
+                col.insert_one({
+                    "phone_key": phone_key,
+                    "seq": (ultimo["seq"] + 1) if ultimo else 0,
+                    "count": len(mensajes),
+                    "messages": list(mensajes),
+                    "primer_ts": mensajes[0].get("timestamp"),
+                    "ultimo_ts": mensajes[-1].get("timestamp"),
+                    "updated_at": datetime.utcnow(),
+                })
+                return
+            except DuplicateKeyError:
+                continue  # Otro proceso abrió el bucket en paralelo: se reintenta sobre ese
+        logger.error(f"[LEAD_MESSAGES] No se pudo guardar {len(mensajes)} mensajes de {phone_key}")
+
+    def ultimos(self, phone: str, n: int, embebidos: List[Dict] = None) -> List[Dict]:
+        """
+        Los últimos n mensajes en orden cronológico.
+        embebidos: leads.messages del lead; si los buckets no alcanzan (lead sin migrar) completan lo anterior.
+        """
+        if not n:
+            return []
+        buckets = self._col().find(
+            {"phone_key": normalizar_phone_key(phone)}, {"_id": 0, "messages": 1}
+        ).sort("seq", DESCENDING)
+        mensajes: List[Dict] = []
+        for bucket in buckets:
+            mensajes = (bucket.get("messages") or []) + mensajes
+            if len(mensajes) >= n:
+                return mensajes[-n:]
+        if embebidos:
+            mensajes = mensajes_anteriores(embebidos, mensajes[0].get("timestamp") if mensajes else None) + mensajes
+        return mensajes[-n:]
+
+    def historial(self, phone: str, embebidos: List[Dict] = None) -> List[Dict]:
+        """
+        Conversación completa en orden cronológico.
+        embebidos: leads.messages del lead; si aún no se migró, aporta lo anterior al primer bucket.
+        """
+        mensajes: List[Dict] = []
+        for bucket in self._col().find({"phone_key": normalizar_phone_key(phone)}, {"_id": 0, "messages": 1}).sort("seq", 1):
+            mensajes.extend(bucket.get("messages") or [])
+        if embebidos:
+            mensajes = mensajes_anteriores(embebidos, mensajes[0].get("timestamp") if mensajes else None) + mensajes
+        return mensajes
+
+
+message_store = MessageStore(Config.LEAD_MESSAGES_BUCKET)
@@ -0,0 +1,169 @@
+# chatbot/owner_directory.py
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import database
+from config import Config
+from .utils import limpiar_telefono
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {"_id": 0, "movil_propietario": 1, "nombre_propietario": 1, "apellido_paterno_propietario": 1}
+
+
+def _nombre_desde_doc(doc: dict) -> str:
+    nombre = f"{doc.get('nombre_propietario', '') or ''} {doc.get('apellido_paterno_propietario', '') or ''}".strip()
+    return nombre or "Propietario"
+
+
+def _claves_busqueda(limpio: str) -> Tuple[str, ...]:
+    if len(limpio) == 9:
+        return (limpio, limpio[1:])  # por si guardaron sin el 9 inicial
+    return (limpio,)
+
+
+class OwnerDirectory:
+    """
+    Índice en memoria teléfono normalizado → nombre del propietario, construido
+    desde universo_obelix.movil_propietario.
+
+    - Carga completa al iniciar y cada OWNER_DIRECTORY_TTL_SECONDS (recoge bajas).
+    - Entre cargas completas, refresco incremental cada OWNER_DIRECTORY_REFRESH_SECONDS
+      pidiendo solo los documentos con OWNER_DIRECTORY_DELTA_FIELD posterior al último visto.
+    - Un teléfono que no está en el índice se confirma una vez contra Mongo y el
+      resultado negativo se cachea OWNER_DIRECTORY_NEGATIVE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._index: Dict[str, str] = {}
+        self._negativos: Dict[str, float] = {}
+        self._cargado_en = 0.0
+        self._refrescado_en = 0.0
+        self._ultimo_delta: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # --- Construcción del índice ---
+    def cargar(self):
+        """Reconstruye el índice completo y lo reemplaza de forma atómica."""
+        delta_field = Config.OWNER_DIRECTORY_DELTA_FIELD
+        projection = dict(PROJECTION)
+        if delta_field:
+            projection[delta_field] = 1
+
+        nuevo: Dict[str, str] = {}
+        ultimo_delta = None
+        cursor = database.propiedades().find({"movil_propietario": {"$nin": [None, ""]}}, projection)
+        for doc in cursor:
+            clave = limpiar_telefono(str(doc.get("movil_propietario", "")))
+            if clave and clave not in nuevo:
+                nuevo[clave] = _nombre_desde_doc(doc)
+            ultimo_delta = self._max_delta(ultimo_delta, doc.get(delta_field) if delta_field else None)
+
+        ahora = time.monotonic()
+        with self._lock:
+            self._index = nuevo
+            self._negativos = {}
+            self._ultimo_delta = ultimo_delta
+            self._cargado_en = ahora
+            self._refrescado_en = ahora
+        logger.info(f"[OWNERS] Directorio de propietarios cargado: {len(nuevo)} teléfonos")
+
+    def refrescar_delta(self):
+        """Agrega/actualiza solo los propietarios modificados desde el último refresco."""
+        delta_field = Config.OWNER_DIRECTORY_DELTA_FIELD
+        if not delta_field or self._ultimo_delta is None:
+            self.cargar()
+            return
+
+        projection = dict(PROJECTION)
+        projection[delta_field] = 1
+        cursor = database.propiedades().find(
+            {delta_field: {"$gt": self._ultimo_delta}, "movil_propietario": {"$nin": [None, ""]}},
+            projection
+        )
+        cambios = 0
+        with self._lock:
+            for doc in cursor:
+                clave = limpiar_telefono(str(doc.get("movil_propietario", "")))
+                if clave:
+                    self._index[clave] = _nombre_desde_doc(doc)
+                    self._negativos.pop(clave, None)
+                    cambios += 1
+                self._ultimo_delta = self._max_delta(self._ultimo_delta, doc.get(delta_field))
+            self._refrescado_en = time.monotonic()
+        if cambios:
+            logger.info(f"[OWNERS] Refresco incremental: {cambios} propietarios actualizados")
+
+    @staticmethod
+    def _max_delta(actual, valor):
+        if not isinstance(valor, datetime):
+            return actual
+        return valor if actual is None or valor > actual else actual
+
+    def _refrescar_si_corresponde(self):
+        ahora = time.monotonic()
+        vencido_total = ahora - self._cargado_en > Config.OWNER_DIRECTORY_TTL_SECONDS
+        vencido_delta = ahora - self._refrescado_en > Config.OWNER_DIRECTORY_REFRESH_SECONDS
+        if not (vencido_total or vencido_delta):
+            return
+        # Un solo hilo refresca; el resto sigue respondiendo con el índice actual
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if vencido_total:
+                self.cargar()
+            else:
+                self.refrescar_delta()
+        except Exception as e:
+            logger.error(f"[OWNERS] Error refrescando directorio: {e}")
+            self._refrescado_en = time.monotonic()  # No reintentar en cada mensaje
+        finally:
+            self._refresh_lock.release()
+
+    # --- Consulta ---
+    def buscar(self, phone: str) -> Optional[str]:
+        """Retorna el nombre del propietario o None si el teléfono no es de un propietario."""
+        limpio = limpiar_telefono(phone)
+        if not limpio:
+            return None
+
+        if not self._cargado_en:
+            with self._refresh_lock:
+                if not self._cargado_en:
+                    self.cargar()
+        else:
+            self._refrescar_si_corresponde()
+
+        claves = _claves_busqueda(limpio)
+        for clave in claves:
+            nombre = self._index.get(clave)
+            if nombre:
+                return nombre
+
+        expira = self._negativos.get(limpio)
+        if expira and expira > time.monotonic():
+            return None
+
+        return self._confirmar_en_mongo(limpio, claves)
+
+    def _confirmar_en_mongo(self, limpio: str, claves: Tuple[str, ...]) -> Optional[str]:
+        """Cubre propietarios cargados después del último refresco; el 'no' queda cacheado."""
+        variantes = [limpio, "56" + limpio, "+56" + limpio, "0" + limpio, *claves[1:]]
+        doc = database.propiedades().find_one({"movil_propietario": {"$in": variantes}}, PROJECTION)
+        with self._lock:
+            if doc:
+                nombre = _nombre_desde_doc(doc)
+                self._index[limpio] = nombre
+                return nombre
+            self._negativos[limpio] = time.monotonic() + Config.OWNER_DIRECTORY_NEGATIVE_TTL_SECONDS
+        return None
+
+    def stats(self) -> dict:
+        return {"propietarios": len(self._index), "negativos": len(self._negativos)}
+
+
+owner_directory = OwnerDirectory()
@@ -0,0 +1,129 @@
+# chatbot/prompt_builder.py → ARMADO DE MENSAJES PARA GROK
+"""
+Orden fijo de cada request (de más estable a más variable):
+
+    1. system estático   → reglas de negocio + prospecto + BI + formato JSON
+                           (se arma UNA vez al importar; idéntico byte a byte)
+    2. historial         → solo role/content, sin timestamps ni metadata
+    3. system dinámico   → datos conocidos del cliente + ficha/RAG del turno
+    4. user              → mensaje actual
+
+Así el proveedor puede reutilizar el prefijo cacheado (1 + historial previo)
+y lo que cambia en cada turno queda al final. Antes se mandaban dos system
+prompts grandes y el JSON de datos conocidos quedaba en medio del primero.
+
+Cada armado trae una estimación de tokens por segmento; grok_client suma el
+uso real (prompt_tokens / cached_tokens) en stats().
+"""
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import metrics
+
+from .prompts import (
+    PROMPT_CLASIFICACION_BI,
+    PROMPT_FORMATO_JSON,
+    PROMPT_PROPIETARIO_CHAT,
+    SYSTEM_PROMPT_NEGOCIO,
+    SYSTEM_PROMPT_PROSPECTO,
+)
+
+logger = logging.getLogger(__name__)
+
+HISTORIAL_PROSPECTO = 6
+HISTORIAL_PROPIETARIO = 20
+
+SYSTEM_ESTRUCTURADO = "\n\n".join([
+    SYSTEM_PROMPT_NEGOCIO.strip(),
+    SYSTEM_PROMPT_PROSPECTO.strip(),
+    PROMPT_CLASIFICACION_BI.strip(),
+    PROMPT_FORMATO_JSON.strip(),
+])
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación (~4 caracteres por token); el conteo real lo entrega la API en usage."""
+    return (len(texto) + 3) // 4
+
+
+@dataclass
+class PromptArmado:
+    messages: List[Dict]
+    segmentos: Dict[str, int] = field(default_factory=dict)  # tokens estimados por segmento
+
+    @property
+    def tokens_estimados(self) -> int:
+        return sum(self.segmentos.values())
+
+
+def _historial_limpio(historial: List[Dict], ultimos: int) -> List[Dict]:
+    """
+    Últimos mensajes previos al actual, solo con role/content. El historial del
+    contexto ya incluye el mensaje actual del usuario: va aparte, al final.
+    """
+    previos = historial[:-1] if historial and historial[-1].get("role") == "user" else historial
+    return [{"role": m.get("role", "user"), "content": str(m.get("content", ""))} for m in previos[-ultimos:]]
+
+
+def _armar(system_estatico: str, historial: List[Dict], contexto: str, mensaje: str, ultimos: int) -> PromptArmado:
+    hist = _historial_limpio(historial, ultimos)
+    messages = [{"role": "system", "content": system_estatico}, *hist]
+    if contexto:
+        messages.append({"role": "system", "content": contexto})
+    messages.append({"role": "user", "content": mensaje})
+
+    segmentos = {
+        "estatico": estimar_tokens(system_estatico),
+        "historial": sum(estimar_tokens(m["content"]) for m in hist),
+        "contexto": estimar_tokens(contexto),
+        "usuario": estimar_tokens(mensaje),
+    }
+    return PromptArmado(messages, segmentos)
+
+
+def armar_prospecto(historial: List[Dict], mensaje: str, datos_conocidos: Optional[dict] = None,
+                    contexto_turno: Optional[List[str]] = None) -> PromptArmado:
+    partes = []
+    datos = {k: v for k, v in (datos_conocidos or {}).items() if v}
+    # sort_keys: mismo prospecto → mismo texto
+    partes.append(f"[DATOS CONOCIDOS DEL CLIENTE]\n{json.dumps(datos, ensure_ascii=False, sort_keys=True, default=str)}")
+    partes.extend(p.strip() for p in (contexto_turno or []) if p and p.strip())
+    return _armar(SYSTEM_ESTRUCTURADO, historial, "\n\n".join(partes), mensaje, HISTORIAL_PROSPECTO)
+
+
+def armar_propietario(historial: List[Dict], mensaje: str, nombre: str) -> PromptArmado:
+    return _armar(PROMPT_PROPIETARIO_CHAT, historial, f"[PROPIETARIO] Nombre: {nombre}", mensaje, HISTORIAL_PROPIETARIO)
+
+
+# ==========================================
+# MÉTRICAS DE USO
+# ==========================================
+_stats = {"llamadas": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "segmentos": {}}
+_stats_lock = threading.Lock()
+
+
+def registrar_uso(segmentos: Dict[str, int], usage) -> None:
+    """Acumula tokens estimados por segmento y el uso real reportado por la API."""
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    detalles = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(detalles, "cached_tokens", 0) or 0
+    with _stats_lock:
+        _stats["llamadas"] += 1
+        _stats["prompt_tokens"] += prompt
+        _stats["cached_tokens"] += cached
+        _stats["completion_tokens"] += completion
+        for nombre, tokens in (segmentos or {}).items():
+            _stats["segmentos"][nombre] = _stats["segmentos"].get(nombre, 0) + tokens
+    metrics.GROK_TOKENS.inc(prompt, clase="prompt")
+    metrics.GROK_TOKENS.inc(cached, clase="cached")
+    metrics.GROK_TOKENS.inc(completion, clase="completion")
+    logger.info(f"[PROMPT] Segmentos≈{segmentos} | prompt={prompt} cached={cached} completion={completion}")
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "segmentos": dict(_stats["segmentos"])}
@@ -5,6 +5,9 @@ from typing import List, Dict, Optional
 from config import Config
 from .storage import get_db
 from .utils import safe_int_conversion
+from .comunas import resolver_comunas
+from .catalog import property_catalog
+from .semantic_index import semantic_index
 
 logger = logging.getLogger(__name__)
 
@@ -34,31 +37,33 @@ def normalizar_criterio(key: str, valor: str) -> Optional[str]:
         return valor.title()
     return valor
 
+def normalizar_criterios(criterios: Dict) -> Dict:
+    """Criterios del prospecto ya limpios; los usan tanto la query Mongo como el índice semántico."""
+    return {
+        "operacion": normalizar_criterio("operacion", criterios.get("operacion")),
+        "tipo": normalizar_criterio("tipo", criterios.get("tipo")),
+        "comunas": resolver_comunas(criterios.get("comuna")),  # IDs canónicos (comuna_norm)
+        "presupuesto": safe_int_conversion(criterios.get("presupuesto")),
+        "dormitorios": safe_int_conversion(criterios.get("dormitorios")),
+        "banos": safe_int_conversion(criterios.get("banos")),
+    }
+
 def construir_query(criterios: Dict) -> Dict:
     query = {}
+    c = normalizar_criterios(criterios)
     
     # 1. Operación (Obligatorio idealmente)
-    op = normalizar_criterio("operacion", criterios.get("operacion"))
-    if op: query["operacion"] = op
+    if c["operacion"]: query["operacion"] = c["operacion"]
 
     # 2. Tipo de propiedad
-    tipo = normalizar_criterio("tipo", criterios.get("tipo"))
-    if tipo: query["tipo"] = tipo
-
-    # 3. Comuna (CORRECCIÓN CRÍTICA PARA MULTI-COMUNA)
-    comuna = criterios.get("comuna")
-    if comuna:
-        # Si hay comas, dividimos y usamos $or para buscar en cualquiera de esas comunas
-        if "," in comuna:
-            comunas_lista = [c.strip() for c in comuna.split(",") if c.strip()]
-            if comunas_lista:
-                query["$or"] = [{"comuna": {"$regex": c, "$options": "i"}} for c in comunas_lista]
-        else:
-            # Búsqueda simple si es solo una comuna
-            query["comuna"] = {"$regex": comuna, "$options": "i"}
+    if c["tipo"]: query["tipo"] = c["tipo"]
+
+    # 3. Comuna: igualdad indexada sobre el ID canónico (multi-comuna → $in)
+    if c["comunas"]:
+        query["comuna_norm"] = {"$in": c["comunas"]}
 
     # 4. Precio (Rango inteligente)
-    presupuesto = safe_int_conversion(criterios.get("presupuesto"))
+    presupuesto = c["presupuesto"]
     if presupuesto > 0:
         # Si es bajo (ej. 5000), asumimos UF. Si es alto (ej. 100.000.000), CLP.
         if presupuesto < 30000:
@@ -67,30 +72,40 @@ def construir_query(criterios: Dict) -> Dict:
             query["precio_clp"] = {"$lte": presupuesto * 1.2}
 
     # 5. Dormitorios (mínimo)
-    dorms = safe_int_conversion(criterios.get("dormitorios"))
-    if dorms > 0:
-        query["dormitorios"] = {"$gte": dorms}
+    if c["dormitorios"] > 0:
+        query["dormitorios"] = {"$gte": c["dormitorios"]}
 
     return query
 
-def buscar_propiedades(criterios: Dict, exclude_codes: List[str] = None, limit: int = 3) -> List[Dict]:
+def buscar_propiedades(criterios: Dict, exclude_codes: List[str] = None, limit: int = 3, texto_consulta: str = "") -> List[Dict]:
     """
-    Ejecuta la búsqueda en MongoDB 'universo_obelix'.
+    Búsqueda sobre el catálogo en memoria con ranking híbrido (semantic_index).
+    Fallback a MongoDB 'universo_obelix' si el catálogo no está disponible.
     exclude_codes: Lista de códigos a NO mostrar porque ya se vieron.
     limit: Máximo estricto (default 3).
+    texto_consulta: Mensaje del cliente, para el score semántico.
     """
+    query = construir_query(criterios)
+    if not query:
+        return []
+
+    snap = property_catalog.snapshot
+    if snap is not None:
+        try:
+            c = normalizar_criterios(criterios)
+            filas = semantic_index.rankear(snap, snap.filtrar(c, exclude_codes), c, texto_consulta, limit)
+            logger.info(f"[RAG] Catálogo: {len(filas)} resultados | Excluyendo: {len(exclude_codes or [])} props")
+            return [snap.resultado(i) for i in filas]
+        except Exception as e:
+            logger.error(f"[RAG] Error en búsqueda en catálogo, usando Mongo: {e}")
+
     db = get_db()
     collection = db[Config.COLLECTION_NAME]
     
-    query = construir_query(criterios)
-    
     # AGREGADO: Exclusión de propiedades ya vistas
     if exclude_codes:
         query["codigo"] = {"$nin": exclude_codes}
 
-    if not query:
-        return []
-
     logger.info(f"[RAG] Query: {query} | Excluyendo: {len(exclude_codes or [])} props")
     
     projection = {
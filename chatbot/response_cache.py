@@ -0,0 +1,106 @@
+# chatbot/response_cache.py → CACHE DE RESPUESTAS DE PRIMER CONTACTO
+"""
+Muchas conversaciones parten con el mismo mensaje predefinido del portal
+("Hola, vi esta propiedad Procasa Código 12345 en Portal Inmobiliario...") y
+Grok contesta prácticamente lo mismo. Este cache guarda el texto de esa
+respuesta (respuesta_bot + intencion) para no volver a llamar a la API.
+
+Solo se cachea el mensaje de plantilla: trae código o link de una propiedad
+y ni el mensaje ni el prospecto tienen datos personales (el saludo podría
+nombrar al cliente). datos_extraidos nunca se guarda: los datos del lead los
+saca _preparar_turno de su propio mensaje en cada turno.
+
+Clave: (mensaje normalizado con sus números y URLs, código de la propiedad).
+Cada entrada guarda además una huella de la propiedad (precio,
+disponibilidad): si cambia en universo_obelix la entrada se descarta al leerla.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import Config
+from .utils import plegar
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_PERSONALES = ("nombre", "rut", "email")
+CAMPOS_HUELLA = ("precio_uf", "precio_clp", "operacion", "estado", "disponible")
+
+
+def normalizar_mensaje(mensaje: str) -> str:
+    """Plegado + sin puntuación, conservando números: 'Hola!! vi ESTA propiedad 12345' → 'hola vi esta propiedad 12345'."""
+    texto = re.sub(r"[^\w:/.\-]+", " ", plegar(mensaje or ""))
+    return " ".join(texto.split())
+
+
+def huella_propiedad(propiedad: Optional[dict]) -> tuple:
+    if not propiedad:
+        return ()
+    return tuple(str(propiedad.get(c)) for c in CAMPOS_HUELLA)
+
+
+def es_plantilla(entidades, codigo, prospecto: dict) -> bool:
+    """Mensaje de portal con propiedad identificada y sin datos personales del cliente."""
+    if not codigo or entidades.tramos_personales:
+        return False
+    return not any((prospecto or {}).get(c) for c in CAMPOS_PERSONALES)
+
+
+def clave(mensaje: str, codigo) -> str:
+    base = f"{normalizar_mensaje(mensaje)}|{codigo}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl_segundos
+        self._datos: "OrderedDict[str, tuple]" = OrderedDict()  # clave → (expira, huella, resultado)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, k: Optional[str], propiedad: Optional[dict] = None) -> Optional[dict]:
+        if not k:
+            return None
+        with self._lock:
+            entrada = self._datos.get(k)
+            if entrada is not None:
+                expira, huella, resultado = entrada
+                if expira > time.monotonic() and huella == huella_propiedad(propiedad):
+                    self._datos.move_to_end(k)
+                    self.hits += 1
+                    return {**resultado, "datos_extraidos": {}, "bi_analytics": {"cache": True}}
+                # Vencida o la propiedad cambió de precio/disponibilidad
+                del self._datos[k]
+            self.misses += 1
+        return None
+
+    def guardar(self, k: Optional[str], resultado: Optional[dict], propiedad: Optional[dict] = None):
+        if not k or not resultado or "error" in (resultado.get("bi_analytics") or {}):
+            return
+        # Solo el texto: datos_extraidos y bi_analytics son de este lead
+        guardado = {"intencion": resultado.get("intencion"), "respuesta_bot": resultado.get("respuesta_bot")}
+        if not guardado["intencion"] or not guardado["respuesta_bot"]:
+            return
+        with self._lock:
+            self._datos[k] = (time.monotonic() + self.ttl, huella_propiedad(propiedad), guardado)
+            self._datos.move_to_end(k)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entradas": len(self._datos), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+response_cache = ResponseCache(Config.RESPONSE_CACHE_MAX, Config.RESPONSE_CACHE_TTL_SECONDS)
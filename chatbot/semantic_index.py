@@ -0,0 +1,220 @@
+# chatbot/semantic_index.py
+"""
+Búsqueda híbrida en memoria sobre universo_obelix.
+
+- Embeddings (CPU, Config.EMBEDDING_MODEL) de descripcion_clean + amenities,
+  normalizados en una matriz NumPy (N x EMBEDDING_DIM). Si existe el índice
+  offline (python -m chatbot.index build) la matriz se abre con mmap desde
+  disco; si no, se calcula en memoria al construir.
+- Los filtros estructurados se aplican como máscara booleana sobre las
+  columnas del catálogo en memoria (chatbot/catalog.py).
+- Score final = HYBRID_WEIGHT * coseno + (1 - HYBRID_WEIGHT) * score de
+  precio/características (+ PRIORITY_BOOST si la oficina es PRIORITY_OFICINA).
+
+sentence-transformers es opcional en tiempo de ejecución: si no está
+instalado o el índice aún no está listo, el ranking usa solo el score
+estructurado.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from config import Config
+from .catalog import CatalogSnapshot, property_catalog
+
+logger = logging.getLogger(__name__)
+
+# Campos que entran al texto del embedding (chatbot/index.py)
+PROJECTION = {
+    "_id": 0, "codigo": 1, "tipo": 1, "comuna": 1,
+    "descripcion_clean": 1, "amenities": 1, "amenities_text": 1
+}
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Carga perezosa del modelo de embeddings (None si sentence-transformers no está disponible)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    logger.warning("[SEMANTIC] sentence-transformers no instalado: búsqueda solo estructurada")
+                    return None
+                _model = SentenceTransformer(Config.EMBEDDING_MODEL, device="cpu")
+    return _model
+
+
+def texto_para_embedding(doc: dict) -> str:
+    amenities = doc.get("amenities") or doc.get("amenities_text") or ""
+    if isinstance(amenities, (list, tuple)):
+        amenities = ", ".join(str(a) for a in amenities)
+    return f"{doc.get('tipo', '')} en {doc.get('comuna', '')}. {doc.get('descripcion_clean', '') or ''} {amenities}".strip()
+
+
+def codificar(textos: List[str], batch_size: int = 64) -> np.ndarray:
+    model = get_model()
+    emb = model.encode(textos, batch_size=batch_size, convert_to_numpy=True,
+                       normalize_embeddings=True, show_progress_bar=False)
+    return emb.astype(np.float32)
+
+
+REVISAR_VERSION_SEGUNDOS = 30  # Cada cuánto se mira el puntero ACTUAL del índice en disco
+
+
+class _Indice(NamedTuple):
+    """Índice vigente; se reemplaza entero (una asignación) para que un ranking nunca mezcle versiones."""
+    filas: Dict[str, int]       # codigo → fila de emb
+    emb: np.ndarray
+    version: Optional[str]      # Versión en disco (chatbot/index.py); None si se codificó en memoria
+
+
+class SemanticIndex:
+    """
+    Embeddings del catálogo indexados por código. Los filtros y los campos
+    numéricos vienen del CatalogSnapshot vigente (chatbot/catalog.py); aquí solo
+    se alinean las filas del snapshot con las filas de la matriz.
+    """
+
+    def __init__(self):
+        self._indice: Optional[_Indice] = None
+        self._alineado = (None, None, None)  # (indice, snapshot, fila_emb)
+        self._construido_en = 0.0
+        self._revisado_en = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def listo(self) -> bool:
+        return self._indice is not None
+
+    # --- Construcción ---
+    def construir(self):
+        """Abre el índice offline (mmap) o, si no existe, codifica el catálogo en memoria."""
+        if get_model() is None:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # Ya hay otro hilo construyendo
+        try:
+            inicio = time.perf_counter()
+            from . import index
+            disco = index.cargar(mmap=True) if Config.SEMANTIC_INDEX_DIR else None
+            if disco is None:
+                snap = property_catalog.snapshot
+                if snap is None or not len(snap):
+                    logger.warning("[SEMANTIC] Catálogo vacío, índice no construido")
+                    return
+                filas = {}
+                for fila, codigo in enumerate(snap.codigo):
+                    filas.setdefault(codigo, fila)
+                disco = filas, codificar([texto_para_embedding(d) for d in snap.docs]), None
+
+            nuevo = _Indice(*disco)
+            self._indice = nuevo
+            self._construido_en = time.monotonic()
+            logger.info(f"[SEMANTIC] Índice listo ({nuevo.version or 'memoria'}): {len(nuevo.filas)} propiedades "
+                        f"en {time.perf_counter() - inicio:.1f}s")
+        except Exception as e:
+            logger.error(f"[SEMANTIC] Error construyendo índice: {e}")
+        finally:
+            self._lock.release()
+
+    def construir_en_background(self):
+        threading.Thread(target=self.construir, name="semantic-index", daemon=True).start()
+
+    def _hay_version_nueva(self, indice: _Indice) -> bool:
+        """True si `python -m chatbot.index` publicó otra versión desde que se cargó este índice."""
+        ahora = time.monotonic()
+        if not Config.SEMANTIC_INDEX_DIR or ahora - self._revisado_en < REVISAR_VERSION_SEGUNDOS:
+            return False
+        self._revisado_en = ahora
+        from . import index
+        publicada = index.version_actual()
+        return publicada is not None and publicada != indice.version
+
+    def _refrescar_si_corresponde(self, indice: _Indice):
+        vencido = time.monotonic() - self._construido_en > Config.SEMANTIC_INDEX_TTL_SECONDS
+        if vencido or self._hay_version_nueva(indice):
+            self._construido_en = time.monotonic()  # Evita que cada mensaje dispare otro refresco
+            self.construir_en_background()
+
+    def _fila_emb(self, indice: _Indice, snap: CatalogSnapshot) -> np.ndarray:
+        """Fila de la matriz para cada fila del snapshot (-1 = sin embedding). Se recalcula si cambió el snapshot o el índice."""
+        alineado_indice, alineado_snap, fila_emb = self._alineado
+        if alineado_indice is indice and alineado_snap is snap:
+            return fila_emb
+        fila_emb = np.array([indice.filas.get(c, -1) for c in snap.codigo], dtype=np.int64)
+        faltan = int((fila_emb < 0).sum())
+        if faltan:
+            logger.warning(f"[SEMANTIC] {faltan} propiedades sin embedding (correr: python -m chatbot.index update)")
+        self._alineado = (indice, snap, fila_emb)
+        return fila_emb
+
+    # --- Ranking ---
+    @staticmethod
+    def _score_caracteristicas(snap: CatalogSnapshot, filas: np.ndarray, criterios: Dict) -> np.ndarray:
+        """Cercanía al presupuesto, dormitorios y baños pedidos, ponderada con Config.WEIGHTS."""
+        w_precio, w_dorms, w_banos = Config.WEIGHTS
+        n = len(filas)
+
+        presupuesto = criterios.get("presupuesto") or 0
+        if presupuesto > 0:
+            precios = (snap.precio_uf if presupuesto < 30000 else snap.precio_clp)[filas]
+            s_precio = 1.0 - np.abs(precios - presupuesto) / presupuesto
+        else:
+            s_precio = np.full(n, 0.5)
+
+        dorms = criterios.get("dormitorios") or 0
+        if dorms > 0:
+            s_dorms = 1.0 / (1.0 + np.abs(snap.dormitorios[filas] - dorms))
+        else:
+            s_dorms = np.full(n, 0.5)
+
+        banos = criterios.get("banos") or 0
+        if banos > 0:
+            s_banos = 1.0 / (1.0 + np.abs(snap.banos[filas] - banos))
+        else:
+            s_banos = np.full(n, 0.5)
+
+        score = w_precio * s_precio + w_dorms * s_dorms + w_banos * s_banos
+        return np.clip(np.nan_to_num(score, nan=0.0), 0.0, 1.0)
+
+    def rankear(self, snap: CatalogSnapshot, filas: np.ndarray, criterios: Dict, texto_consulta: str = "", limit: int = 3) -> np.ndarray:
+        """
+        filas: resultado de snap.filtrar(). Retorna hasta `limit` filas ordenadas por
+        score híbrido (sin índice semántico listo, solo score estructurado + prioridad).
+        """
+        if filas.size == 0:
+            return filas
+
+        score = self._score_caracteristicas(snap, filas, criterios)
+        indice = self._indice  # Una sola lectura: filas, matriz y alineación de la misma versión
+        if texto_consulta and indice is not None:
+            self._refrescar_si_corresponde(indice)
+            q = codificar([texto_consulta])[0]
+            idx = self._fila_emb(indice, snap)[filas]
+            con_emb = idx >= 0
+            semantico = np.zeros(filas.size, dtype=np.float32)
+            semantico[con_emb] = indice.emb[idx[con_emb]].astype(np.float32) @ q
+            # Bajo el umbral no aporta similitud; si nada lo supera queda solo el score estructurado
+            semantico = np.where(semantico >= Config.SEMANTIC_THRESHOLD_BASE, semantico, 0.0)
+            score = Config.HYBRID_WEIGHT * semantico + (1 - Config.HYBRID_WEIGHT) * score
+        score = score + Config.PRIORITY_BOOST * snap.prioridad[filas]
+
+        k = min(limit, filas.size)
+        top = np.argpartition(-score, k - 1)[:k]
+        return filas[top[np.argsort(-score[top])]]
+
+    def stats(self) -> dict:
+        indice = self._indice
+        return {"propiedades": len(indice.filas) if indice else 0, "listo": indice is not None,
+                "version": indice.version if indice else None}
+
+
+semantic_index = SemanticIndex()
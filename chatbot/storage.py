@@ -1,21 +1,23 @@
 # chatbot/storage.py
-from pymongo import MongoClient
+import json
+import logging
 from datetime import datetime
-from config import Config
+from pymongo.errors import DuplicateKeyError
+from database import get_db
+from .message_store import message_store
+from .utils import normalizar_phone_key
 from typing import List, Dict, Optional
 
-_mongo_client = None
-
-def get_db():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=10000)
-    return _mongo_client[Config.DB_NAME]
-
 COLLECTION_CONVERSATIONS = "leads"
+# El historial completo está en lead_messages (message_store); leads.messages es una cola corta
+# para la fila/reporte del CRM y respaldo si lead_messages falla
+MAX_MENSAJES = 6
+MAX_MENSAJES_SIN_MIGRAR = 30  # Leads aún no copiados por migrar_lead_messages.py: no se recorta lo que falta migrar
+MENSAJES_CONTEXTO = 21  # Lo que lee el turno: el prompt más largo (HISTORIAL_PROPIETARIO) + el mensaje actual
 
-def guardar_mensaje(phone: str, role: str, content: str, metadata: dict = None):
-    db = get_db()
+logger = logging.getLogger(__name__)
+
+def _nuevo_mensaje(role: str, content: str, metadata: dict = None) -> dict:
     message = {
         "role": role,
         "content": str(content),
@@ -23,15 +25,44 @@ def guardar_mensaje(phone: str, role: str, content: str, metadata: dict = None):
     }
     if metadata:
         message.update(metadata)
+    return message
 
-    db[COLLECTION_CONVERSATIONS].update_one(
-        {"phone": phone},
-        {
-            "$push": {"messages": {"$each": [message], "$slice": -30}}, # Aumenté un poco el historial
-            "$setOnInsert": {"created_at": datetime.utcnow().isoformat() + "Z"}
-        },
-        upsert=True
-    )
+def _upsert_lead(phone: str, update: dict):
+    """
+    update_one por phone que además fija phone_key. Si otro lead ya tiene esa
+    phone_key (duplicado '+569…' / '569…' sin fusionar, ver migrar_phone_key.py)
+    se guarda sin phone_key en vez de perder el turno.
+    """
+    col = get_db()[COLLECTION_CONVERSATIONS]
+    update["$set"]["phone_key"] = normalizar_phone_key(phone)
+    try:
+        col.update_one({"phone": phone}, update, upsert=True)
+    except DuplicateKeyError:
+        logger.warning(f"[PHONE_KEY] {phone}: phone_key duplicada en leads, se guarda sin ella (fusionar a mano)")
+        del update["$set"]["phone_key"]
+        col.update_one({"phone": phone}, update, upsert=True)
+
+def _nuevo_lead() -> dict:
+    # Un lead nuevo escribe todo su historial en lead_messages: no hay nada que migrar
+    return {"created_at": datetime.utcnow().isoformat() + "Z", "lead_messages_migrado": True}
+
+def guardar_mensaje(phone: str, role: str, content: str, metadata: dict = None):
+    message = _nuevo_mensaje(role, content, metadata)
+
+    # Sin leer el lead no se sabe si ya se migró: se recorta con el margen de los no migrados
+    _upsert_lead(phone, {
+        "$push": {"messages": {"$each": [message], "$slice": -MAX_MENSAJES_SIN_MIGRAR}},
+        "$set": {"last_message_at": message["timestamp"]},
+        "$setOnInsert": _nuevo_lead()
+    })
+    _guardar_historial(phone, [message])
+
+def _guardar_historial(phone: str, mensajes: List[Dict]):
+    """Copia append-only en lead_messages; si falla, el turno sigue con leads.messages."""
+    try:
+        message_store.agregar(phone, mensajes)
+    except Exception as e:
+        logger.error(f"[LEAD_MESSAGES] Error guardando historial de {phone}: {e}")
 
 def obtener_conversacion(phone: str) -> List[Dict]:
     db = get_db()
@@ -42,15 +73,13 @@ def obtener_conversacion(phone: str) -> List[Dict]:
 
 def obtener_prospecto(phone: str) -> dict:
     db = get_db()
-    doc = db[COLLECTION_CONVERSATIONS].find_one({"phone": phone})
+    doc = db[COLLECTION_CONVERSATIONS].find_one({"phone": phone}, {"prospecto": 1})
     if not doc:
         return {}
     return doc.get("prospecto", {})
 
-def actualizar_prospecto(phone: str, datos: dict):
-    if not datos:
-        return
-
+def _limpiar_datos_prospecto(datos: dict) -> dict:
+    """Aplica las mismas reglas de limpieza que se usan al guardar en Mongo."""
     # Validación defensiva de nombre
     if "nombre" in datos:
         nombre = str(datos.get("nombre", "")).strip()
@@ -59,12 +88,21 @@ def actualizar_prospecto(phone: str, datos: dict):
         else:
             datos["nombre"] = nombre.title()
 
+    limpios = {}
+    for key, value in datos.items():
+        if value not in [None, "", "desconocido"]:
+            limpios[key] = str(value).strip()
+    return limpios
+
+def actualizar_prospecto(phone: str, datos: dict):
+    if not datos:
+        return
+
     db = get_db()
     update_fields = {"$set": {}}
 
-    for key, value in datos.items():
-        if value not in [None, "", "desconocido"]:
-            update_fields["$set"][f"prospecto.{key}"] = str(value).strip()
+    for key, value in _limpiar_datos_prospecto(datos).items():
+        update_fields["$set"][f"prospecto.{key}"] = value
 
     if update_fields["$set"]:
         db[COLLECTION_CONVERSATIONS].update_one(
@@ -97,4 +135,121 @@ def registrar_propiedades_vistas(phone: str, nuevos_codigos: List[str]):
 def obtener_propiedades_vistas(phone: str) -> List[str]:
     """Retorna la lista de códigos que ya se le recomendaron al usuario."""
     p = obtener_prospecto(phone)
-    return p.get("propiedades_vistas", [])
\ No newline at end of file
+    return p.get("propiedades_vistas", [])
+
+# ==========================================
+# CONTEXTO DE CONVERSACIÓN (UNA LECTURA / UNA ESCRITURA POR TURNO)
+# ==========================================
+def normalizar_alerts(alerts) -> dict:
+    """alerts_sent quedó guardado como string en documentos antiguos; lo devolvemos siempre como dict."""
+    if isinstance(alerts, str):
+        try:
+            alerts = json.loads(alerts.replace("'", "\""))
+        except Exception:
+            alerts = {}
+    return dict(alerts) if isinstance(alerts, dict) else {}
+
+class ConversationContext:
+    """
+    Carga prospecto, propiedades vistas y alertas del lead con un solo find_one
+    proyectado y los últimos MENSAJES_CONTEXTO mensajes desde lead_messages
+    (leads.messages solo completa lo que falta migrar), acumula los cambios del
+    turno en memoria y los persiste con un único update_one en flush().
+    """
+    PROJECTION = {"_id": 0, "messages": 1, "prospecto": 1, "lead_messages_migrado": 1}
+
+    def __init__(self, phone: str, doc: Optional[dict] = None, messages: Optional[List[Dict]] = None):
+        doc = doc or {}
+        self.phone = phone
+        self.messages: List[Dict] = list(doc.get("messages") or []) if messages is None else list(messages)
+        # Un lead que aún no existe se crea ya migrado (ver _nuevo_lead)
+        self.migrado: bool = not doc or bool(doc.get("lead_messages_migrado"))
+        self.prospecto: dict = dict(doc.get("prospecto") or {})
+        self._mensajes_nuevos: List[Dict] = []
+        self._campos_prospecto: Dict[str, str] = {}
+        self._vistas_nuevas: List[str] = []
+        self._alerts_dirty = False
+
+    @classmethod
+    def cargar(cls, phone: str) -> "ConversationContext":
+        doc = get_db()[COLLECTION_CONVERSATIONS].find_one({"phone": phone}, cls.PROJECTION)
+        embebidos = (doc or {}).get("messages") or []
+        try:
+            messages = message_store.ultimos(phone, MENSAJES_CONTEXTO, embebidos)
+        except Exception as e:
+            logger.error(f"[LEAD_MESSAGES] Error leyendo historial de {phone}, se usa leads.messages: {e}")
+            messages = embebidos
+        return cls(phone, doc, messages)
+
+    # --- Lecturas ---
+    @property
+    def propiedades_vistas(self) -> List[str]:
+        return list(self.prospecto.get("propiedades_vistas") or [])
+
+    @property
+    def alerts_sent(self) -> dict:
+        return normalizar_alerts(self.prospecto.get("alerts_sent", {}))
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._mensajes_nuevos or self._campos_prospecto or self._vistas_nuevas or self._alerts_dirty)
+
+    # --- Escrituras diferidas ---
+    def agregar_mensaje(self, role: str, content: str, metadata: dict = None):
+        message = _nuevo_mensaje(role, content, metadata)
+        self._mensajes_nuevos.append(message)
+        self.messages = (self.messages + [message])[-MENSAJES_CONTEXTO:]
+
+    def actualizar_prospecto(self, datos: dict):
+        if not datos:
+            return
+        datos = dict(datos)
+        # Estos campos tienen su propio operador en flush()
+        datos.pop("propiedades_vistas", None)
+        datos.pop("alerts_sent", None)
+        limpios = _limpiar_datos_prospecto(datos)
+        self._campos_prospecto.update(limpios)
+        self.prospecto.update(limpios)
+
+    def registrar_propiedades_vistas(self, nuevos_codigos: List[str]):
+        if not nuevos_codigos:
+            return
+        vistas = self.propiedades_vistas
+        for codigo in nuevos_codigos:
+            if codigo not in vistas:
+                vistas.append(codigo)
+            if codigo not in self._vistas_nuevas:
+                self._vistas_nuevas.append(codigo)
+        self.prospecto["propiedades_vistas"] = vistas
+
+    def marcar_alerta(self, lead_type: str):
+        alerts = self.alerts_sent
+        alerts[lead_type] = datetime.utcnow().isoformat()
+        self.prospecto["alerts_sent"] = alerts
+        self._alerts_dirty = True
+
+    def flush(self):
+        """Persiste todos los cambios pendientes del turno en un solo update_one."""
+        if not self.dirty:
+            return
+
+        update = {"$setOnInsert": _nuevo_lead()}
+        set_fields = {f"prospecto.{k}": v for k, v in self._campos_prospecto.items()}
+        if self._alerts_dirty:
+            set_fields["prospecto.alerts_sent"] = self.alerts_sent
+        update["$set"] = set_fields
+        if self._mensajes_nuevos:
+            recorte = MAX_MENSAJES if self.migrado else MAX_MENSAJES_SIN_MIGRAR
+            update["$push"] = {"messages": {"$each": self._mensajes_nuevos, "$slice": -recorte}}
+            set_fields["last_message_at"] = self._mensajes_nuevos[-1]["timestamp"]  # Lista del CRM sin leer messages
+        if self._vistas_nuevas:
+            update["$addToSet"] = {"prospecto.propiedades_vistas": {"$each": self._vistas_nuevas}}
+
+        _upsert_lead(self.phone, update)
+        if self._mensajes_nuevos:
+            _guardar_historial(self.phone, self._mensajes_nuevos)
+
+        self._mensajes_nuevos = []
+        self._campos_prospecto = {}
+        self._vistas_nuevas = []
+        self._alerts_dirty = False
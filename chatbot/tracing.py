@@ -0,0 +1,160 @@
+# chatbot/tracing.py → TIEMPOS POR ETAPA DE CADA TURNO
+"""
+Cada turno de conversación (desde que vence el debounce hasta el envío por
+WhatsApp) se traza en spans:
+
+    cargar_contexto → clasificar_propietario → resolver_link → busqueda_rag
+    → grok → alertas → guardar_mensaje → envio_whatsapp
+
+Cada span emite una línea JSON en el logger "procasa.trace" con el id del
+turno y el hash del teléfono (nunca el número), y al cerrar el turno se emite
+el resumen con el total. Además se acumulan las últimas duraciones por etapa
+para ver p50/p95/p99 en /metrics/turnos sin salir del proceso.
+
+    with tracing.turno(phone):
+        with tracing.span("grok", modelo="grok-4"):
+            ...
+
+El turno viaja en un contextvar: las etapas que corren en el pool de hilos
+de core necesitan copy_context() (ver core._en_executor).
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import metrics
+from config import Config
+from .utils import normalizar_phone_key
+
+logger = logging.getLogger("procasa.trace")
+
+MUESTRAS_POR_ETAPA = 2000
+
+
+class _Turno:
+    def __init__(self, phone: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.phone_hash = hash_phone(phone)
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, float] = {}  # etapa → ms acumulados en el turno
+
+
+_turno_actual: contextvars.ContextVar[Optional[_Turno]] = contextvars.ContextVar("turno_actual", default=None)
+
+
+def hash_phone(phone: str) -> str:
+    return hashlib.sha256(normalizar_phone_key(phone).encode("utf-8")).hexdigest()[:12]
+
+
+def _emitir(evento: dict):
+    if Config.TRACE_LOG_ENABLED:
+        logger.info(json.dumps(evento, ensure_ascii=False, default=str))
+
+
+# ==========================================
+# AGREGADO EN MEMORIA (p50 / p95 / p99)
+# ==========================================
+class _Latencias:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._muestras: Dict[str, deque] = {}
+        self._totales: Dict[str, int] = {}
+        self._errores: Dict[str, int] = {}
+
+    def registrar(self, etapa: str, ms: float, ok: bool = True):
+        with self._lock:
+            if etapa not in self._muestras:
+                self._muestras[etapa] = deque(maxlen=MUESTRAS_POR_ETAPA)
+            self._muestras[etapa].append(ms)
+            self._totales[etapa] = self._totales.get(etapa, 0) + 1
+            if not ok:
+                self._errores[etapa] = self._errores.get(etapa, 0) + 1
+
+    @staticmethod
+    def _percentil(ordenadas: List[float], p: float) -> float:
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+    def resumen(self) -> dict:
+        with self._lock:
+            copia = {etapa: sorted(m) for etapa, m in self._muestras.items()}
+            totales, errores = dict(self._totales), dict(self._errores)
+        resumen = {}
+        for etapa, ordenadas in copia.items():
+            if not ordenadas:
+                continue
+            resumen[etapa] = {
+                "n": totales[etapa],
+                "errores": errores.get(etapa, 0),
+                "p50_ms": round(self._percentil(ordenadas, 0.50), 1),
+                "p95_ms": round(self._percentil(ordenadas, 0.95), 1),
+                "p99_ms": round(self._percentil(ordenadas, 0.99), 1),
+                "max_ms": round(ordenadas[-1], 1),
+            }
+        return resumen
+
+
+latencias = _Latencias()
+
+
+# ==========================================
+# API
+# ==========================================
+@contextmanager
+def turno(phone: str):
+    """Abre el turno del teléfono; si ya hay uno abierto (webhook → core) se reutiliza."""
+    actual = _turno_actual.get()
+    if actual is not None:
+        yield actual
+        return
+    nuevo = _Turno(phone)
+    token = _turno_actual.set(nuevo)
+    ok = True
+    try:
+        yield nuevo
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        _turno_actual.reset(token)
+        total = (time.perf_counter() - nuevo.inicio) * 1000
+        latencias.registrar("turno_total", total, ok)
+        metrics.ETAPA_SEGUNDOS.observe(total / 1000, etapa="turno_total")
+        _emitir({"evento": "turno", "turno": nuevo.id, "phone": nuevo.phone_hash, "ok": ok,
+                 "total_ms": round(total, 1), "etapas_ms": {k: round(v, 1) for k, v in nuevo.etapas.items()}})
+
+
+def _registrar_span(actual: Optional[_Turno], etapa: str, ms: float, ok: bool, atributos: dict):
+    latencias.registrar(etapa, ms, ok)
+    metrics.ETAPA_SEGUNDOS.observe(ms / 1000, etapa=etapa)
+    evento = {"evento": "span", "etapa": etapa, "ms": round(ms, 1), "ok": ok, **atributos}
+    if actual is not None:
+        actual.etapas[etapa] = actual.etapas.get(etapa, 0.0) + ms
+        evento.update(turno=actual.id, phone=actual.phone_hash)
+    _emitir(evento)
+
+
+@contextmanager
+def span(etapa: str, **atributos):
+    """Mide una etapa. Se agrega siempre; la línea JSON lleva el turno si hay uno abierto."""
+    actual = _turno_actual.get()
+    inicio = time.perf_counter()
+    ok = True
+    try:
+        yield atributos  # La etapa puede completar atributos (ej: resultados del RAG)
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        _registrar_span(actual, etapa, (time.perf_counter() - inicio) * 1000, ok, atributos)
+
+
+def registrar(etapa: str, inicio: float, **atributos):
+    """Para etapas que no caben en un bloque with: inicio = time.perf_counter() al empezar."""
+    _registrar_span(_turno_actual.get(), etapa, (time.perf_counter() - inicio) * 1000, True, atributos)
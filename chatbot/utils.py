@@ -1,5 +1,6 @@
 # chatbot/utils.py
 import re
+import unicodedata
 from typing import Optional
 
 # ==========================================
@@ -15,6 +16,23 @@ def limpiar_telefono(phone: str) -> str:
     if num.startswith("0"): num = num[1:]
     return num
 
+def normalizar_phone_key(phone: str) -> str:
+    """
+    Clave canónica del lead: E.164 solo dígitos (ej: '+56 9 1234 5678' → '56912345678').
+    Se guarda en leads.phone_key (índice único) para búsquedas exactas.
+    """
+    if not phone: return ""
+    num = re.sub(r"[^\d]", "", str(phone))
+    if num.startswith("00"): num = num[2:]  # prefijo internacional
+    if len(num) == 10 and num.startswith("09"): num = num[1:]
+    if len(num) == 9 and num.startswith("9"): num = "56" + num  # móvil chileno sin código país
+    return num
+
+def plegar(texto) -> str:
+    """Minúsculas, sin tildes ni espacios sobrantes ('  Ñuñoa ' → 'nunoa')."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).split())
+
 # ==========================================
 # 2. CONVERSIÓN SEGURA DE NÚMEROS (Corrección del error 'invalid literal for int')
 # ==========================================
@@ -58,39 +76,51 @@ def validar_rut(rut_sin_formato: str) -> bool:
     multiplo = 2
     for digito in reversed(cuerpo):
         suma += int(digito) * multiplo
-        multiplo = 7 if multiplo == 8 else multiplo + 1  # serie: 2,3,4,5,6,7,2,3...
+        multiplo = 2 if multiplo == 7 else multiplo + 1  # serie: 2,3,4,5,6,7,2,3...
     
     resto = suma % 11
     dv_calculado = "0" if resto == 0 else "K" if resto == 1 else str(11 - resto)
     
     return dv_calculado == dv_provisto
 
-def extraer_rut(texto: str) -> Optional[str]:
-    """
-    Versión mejorada: extrae solo si pasa validación de DV.
-    """
-    # Busca formatos comunes (con o sin puntos/guion)
-    match = re.search(r'\b(\d{1,2}\.?\d{3}\.?\d{3}-?[\dkK])\b', texto, re.IGNORECASE)
-    if not match:
-        return None
-    
-    rut_raw = match.group(1).replace(".", "").replace("-", "").upper()
-    
+# Patrones compilados una sola vez; chatbot/entities.py los reutiliza en su barrido único
+RE_RUT = re.compile(r'\b(\d{1,2}\.?\d{3}\.?\d{3}-?[\dkK])\b', re.IGNORECASE)
+RE_EMAIL = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+# El nombre no puede cortar un email ('me llamo juan.perez@...') ni quedar pegado a un número
+PATRON_NOMBRE = r"[A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40}(?![\w@]|\.[\w@])"
+DISPARADORES_NOMBRE = ("me llamo", "mi nombre es", "soy")  # en orden de prioridad
+_RE_NOMBRES = [re.compile(rf"{d}\s+({PATRON_NOMBRE})", re.IGNORECASE) for d in DISPARADORES_NOMBRE]
+
+def formatear_rut(rut_raw: str) -> Optional[str]:
+    """'12.345.678-5' → '12345678-5' si el DV es válido; None si no."""
+    rut_raw = rut_raw.replace(".", "").replace("-", "").upper()
     # Normaliza longitud (algunos escriben con 0 iniciales, pero no afecta)
     if len(rut_raw) < 2:
         return None
-    
     cuerpo = rut_raw[:-1]
     dv = rut_raw[-1]
-    
     # Validación estricta
     if not validar_rut(cuerpo + dv):
         return None  # ← Aquí se rechazan los códigos de propiedades falsos
-    
     return f"{cuerpo}-{dv}"
 
+def limpiar_nombre(crudo: str) -> Optional[str]:
+    nombre = crudo.strip().title()
+    # Evitamos frases largas raras
+    return nombre if nombre and len(nombre.split()) <= 4 else None
+
+def extraer_rut(texto: str) -> Optional[str]:
+    """
+    Versión mejorada: extrae solo si pasa validación de DV.
+    """
+    # Busca formatos comunes (con o sin puntos/guion)
+    match = RE_RUT.search(texto)
+    if not match:
+        return None
+    return formatear_rut(match.group(1))
+
 def extraer_email(texto: str) -> Optional[str]:
-    match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', texto)
+    match = RE_EMAIL.search(texto)
     return match.group(0).lower() if match else None
 
 def extraer_nombre_posible(texto: str) -> Optional[str]:
@@ -137,18 +167,11 @@ def extraer_nombre_explicito(texto: str) -> Optional[str]:
     """
     texto = texto.strip()
 
-    patrones = [
-        r"me llamo\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})",
-        r"mi nombre es\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})",
-        r"soy\s+([A-Za-zÁÉÍÓÚÑáéíóúñ ]{2,40})"
-    ]
-
-    for patron in patrones:
-        match = re.search(patron, texto, re.IGNORECASE)
+    for patron in _RE_NOMBRES:
+        match = patron.search(texto)
         if match:
-            nombre = match.group(1).strip().title()
-            # Evitamos frases largas raras
-            if len(nombre.split()) <= 4:
+            nombre = limpiar_nombre(match.group(1))
+            if nombre:
                 return nombre
 
     return None
@@ -9,12 +9,27 @@ class Config:
     XAI_API_KEY = os.getenv("XAI_API_KEY")
     MONGO_URI = os.getenv("MONGO_URI")
     DB_NAME = os.getenv("DB_NAME", "URLS")
+
+    # === POOL MONGO (database.py) ===
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+    MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 300000))
+    MONGO_WAIT_QUEUE_MS = int(os.getenv("MONGO_WAIT_QUEUE_MS", 5000))
+    MONGO_SERVER_SELECTION_MS = int(os.getenv("MONGO_SERVER_SELECTION_MS", 10000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
     
 
     # === WASENDERAPI.COM (WhatsApp) ===
     WASENDER_TOKEN = os.getenv("WASENDER_TOKEN")
     WASENDER_WEBHOOK_SECRET = os.getenv("WASENDER_WEBHOOK_SECRET")
     WASENDER_BASE_URL = os.getenv("WASENDER_BASE_URL", "https://wasenderapi.com/api")
+    WASENDER_MAX_INTENTOS = int(os.getenv("WASENDER_MAX_INTENTOS", 4))
+    WASENDER_BACKOFF_BASE = float(os.getenv("WASENDER_BACKOFF_BASE", "1.0"))   # segundos
+    WASENDER_BACKOFF_MAX = float(os.getenv("WASENDER_BACKOFF_MAX", "30.0"))
+    WASENDER_MAX_POR_MINUTO = float(os.getenv("WASENDER_MAX_POR_MINUTO", "60"))  # Rate limit por cuenta
+    WASENDER_RAFAGA = int(os.getenv("WASENDER_RAFAGA", 5))
+    WASENDER_OUTBOX_INTERVALO = float(os.getenv("WASENDER_OUTBOX_INTERVALO", "30"))
+    WASENDER_OUTBOX_MAX_INTENTOS = int(os.getenv("WASENDER_OUTBOX_MAX_INTENTOS", 10))
 
     # === GMAIL ===
     GMAIL_USER = os.getenv("GMAIL_USER")
@@ -26,6 +41,10 @@ class Config:
     COLLECTION_RESPUESTAS = os.getenv("COLLECTION_RESPUESTAS", "price_updates")
     COLLECTION_WHATSAPP_ENVIADOS = os.getenv("COLLECTION_WHATSAPP_ENVIADOS", "whatsapp_price_updates")
     COLLECTION_CAMPANAS_LOG = os.getenv("COLLECTION_CAMPANAS_LOG", "campanas_historico")
+    COLLECTION_WHATSAPP_OUTBOX = os.getenv("COLLECTION_WHATSAPP_OUTBOX", "whatsapp_outbox")
+    COLLECTION_DEBOUNCE = os.getenv("COLLECTION_DEBOUNCE", "debounce_buffer")
+    COLLECTION_WEBHOOK_INBOX = os.getenv("COLLECTION_WEBHOOK_INBOX", "webhook_inbox")
+    COLLECTION_LEAD_MESSAGES = os.getenv("COLLECTION_LEAD_MESSAGES", "lead_messages")
 
     # === Modo y opciones ===
     SIMULATION_MODE = os.getenv("SIMULATION_MODE", "false").lower() == "true"
@@ -38,6 +57,7 @@ class Config:
     GROK_MODEL = os.getenv("GROK_MODEL")
     GROK_BASE_URL = os.getenv("GROK_BASE_URL", "https://api.x.ai/v1")
     GROK_TEMPERATURE = float(os.getenv("GROK_TEMPERATURE", "0.0"))
+    GROK_STREAMING = os.getenv("GROK_STREAMING", "true").lower() == "true"  # Despacho temprano de respuesta_bot al WhatsApp
 
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"
     EMBEDDING_DIM = 384
@@ -50,11 +70,62 @@ class Config:
     SEMANTIC_THRESHOLD_BASE = 0.15
     PRIORITY_BOOST = 0.5
     PRIORITY_OFICINA = "INMOBILIARIA SUCRE SPA"
+    CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", 600))  # Recarga del catálogo en memoria (chatbot/catalog.py)
+    SEMANTIC_ENABLED = os.getenv("SEMANTIC_ENABLED", "true").lower() == "true"
+    SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "data/semantic_index")  # Índice offline (chatbot/index.py)
+    SEMANTIC_INDEX_TTL_SECONDS = int(os.getenv("SEMANTIC_INDEX_TTL_SECONDS", 6 * 3600))  # Reconstrucción del índice híbrido
+
+    # === Cache de respuestas de primer contacto (chatbot/response_cache.py) ===
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 6 * 3600))
+    RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX", 2000))
+
+    # === Links de portal sin propiedad en el catálogo (chatbot/link_extractor.py) ===
+    LINK_MISS_TTL_SECONDS = int(os.getenv("LINK_MISS_TTL_SECONDS", 900))  # Cache negativo por código
+    LINK_MISS_MAX = int(os.getenv("LINK_MISS_MAX", 500))  # Códigos sin resolver que se muestran en /metrics/links
+
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"  # Turnos triviales sin LLM (chatbot/intent_router.py)
+    TRACE_LOG_ENABLED = os.getenv("TRACE_LOG_ENABLED", "true").lower() == "true"  # Línea JSON por etapa del turno (chatbot/tracing.py)
+
+    # === Debounce de ráfagas por teléfono (debounce.py) ===
+    DEBOUNCE_BACKEND = os.getenv("DEBOUNCE_BACKEND", "memory")  # "mongo" con más de un worker de gunicorn
+    DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "15"))  # Ventana fija, y tope de la adaptativa
+    DEBOUNCE_ADAPTIVE = os.getenv("DEBOUNCE_ADAPTIVE", "true").lower() == "true"
+    DEBOUNCE_MIN_SECONDS = float(os.getenv("DEBOUNCE_MIN_SECONDS", "0.5"))  # Mensaje que parece completo
+    DEBOUNCE_UNICO_SECONDS = float(os.getenv("DEBOUNCE_UNICO_SECONDS", "3"))  # Teléfonos que escriben en un solo mensaje
+    DEBOUNCE_BASE_SECONDS = float(os.getenv("DEBOUNCE_BASE_SECONDS", "6"))
+    DEBOUNCE_LARGO_CHARS = int(os.getenv("DEBOUNCE_LARGO_CHARS", 120))
+    DEBOUNCE_LEASE_SECONDS = int(os.getenv("DEBOUNCE_LEASE_SECONDS", 120))  # Tiempo máximo de un turno antes de que otro worker lo retome
+    DEBOUNCE_SWEEP_SECONDS = float(os.getenv("DEBOUNCE_SWEEP_SECONDS", "5"))  # Barrido de buffers huérfanos (solo mongo)
+    DEBOUNCE_SWEEP_GRACE_SECONDS = float(os.getenv("DEBOUNCE_SWEEP_GRACE_SECONDS", "3"))
+
+    # === Bandeja durable de webhooks (inbox.py) ===
+    INBOX_ENABLED = os.getenv("INBOX_ENABLED", "true").lower() == "true"  # false → el webhook procesa en línea como antes
+    INBOX_TTL_SECONDS = int(os.getenv("INBOX_TTL_SECONDS", 3 * 24 * 3600))
+    INBOX_LEASE_SECONDS = int(os.getenv("INBOX_LEASE_SECONDS", 60))
+    INBOX_BUFFER_LEASE_SECONDS = int(os.getenv("INBOX_BUFFER_LEASE_SECONDS", 300))  # Evento en el debounce sin turno confirmado: se vuelve a reclamar
+    INBOX_POLL_SECONDS = float(os.getenv("INBOX_POLL_SECONDS", "5"))  # Reintentos y eventos que dejó otro worker
+    INBOX_MAX_INTENTOS = int(os.getenv("INBOX_MAX_INTENTOS", 5))
+    DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", 600))  # Ids de mensaje recordados en memoria
+    DEDUP_MAX = int(os.getenv("DEDUP_MAX", 20000))
+
+    # === Cola de turnos por teléfono (dispatcher.py) ===
+    DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 16))  # Turnos simultáneos por proceso
+    DISPATCH_MAX_PENDIENTES = int(os.getenv("DISPATCH_MAX_PENDIENTES", 500))
+    DISPATCH_ENCOLAR_TIMEOUT = float(os.getenv("DISPATCH_ENCOLAR_TIMEOUT", "10"))
 
     # === Chatbot / colección ===
     HISTORIAL_MAX = 8
+    CHATBOT_MAX_WORKERS = int(os.getenv("CHATBOT_MAX_WORKERS", 8))  # Hilos para Mongo/SMTP en el pipeline async
     COLLECTION_NAME = "universo_obelix"
     COLLECTION_CONVERSATIONS = "leads"
+    LEAD_MESSAGES_BUCKET = int(os.getenv("LEAD_MESSAGES_BUCKET", 50))  # Mensajes por documento en lead_messages (chatbot/message_store.py)
+
+    # === Directorio de propietarios (chatbot/owner_directory.py) ===
+    OWNER_DIRECTORY_REFRESH_SECONDS = int(os.getenv("OWNER_DIRECTORY_REFRESH_SECONDS", 300))   # Refresco incremental
+    OWNER_DIRECTORY_TTL_SECONDS = int(os.getenv("OWNER_DIRECTORY_TTL_SECONDS", 3600))          # Recarga completa
+    OWNER_DIRECTORY_NEGATIVE_TTL_SECONDS = int(os.getenv("OWNER_DIRECTORY_NEGATIVE_TTL_SECONDS", 600))
+    OWNER_DIRECTORY_DELTA_FIELD = os.getenv("OWNER_DIRECTORY_DELTA_FIELD", "updated_at")
 
     # === Logs y claves ===
     LOG_LEVEL = "INFO"
@@ -0,0 +1,173 @@
+# database.py → CONEXIÓN MONGO ÚNICA POR PROCESO
+"""
+Un solo MongoClient (con su pool) por proceso, compartido por el webhook, el CRM,
+los reportes y el chatbot. Crear un MongoClient por request paga DNS + TLS +
+handshake + server selection cada vez y deja pools huérfanos.
+
+En el webhook, connect()/close() se llaman desde el lifespan de FastAPI. En
+scripts sueltos basta con usar get_db() o los accesores: el cliente se crea
+de forma perezosa la primera vez.
+"""
+import logging
+import threading
+from typing import Optional
+
+from pymongo import ASCENDING, MongoClient
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.database import Database
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[MongoClient] = None
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(
+                    Config.MONGO_URI,
+                    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=Config.MONGO_MAX_IDLE_MS,
+                    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_MS,
+                    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_MS,
+                    connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+                    retryWrites=True,
+                    appname="procasa-chatbot",
+                    event_listeners=[metrics.MongoListener()]  # Latencia por colección en /metrics
+                )
+    return _client
+
+
+def get_db() -> Database:
+    return get_client()[Config.DB_NAME]
+
+
+def get_collection(name: str) -> Collection:
+    return get_db()[name]
+
+
+def connect():
+    """Abre el pool y verifica la conexión (llamado al arrancar el webhook)."""
+    get_client().admin.command("ping")
+    logger.info(f"[MONGO] Conectado a {Config.DB_NAME} (pool {Config.MONGO_MIN_POOL_SIZE}-{Config.MONGO_MAX_POOL_SIZE})")
+
+
+def asegurar_indices():
+    """
+    Crea los índices que usan las consultas de la app (idempotente).
+    Un índice que falla (ej: duplicados previos a una migración) se reporta y no detiene el arranque.
+    """
+    indices = [
+        # phone_key: clave canónica del lead (ver migrar_phone_key.py)
+        (leads, [("phone_key", ASCENDING)], {
+            "name": "phone_key_unique", "unique": True,
+            "partialFilterExpression": {"phone_key": {"$type": "string"}}
+        }),
+        # comuna_norm: ID canónico de comuna (ver migrar_comuna_norm.py)
+        (propiedades, [("comuna_norm", ASCENDING), ("operacion", ASCENDING)], {"name": "comuna_norm_operacion"}),
+        # Historial completo por buckets (chatbot/message_store.py)
+        (lead_messages, [("phone_key", ASCENDING), ("seq", ASCENDING)], {"name": "phone_key_seq_unique", "unique": True}),
+        # Barrido de buffers vencidos (debounce.py)
+        (debounce_buffer, [("vence", ASCENDING)], {"name": "vence"}),
+        # Bandeja de webhooks (inbox.py): eventos por procesar y expiración
+        (webhook_inbox, [("estado", ASCENDING), ("recibido_en", ASCENDING)], {"name": "estado_recibido_en"}),
+        (webhook_inbox, [("recibido_en", ASCENDING)], {"name": "recibido_en_ttl", "expireAfterSeconds": Config.INBOX_TTL_SECONDS}),
+    ]
+    for coleccion, keys, opciones in indices:
+        try:
+            coleccion().create_index(keys, **opciones)
+        except Exception as e:
+            logger.error(f"[MONGO] No se pudo crear el índice {opciones.get('name')}: {e}")
+
+
+def close():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("[MONGO] Conexión cerrada")
+
+
+# ==========================================
+# ACCESORES POR COLECCIÓN
+# ==========================================
+def leads() -> Collection:
+    return get_collection(Config.COLLECTION_CONVERSATIONS)
+
+def propiedades() -> Collection:
+    return get_collection(Config.COLLECTION_NAME)
+
+def usuarios() -> Collection:
+    return get_collection("usuarios")
+
+def contactos() -> Collection:
+    return get_collection(Config.COLLECTION_CONTACTOS)
+
+def respuestas_campana() -> Collection:
+    return get_collection(Config.COLLECTION_RESPUESTAS)
+
+def crm_events() -> Collection:
+    return get_collection("crm_events")
+
+def crm_tasks() -> Collection:
+    return get_collection("crm_tasks")
+
+def retiros_propiedades() -> Collection:
+    return get_collection("retiros_propiedades")
+
+def whatsapp_outbox() -> Collection:
+    return get_collection(Config.COLLECTION_WHATSAPP_OUTBOX)
+
+def debounce_buffer() -> Collection:
+    return get_collection(Config.COLLECTION_DEBOUNCE)
+
+def webhook_inbox() -> Collection:
+    return get_collection(Config.COLLECTION_WEBHOOK_INBOX)
+
+def lead_messages() -> Collection:
+    return get_collection(Config.COLLECTION_LEAD_MESSAGES)
+
+
+# ==========================================
+# LECTURAS DE leads POR VISTA (PROYECCIONES CON NOMBRE)
+# ==========================================
+# Cada pantalla pide solo los campos que muestra: el documento completo trae
+# hasta 30 mensajes con su contenido, bi_analytics_global, notas, etc.
+PROYECCIONES_LEADS = {
+    # Fila de la lista del CRM (api_crm.get_crm_leads_list). messages.$slice -1
+    # solo cubre leads sin last_message_at (ver migrar_lead_messages.py)
+    "fila_lista": {
+        "phone": 1, "crm_estado": 1, "created_at": 1, "last_message_at": 1,
+        "prospecto.nombre": 1, "prospecto.codigo": 1, "datos_propiedad.codigo": 1,
+        "messages": {"$slice": -1},
+    },
+    # Ficha del CRM (api_crm.get_lead_detail_data); messages = cola embebida para leads sin migrar
+    "detalle": {
+        "phone": 1, "crm_estado": 1, "prospecto": 1, "datos_propiedad": 1,
+        "last_crm_update": 1, "sticky_notes": 1, "messages": 1,
+    },
+    # Fila del reporte ejecutivo: de los mensajes solo rol, intención y fecha (sin contenido)
+    "fila_reporte": {
+        "phone": 1, "prospecto": 1, "bi_analytics_global": 1,
+        "messages.role": 1, "messages.intencion": 1, "messages.timestamp": 1,
+    },
+    # Chat del reporte (api_leads_intelligence.get_specific_lead_chat)
+    "chat": {"_id": 0, "phone": 1, "prospecto": 1, "messages": 1, "bi_analytics_global": 1},
+}
+
+
+def buscar_leads(vista: str, filtro: dict = None, **opciones) -> Cursor:
+    return leads().find(filtro or {}, PROYECCIONES_LEADS[vista], **opciones)
+
+
+def lead_por_vista(vista: str, filtro: dict) -> Optional[dict]:
+    return leads().find_one(filtro, PROYECCIONES_LEADS[vista])
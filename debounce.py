@@ -0,0 +1,280 @@
+# debounce.py → AGRUPACIÓN DE MENSAJES POR TELÉFONO (MEMORIA O MONGO)
+"""
+Los clientes escriben en ráfagas ("hola" / "vi esta casa" / "link"). El webhook
+junta los mensajes de cada teléfono y procesa un solo turno cuando el
+teléfono deja de escribir por la ventana de debounce.
+
+Cada teléfono tiene un buffer con:
+    partes       → textos recibidos aún sin procesar
+    claves       → ids de webhook_inbox de esos textos (inbox.py)
+    vence        → cuándo se puede procesar (cada mensaje nuevo lo corre)
+    en_proceso   → textos ya reclamados por un worker (para recuperar si se cae)
+    claves_en_proceso → sus ids de webhook_inbox, que el webhook marca procesados
+                   recién cuando confirma el turno
+    lease_*      → qué worker lo está procesando y hasta cuándo
+
+reclamar() es atómico: aunque varios workers tengan un timer para el mismo
+teléfono, solo uno toma el texto, y solo si ya venció. Si el worker muere a
+mitad del turno, al expirar el lease otro worker lo retoma con barrer().
+
+Backends (Config.DEBOUNCE_BACKEND):
+    memory → dicts del proceso (un solo worker; lo buffereado se pierde al reiniciar)
+    mongo  → colección debounce_buffer, compartida por todos los workers de gunicorn
+
+La ventana no es fija: VentanaAdaptativa la calcula por mensaje (ver abajo).
+"""
+import logging
+import os
+from abc import ABC, abstractmethod
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+import database
+from chatbot.entities import entity_extractor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Identifica a este proceso como dueño de los lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class DebounceBackend(ABC):
+    """Interfaz de los backends; uno incompleto falla al instanciarse en crear_backend()."""
+
+    @abstractmethod
+    def agregar(self, phone: str, texto: str, espera: float, clave: str = None) -> None:
+        """Suma el texto (y su id de webhook_inbox) al buffer del teléfono y corre su vencimiento a ahora + espera."""
+
+    @abstractmethod
+    def reclamar(self, phone: str) -> Optional[Tuple[str, List[str]]]:
+        """(texto agrupado, ids de webhook_inbox) si el buffer venció y nadie lo está procesando; None en otro caso."""
+
+    @abstractmethod
+    def confirmar(self, phone: str) -> Optional[float]:
+        """
+        Turno terminado: libera el lease y borra el buffer si no llegó nada nuevo.
+        Si llegaron mensajes durante el turno retorna los segundos que faltan para
+        su vencimiento (el timer que los trajo pudo haber fallado el reclamo).
+        """
+
+    def vencidos(self, limite: int = 50) -> List[str]:
+        """Teléfonos listos para reclamar (timers perdidos por reinicio o worker caído)."""
+        return []
+
+    @abstractmethod
+    def pendientes(self) -> int:
+        """Buffers vivos (gauge procasa_debounce_pendientes)."""
+
+
+class MemoryDebounce(DebounceBackend):
+    def __init__(self):
+        self._buffers = {}  # phone → {"partes", "claves", "vence", "en_proceso", "claves_en_proceso", "lease_hasta"}
+        self._lock = threading.Lock()
+
+    def agregar(self, phone: str, texto: str, espera: float, clave: str = None) -> None:
+        with self._lock:
+            buf = self._buffers.setdefault(phone, {"partes": [], "claves": [], "en_proceso": [],
+                                                   "claves_en_proceso": [], "lease_hasta": 0.0})
+            buf["partes"].append(texto)
+            if clave:
+                buf["claves"].append(clave)
+            buf["vence"] = time.time() + espera
+
+    def reclamar(self, phone: str) -> Optional[Tuple[str, List[str]]]:
+        ahora = time.time()
+        with self._lock:
+            buf = self._buffers.get(phone)
+            if not buf or buf["vence"] > ahora or buf["lease_hasta"] > ahora:
+                return None
+            if not buf["partes"] and not buf["en_proceso"]:
+                return None
+            buf["en_proceso"] += buf["partes"]
+            buf["claves_en_proceso"] += buf["claves"]
+            buf["partes"], buf["claves"] = [], []
+            buf["lease_hasta"] = ahora + Config.DEBOUNCE_LEASE_SECONDS
+            return " ".join(buf["en_proceso"]).strip(), list(buf["claves_en_proceso"])
+
+    def confirmar(self, phone: str) -> Optional[float]:
+        with self._lock:
+            buf = self._buffers.get(phone)
+            if not buf:
+                return None
+            if not buf["partes"]:
+                del self._buffers[phone]
+                return None
+            buf["en_proceso"], buf["claves_en_proceso"], buf["lease_hasta"] = [], [], 0.0
+            return max(0.0, buf["vence"] - time.time())
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._buffers)
+
+
+class MongoDebounce(DebounceBackend):
+    """Un documento por teléfono en debounce_buffer (_id = phone)."""
+
+    def _col(self):
+        return database.debounce_buffer()
+
+    @staticmethod
+    def _sin_lease(ahora: datetime) -> dict:
+        return {"$or": [{"lease_hasta": None}, {"lease_hasta": {"$lt": ahora}}]}
+
+    def agregar(self, phone: str, texto: str, espera: float, clave: str = None) -> None:
+        ahora = datetime.utcnow()
+        push = {"partes": texto, "claves": clave} if clave else {"partes": texto}
+        self._col().update_one(
+            {"_id": phone},
+            {"$push": push,
+             "$set": {"vence": ahora + timedelta(seconds=espera), "updated_at": ahora},
+             "$setOnInsert": {"created_at": ahora}},
+            upsert=True
+        )
+
+    def reclamar(self, phone: str) -> Optional[Tuple[str, List[str]]]:
+        ahora = datetime.utcnow()
+        doc = self._col().find_one_and_update(
+            {"_id": phone, "vence": {"$lte": ahora},
+             "$and": [self._sin_lease(ahora),
+                      {"$or": [{"partes.0": {"$exists": True}}, {"en_proceso.0": {"$exists": True}}]}]},
+            # Pipeline: lo que quedó en_proceso de un worker caído + lo nuevo, en una sola operación
+            [{"$set": {
+                "en_proceso": {"$concatArrays": [{"$ifNull": ["$en_proceso", []]}, {"$ifNull": ["$partes", []]}]},
+                "partes": {"$literal": []},
+                "claves_en_proceso": {"$concatArrays": [{"$ifNull": ["$claves_en_proceso", []]}, {"$ifNull": ["$claves", []]}]},
+                "claves": {"$literal": []},
+                "lease_owner": WORKER_ID,
+                "lease_hasta": ahora + timedelta(seconds=Config.DEBOUNCE_LEASE_SECONDS),
+            }}],
+            return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            return None
+        return " ".join(doc.get("en_proceso") or []).strip(), doc.get("claves_en_proceso") or []
+
+    def confirmar(self, phone: str) -> Optional[float]:
+        col = self._col()
+        # Sin mensajes nuevos → se borra; si llegaron durante el turno quedan para el próximo
+        borrado = col.delete_one({"_id": phone, "lease_owner": WORKER_ID, "partes": {"$size": 0}})
+        if borrado.deleted_count:
+            return None
+        doc = col.find_one_and_update(
+            {"_id": phone, "lease_owner": WORKER_ID},
+            {"$set": {"en_proceso": [], "claves_en_proceso": [], "lease_hasta": None, "lease_owner": None}},
+            projection={"vence": 1}, return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            return None  # El lease expiró y otro worker ya lo tomó
+        return max(0.0, (doc["vence"] - datetime.utcnow()).total_seconds())
+
+    def vencidos(self, limite: int = 50) -> List[str]:
+        # Margen para que gane el timer del worker que recibió el último mensaje
+        ahora = datetime.utcnow()
+        cursor = self._col().find(
+            {"vence": {"$lte": ahora - timedelta(seconds=Config.DEBOUNCE_SWEEP_GRACE_SECONDS)},
+             "$and": [self._sin_lease(ahora),
+                      {"$or": [{"partes.0": {"$exists": True}}, {"en_proceso.0": {"$exists": True}}]}]},
+            {"_id": 1}
+        ).limit(limite)
+        return [d["_id"] for d in cursor]
+
+    def pendientes(self) -> int:
+        return self._col().estimated_document_count()
+
+
+def crear_backend(nombre: str = None) -> DebounceBackend:
+    nombre = (nombre or Config.DEBOUNCE_BACKEND).lower()
+    if nombre == "mongo":
+        return MongoDebounce()
+    if nombre != "memory":
+        logger.warning(f"[DEBOUNCE] Backend '{nombre}' desconocido, usando memory")
+    return MemoryDebounce()
+
+
+# ==========================================
+# VENTANA ADAPTATIVA
+# ==========================================
+MAX_TELEFONOS = 5000  # Cadencias recordadas (LRU)
+ALFA_CADENCIA = 0.3   # Peso del último intervalo en el promedio móvil
+
+
+class _Cadencia:
+    __slots__ = ("ultimo", "intervalo", "en_rafaga", "rafagas", "rafagas_multiples")
+
+    def __init__(self):
+        self.ultimo = 0.0
+        self.intervalo = None    # Promedio móvil de segundos entre mensajes de una misma ráfaga
+        self.en_rafaga = 0       # Mensajes de la ráfaga actual
+        self.rafagas = 0
+        self.rafagas_multiples = 0
+
+
+class VentanaAdaptativa:
+    """
+    Cuánto esperar después de cada mensaje antes de procesar la ráfaga:
+
+        completo      → DEBOUNCE_MIN_SECONDS: termina en "?", trae link o código, o es largo
+        rafaga        → el teléfono va en el 2º+ mensaje: 2× su intervalo típico, hasta DEBOUNCE_SECONDS
+        mensaje_unico → historial de un mensaje por turno: DEBOUNCE_UNICO_SECONDS
+        base          → DEBOUNCE_BASE_SECONDS (teléfono nuevo o sin patrón claro)
+
+    La cadencia se aprende en memoria por proceso: con varios workers cada uno
+    ve parte de los mensajes, lo que solo hace la ventana algo más conservadora.
+    """
+
+    def __init__(self):
+        self._cadencias: "OrderedDict[str, _Cadencia]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parece_completo(texto: str) -> bool:
+        texto = texto.strip()
+        if texto.endswith("?") or len(texto) >= Config.DEBOUNCE_LARGO_CHARS:
+            return True
+        ent = entity_extractor.extraer(texto)
+        return bool(ent.urls or ent.codigo_procasa)
+
+    def _registrar(self, phone: str, ahora: float) -> _Cadencia:
+        with self._lock:
+            cad = self._cadencias.pop(phone, None) or _Cadencia()
+            self._cadencias[phone] = cad
+            while len(self._cadencias) > MAX_TELEFONOS:
+                self._cadencias.popitem(last=False)
+            intervalo = ahora - cad.ultimo
+            if cad.ultimo and intervalo <= Config.DEBOUNCE_SECONDS:
+                cad.en_rafaga += 1
+                if cad.en_rafaga == 2:
+                    cad.rafagas_multiples += 1
+                cad.intervalo = intervalo if cad.intervalo is None else (
+                    ALFA_CADENCIA * intervalo + (1 - ALFA_CADENCIA) * cad.intervalo)
+            else:
+                cad.en_rafaga = 1
+                cad.rafagas += 1
+            cad.ultimo = ahora
+            return cad
+
+    def calcular(self, phone: str, texto: str) -> Tuple[float, str]:
+        """(segundos de espera, motivo) para el mensaje que acaba de llegar."""
+        if not Config.DEBOUNCE_ADAPTIVE:
+            return Config.DEBOUNCE_SECONDS, "fija"
+        cad = self._registrar(phone, time.time())
+        if self.parece_completo(texto):
+            return Config.DEBOUNCE_MIN_SECONDS, "completo"
+        if cad.en_rafaga >= 2:
+            intervalo = cad.intervalo or Config.DEBOUNCE_BASE_SECONDS
+            espera = max(Config.DEBOUNCE_BASE_SECONDS, 2 * intervalo)
+            return min(Config.DEBOUNCE_SECONDS, espera), "rafaga"
+        if cad.rafagas >= 3 and cad.rafagas_multiples / cad.rafagas < 0.3:
+            return Config.DEBOUNCE_UNICO_SECONDS, "mensaje_unico"
+        return Config.DEBOUNCE_BASE_SECONDS, "base"
+
+
+ventana_adaptativa = VentanaAdaptativa()
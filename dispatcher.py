@@ -0,0 +1,110 @@
+# dispatcher.py → COLA DE TURNOS POR TELÉFONO (UN TURNO A LA VEZ POR CONVERSACIÓN)
+"""
+Cuando vence el debounce, el turno no corre en su propio task: se encola en
+la cola del teléfono y lo toma un pool acotado de workers (modelo actor):
+
+    teléfono A: [turno1, turno2]  ─┐
+    teléfono B: [turno1]           ├─→ listos (un teléfono a la vez) → N workers
+    teléfono C: [turno1]          ─┘
+
+- Un teléfono está en "listos" o en manos de un worker, nunca en dos: sus
+  turnos corren de a uno y en orden de llegada (sin carreras en el $push/$slice
+  de guardar_mensaje ni en actualizar_prospecto).
+- Tras cada turno el teléfono vuelve al final de "listos" si le quedan
+  turnos, para que una conversación muy activa no acapare un worker.
+- Con DISPATCH_MAX_PENDIENTES turnos en cola, encolar() espera un cupo
+  (contrapresión) y si no lo obtiene en DISPATCH_ENCOLAR_TIMEOUT retorna False.
+
+Entre workers de gunicorn la exclusión la da el lease del debounce (debounce.py).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+Trabajo = Callable[[], Awaitable]
+
+
+class DespachadorTurnos:
+    def __init__(self, workers: int, max_pendientes: int):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self._colas: Dict[str, Deque[Tuple[float, Trabajo]]] = {}  # Teléfono con turnos pendientes o en curso
+        self._listos: Optional[asyncio.Queue] = None
+        self._cupos: Optional[asyncio.Semaphore] = None
+        self._tareas = []
+        self.en_curso = 0
+        self.procesados = 0
+        self.rechazados = 0
+
+    def iniciar(self):
+        """Se llama en el lifespan del webhook (necesita el event loop)."""
+        self._listos = asyncio.Queue()
+        self._cupos = asyncio.Semaphore(self.max_pendientes)
+        self._colas.clear()
+        self._tareas = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"[DISPATCH] {self.workers} workers, máximo {self.max_pendientes} turnos en cola")
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    async def encolar(self, phone: str, trabajo: Trabajo, timeout: float = None) -> bool:
+        if self._listos is None:
+            self.iniciar()
+        try:
+            await asyncio.wait_for(self._cupos.acquire(), timeout or Config.DISPATCH_ENCOLAR_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rechazados += 1
+            metrics.DESPACHO_RECHAZADOS.inc()
+            return False
+        cola = self._colas.get(phone)
+        if cola is None:
+            cola = self._colas[phone] = deque()
+            self._listos.put_nowait(phone)
+        cola.append((time.perf_counter(), trabajo))
+        return True
+
+    async def _worker(self, numero: int):
+        while True:
+            phone = await self._listos.get()
+            cola = self._colas[phone]
+            encolado, trabajo = cola.popleft()
+            metrics.DESPACHO_ESPERA_SEGUNDOS.observe(time.perf_counter() - encolado)
+            self.en_curso += 1
+            try:
+                await trabajo()
+            except Exception as e:
+                logger.error(f"[DISPATCH] Worker {numero}: error en turno de {phone}: {e}", exc_info=True)
+            finally:
+                self.en_curso -= 1
+                self.procesados += 1
+                self._cupos.release()
+                if cola:
+                    self._listos.put_nowait(phone)  # Al final: justo con los demás teléfonos
+                else:
+                    del self._colas[phone]
+
+    def pendientes(self) -> int:
+        return sum(len(cola) for cola in list(self._colas.values()))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "en_curso": self.en_curso,
+            "pendientes": self.pendientes(),
+            "telefonos": len(self._colas),
+            "procesados": self.procesados,
+            "rechazados": self.rechazados,
+        }
+
+
+despachador = DespachadorTurnos(Config.DISPATCH_WORKERS, Config.DISPATCH_MAX_PENDIENTES)
@@ -0,0 +1,154 @@
+# inbox.py → BANDEJA DURABLE DE WEBHOOKS DE WASENDER
+"""
+El webhook solo verifica la firma, guarda el evento crudo en webhook_inbox y
+responde 200; el consumidor (webhook.consumir_inbox) lo procesa después.
+
+    _id          → clave de idempotencia: key.id del mensaje de Wasender
+                   (sha256 del body si no viene), así un reintento del
+                   proveedor choca con el índice único de _id y se descarta
+    raw          → body tal como llegó
+    estado       → pendiente → procesando → en_buffer → procesado | fallido
+    lease_*      → qué worker lo está procesando (si muere, otro lo retoma)
+
+en_buffer: el texto ya está en el buffer de debounce pero el turno no ha
+corrido. Con DEBOUNCE_BACKEND=memory ese buffer se pierde al reiniciar, así
+que el evento pasa a procesado solo cuando procesar_turno confirma el turno
+(las claves viajan con el buffer, ver debounce.py). Si el lease de en_buffer
+(INBOX_BUFFER_LEASE_SECONDS) vence antes, el evento se vuelve a reclamar:
+se prefiere un mensaje repetido a uno perdido.
+    recibido_en  → índice TTL (INBOX_TTL_SECONDS): la colección no crece sin fin
+
+Se usa TTL y no una colección capped porque los eventos cambian de estado
+(en capped no se puede borrar ni hacer crecer un documento).
+Al reiniciar, lo que quedó pendiente o con lease vencido se vuelve a procesar.
+
+Deduplicación en dos capas (procasa_mensajes_duplicados_total{capa}):
+    memoria → mensajes_vistos, LRU con TTL corto por proceso: un reintento al
+              mismo worker se descarta sin ir a Mongo
+    mongo   → índice único de _id: reintentos que caen en otro worker o
+              después de un reinicio. También con INBOX_ENABLED=false: el
+              evento se registra ya procesado solo para reservar la clave.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import database
+import metrics
+from config import Config
+from debounce import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+
+def clave_idempotencia(data: dict, raw_body: bytes) -> str:
+    messages = (data.get("data") or {}).get("messages") or {}
+    msg_obj = messages if isinstance(messages, dict) else (messages[0] if messages else {})
+    message_id = (msg_obj.get("key") or {}).get("id") if isinstance(msg_obj, dict) else None
+    if message_id:
+        return f"wa:{message_id}"
+    return "sha256:" + hashlib.sha256(raw_body).hexdigest()
+
+
+class VistosRecientes:
+    """Claves de idempotencia vistas hace menos de ttl segundos (LRU acotado)."""
+
+    def __init__(self, ttl_segundos: float, maximo: int):
+        self.ttl = ttl_segundos
+        self.maximo = maximo
+        self._vistos: "OrderedDict[str, float]" = OrderedDict()  # clave → expira (monotonic)
+        self._lock = threading.Lock()
+
+    def primera_vez(self, clave: str) -> bool:
+        """Marca la clave como vista; False si ya estaba vigente."""
+        ahora = time.monotonic()
+        with self._lock:
+            expira = self._vistos.pop(clave, None)
+            self._vistos[clave] = ahora + self.ttl
+            while len(self._vistos) > self.maximo:
+                self._vistos.popitem(last=False)
+        if expira is not None and expira > ahora:
+            metrics.MENSAJES_DUPLICADOS.inc(capa="memoria")
+            return False
+        return True
+
+    def olvidar(self, clave: str):
+        """El evento no quedó registrado: el reintento del proveedor debe procesarse."""
+        with self._lock:
+            self._vistos.pop(clave, None)
+
+
+mensajes_vistos = VistosRecientes(Config.DEDUP_TTL_SECONDS, Config.DEDUP_MAX)
+
+
+class WebhookInbox:
+    def _col(self):
+        return database.webhook_inbox()
+
+    def guardar(self, clave: str, raw_body: bytes, estado: str = "pendiente") -> bool:
+        """False si el evento ya estaba (reintento del proveedor)."""
+        try:
+            self._col().insert_one({
+                "_id": clave,
+                "raw": raw_body.decode("utf-8"),
+                "estado": estado,
+                "intentos": 0,
+                "recibido_en": datetime.utcnow(),
+            })
+            return True
+        except DuplicateKeyError:
+            metrics.MENSAJES_DUPLICADOS.inc(capa="mongo")
+            return False
+
+    def liberar(self, clave: str):
+        """Borra la reserva de un evento que no se alcanzó a procesar (INBOX_ENABLED=false)."""
+        self._col().delete_one({"_id": clave})
+
+    def reclamar(self) -> Optional[dict]:
+        """El evento pendiente más antiguo (o con lease vencido), marcado como procesando."""
+        ahora = datetime.utcnow()
+        return self._col().find_one_and_update(
+            {"$or": [{"estado": "pendiente"},
+                     {"estado": {"$in": ["procesando", "en_buffer"]}, "lease_hasta": {"$lt": ahora}}]},
+            {"$set": {"estado": "procesando", "lease_owner": WORKER_ID,
+                      "lease_hasta": ahora + timedelta(seconds=Config.INBOX_LEASE_SECONDS)},
+             "$inc": {"intentos": 1}},
+            sort=[("recibido_en", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def marcar(self, clave: str, estado: str, error: str = None):
+        cambios = {"estado": estado, "lease_hasta": None, "procesado_en": datetime.utcnow()}
+        if error:
+            cambios["error"] = error[:500]
+        self._col().update_one({"_id": clave, "lease_owner": WORKER_ID}, {"$set": cambios})
+
+    def dejar_en_buffer(self, clave: str):
+        """El texto quedó en el debounce: se espera a que el turno lo confirme."""
+        self._col().update_one(
+            {"_id": clave, "lease_owner": WORKER_ID, "estado": "procesando"},
+            {"$set": {"estado": "en_buffer",
+                      "lease_hasta": datetime.utcnow() + timedelta(seconds=Config.INBOX_BUFFER_LEASE_SECONDS)}}
+        )
+
+    def completar(self, claves: List[str]):
+        """Turno confirmado: sus eventos quedan procesados (los pudo haber agregado otro worker)."""
+        if not claves:
+            return
+        self._col().update_many(
+            {"_id": {"$in": claves}, "estado": {"$in": ["procesando", "en_buffer"]}},
+            {"$set": {"estado": "procesado", "lease_hasta": None, "procesado_en": datetime.utcnow()}}
+        )
+
+    def pendientes(self) -> int:
+        return self._col().count_documents({"estado": {"$in": ["pendiente", "procesando", "en_buffer"]}})
+
+
+webhook_inbox = WebhookInbox()
@@ -1,11 +1,14 @@
 # iniciar_chat.py (VERSIÓN CORREGIDA PARA NÚMEROS INTERNACIONALES Y RATE LIMIT)
-import requests
 import logging
 import re
 import time  # IMPORTANTE para el delay
 from datetime import datetime, timezone
-from pymongo import MongoClient
 from config import Config
+import database
+from wasender_client import get_wasender_client
+from chatbot.utils import normalizar_phone_key
+from chatbot.entities import entity_extractor
+from chatbot.message_store import message_store
 
 # Configuración de Logs
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,10 +18,9 @@ logger = logging.getLogger(__name__)
 # CONEXIÓN A BASE DE DATOS
 # ==========================================
 try:
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    collection_conversations = db[Config.COLLECTION_CONVERSATIONS]
-    collection_propiedades = db[Config.COLLECTION_NAME] 
+    database.connect()
+    collection_conversations = database.leads()
+    collection_propiedades = database.propiedades()
     logger.info(f"Conexión exitosa a DB: {Config.DB_NAME}")
 except Exception as e:
     logger.error(f"Error conectando a MongoDB: {e}")
@@ -42,35 +44,15 @@ def formatear_telefono(phone):
     return f"+{limpio}"
 
 def extraer_codigo_referencia(link):
-    if not link: return None
-    link = link.upper().replace("_", "-")
-    match_mlc = re.search(r"(MLC)-?(\d+)", link)
-    if match_mlc: return f"{match_mlc.group(1)}{match_mlc.group(2)}"
-    match_yapo = re.search(r"/(\d{8,12})$", link)
-    if match_yapo: return match_yapo.group(1)
-    match_procasa = re.search(r"(\d{4,6})", link)
-    if match_procasa: return match_procasa.group(1)
-    return None
+    # Misma lógica de portales que el chatbot (chatbot/entities.py)
+    return entity_extractor.codigo_de_link(link)
 
 def obtener_fecha_iso():
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 def enviar_whatsapp_api(phone, message):
-    url = f"{Config.WASENDER_BASE_URL.rstrip('/')}/send-message"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {Config.WASENDER_TOKEN}"
-    }
-    payload = {"to": phone.replace("+", ""), "text": message}
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-        if response.status_code == 200:
-            return True
-        logger.error(f"Error API WA: {response.text}")
-        return False
-    except Exception as e:
-        logger.error(f"Excepción envío WA: {e}")
-        return False
+    # Sin outbox: si falla, el mensaje inicial no se registra y el admin lo reintenta a mano
+    return get_wasender_client().send_text_sync(phone, message, encolar_si_falla=False)
 
 # ==========================================
 # LÓGICA PRINCIPAL
@@ -151,12 +133,15 @@ def iniciar_conversacion_manual(telefono_raw, nombre, link, origen="MercadoLibre
                     "$push": {"messages": nuevo_mensaje_obj},
                     "$set": {
                         "updated_at": fecha_iso,
+                        "last_message_at": fecha_iso,
                         "prospecto": prospecto_data,
-                        "phone": telefono_con_plus
+                        "phone": telefono_con_plus,
+                        "phone_key": normalizar_phone_key(telefono_con_plus)
                     }
                 },
                 upsert=True
             )
+            message_store.agregar(telefono_con_plus, [nuevo_mensaje_obj])
             
             if codigo_procasa:
                 collection_conversations.update_one(
@@ -0,0 +1,222 @@
+# metrics.py → MÉTRICAS EN FORMATO PROMETHEUS
+"""
+Contadores, gauges e histogramas en memoria, expuestos en GET /metrics con el
+formato de texto de Prometheus (sin depender de prometheus_client).
+
+Cada proceso lleva sus propios valores: con varios workers de gunicorn cada
+scrape ve el worker que atendió el request (igual que /health). Para alertar
+por saturación conviene sumar por instancia en Prometheus.
+
+    import metrics
+    metrics.WEBHOOK_REQUESTS.inc(resultado="procesado")
+    metrics.GROK_SEGUNDOS.observe(2.4, tipo="estructurada")
+
+Las métricas que ya existen como stats() en otros módulos (catálogo, cache de
+respuestas, ruta rápida...) se publican con gauge_funcion desde webhook.py.
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_registro: List["_Metrica"] = []
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica(ABC):
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def _clave(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.etiquetas)
+
+    def _cabecera(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+    @abstractmethod
+    def exportar(self) -> List[str]:
+        """Líneas de texto de Prometheus (HELP, TYPE y una por serie)."""
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, cantidad: float = 1, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return self._cabecera() + [f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}" for k, v in valores.items()]
+
+
+class Gauge(Counter):
+    tipo = "gauge"
+
+    def set(self, valor: float, **labels):
+        with self._lock:
+            self._valores[self._clave(labels)] = valor
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # clave → [conteos por bucket..., suma, total]
+
+    def observe(self, valor: float, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        lineas = self._cabecera()
+        for clave, serie in series.items():
+            for limite, conteo in zip(self.buckets + (float("inf"),), serie[:len(self.buckets)] + [serie[-1]]):
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {conteo}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie[-1]}")
+        return lineas
+
+
+class _GaugeFuncion(_Metrica):
+    """Valor calculado al momento del scrape: fn() → número o {(etiquetas...): número}."""
+
+    def __init__(self, nombre: str, ayuda: str, fn: Callable, etiquetas: Iterable[str] = (), tipo: str = "gauge"):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.fn = fn
+        self.tipo = tipo
+
+    def exportar(self) -> List[str]:
+        try:
+            valor = self.fn()
+        except Exception as e:
+            logger.warning(f"[METRICS] {self.nombre} no disponible: {e}")
+            return []
+        valores = valor if isinstance(valor, dict) else {(): valor}
+        return self._cabecera() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, k if isinstance(k, tuple) else (k,))} {_numero(v)}"
+            for k, v in valores.items() if v is not None
+        ]
+
+
+def gauge_funcion(nombre: str, ayuda: str, fn: Callable, etiquetas: Iterable[str] = (), tipo: str = "gauge"):
+    """tipo="counter" para acumulados que ya lleva otro módulo (ej: hits del cache)."""
+    return _GaugeFuncion(nombre, ayuda, fn, etiquetas, tipo)
+
+
+def exportar() -> str:
+    lineas = []
+    for metrica in list(_registro):
+        lineas.extend(metrica.exportar())
+    return "\n".join(lineas) + "\n"
+
+
+# ==========================================
+# MONGO: LATENCIA POR COLECCIÓN (CommandListener de pymongo)
+# ==========================================
+_COMANDOS_IGNORADOS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+
+class MongoListener(monitoring.CommandListener):
+    def __init__(self):
+        self._en_curso: Dict[Tuple, str] = {}  # (conexión, request_id) → colección
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in _COMANDOS_IGNORADOS:
+            return
+        coleccion = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            coleccion = event.command.get("collection")
+        with self._lock:
+            self._en_curso[(event.connection_id, event.request_id)] = coleccion if isinstance(coleccion, str) else "-"
+
+    def _terminar(self, event, resultado: str):
+        with self._lock:
+            coleccion = self._en_curso.pop((event.connection_id, event.request_id), None)
+        if coleccion is None:
+            return
+        MONGO_SEGUNDOS.observe(event.duration_micros / 1e6, coleccion=coleccion, operacion=event.command_name)
+        if resultado != "ok":
+            MONGO_ERRORES.inc(coleccion=coleccion, operacion=event.command_name)
+
+    def succeeded(self, event):
+        self._terminar(event, "ok")
+
+    def failed(self, event):
+        self._terminar(event, "error")
+
+
+# ==========================================
+# DEFINICIONES
+# ==========================================
+WEBHOOK_REQUESTS = Counter("procasa_webhook_requests_total", "Webhooks de Wasender recibidos", ["resultado"])
+MENSAJES_DUPLICADOS = Counter("procasa_mensajes_duplicados_total", "Reintentos de Wasender descartados por id de mensaje", ["capa"])
+MENSAJES_PROCESADOS = Counter("procasa_mensajes_procesados_total", "Turnos procesados tras el debounce", ["resultado"])
+DEBOUNCE_ESPERA_SEGUNDOS = Histogram("procasa_debounce_espera_segundos", "Latencia agregada por el debounce antes del turno",
+                                     ["motivo"], buckets=(0.5, 1, 2, 3, 5, 8, 10, 15, 20, 30, 60))
+DESPACHO_ESPERA_SEGUNDOS = Histogram("procasa_turno_cola_segundos", "Espera en la cola por teléfono antes de que un worker tome el turno")
+DESPACHO_RECHAZADOS = Counter("procasa_turno_cola_rechazados_total", "Turnos que no obtuvieron cupo en la cola (contrapresión)")
+ETAPA_SEGUNDOS = Histogram("procasa_turno_etapa_segundos", "Duración por etapa del turno (chatbot/tracing.py)", ["etapa"])
+
+GROK_SEGUNDOS = Histogram("procasa_grok_segundos", "Latencia de llamadas a Grok", ["tipo"])
+GROK_LLAMADAS = Counter("procasa_grok_llamadas_total", "Llamadas a Grok por resultado", ["tipo", "resultado"])
+GROK_TOKENS = Counter("procasa_grok_tokens_total", "Tokens reportados por la API de Grok", ["clase"])
+
+MONGO_SEGUNDOS = Histogram("procasa_mongo_segundos", "Latencia de comandos Mongo por colección",
+                           ["coleccion", "operacion"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+MONGO_ERRORES = Counter("procasa_mongo_errores_total", "Comandos Mongo fallidos", ["coleccion", "operacion"])
+
+WHATSAPP_ENVIOS = Counter("procasa_whatsapp_envios_total", "Envíos de WhatsApp por resultado", ["resultado"])
+WHATSAPP_REINTENTOS = Counter("procasa_whatsapp_reintentos_total", "Reintentos de envío a Wasender")
+
+ALERTAS = Counter("procasa_alertas_total", "Alertas por email a ejecutivos", ["tipo", "resultado"])
+
+HTTP_SEGUNDOS = Histogram("procasa_http_segundos", "Latencia de endpoints HTTP (plantilla de ruta)", ["ruta", "metodo"])
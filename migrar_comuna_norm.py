@@ -0,0 +1,58 @@
+# migrar_comuna_norm.py → BACKFILL DE universo_obelix.comuna_norm + ÍNDICE
+"""
+Escribe comuna_norm (ID canónico de chatbot/comunas.py) en cada propiedad y
+crea el índice (comuna_norm, operacion) que usa la búsqueda del RAG.
+
+El bot completa comuna_norm solo en cada carga del catálogo
+(chatbot/catalog.completar_comuna_norm); este script sirve para el despliegue
+inicial del índice y para revisar comunas que no se reconocen.
+
+Uso:
+    python migrar_comuna_norm.py            # aplica cambios
+    python migrar_comuna_norm.py --dry-run  # solo reporta
+"""
+import argparse
+from collections import Counter
+
+from pymongo import UpdateOne
+
+import database
+from chatbot.comunas import CANONICAS, normalizar_comuna
+
+BATCH = 500
+
+
+def ejecutar(dry_run: bool = False):
+    coleccion = database.propiedades()
+    operaciones = []
+    no_reconocidas = Counter()
+
+    for doc in coleccion.find({}, {"comuna": 1, "comuna_norm": 1}):
+        cid = normalizar_comuna(doc.get("comuna"))
+        if not cid:
+            continue
+        if cid not in CANONICAS:
+            no_reconocidas[cid] += 1
+        if doc.get("comuna_norm") != cid:
+            operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"comuna_norm": cid}}))
+
+    print(f"📊 {len(operaciones)} propiedades por actualizar")
+    if no_reconocidas:
+        print(f"⚠️ Comunas fuera del listado (se guardan plegadas, revisar alias): {dict(no_reconocidas.most_common(20))}")
+    if dry_run:
+        print("🧪 Dry run: no se escribió nada.")
+        return
+
+    for i in range(0, len(operaciones), BATCH):
+        res = coleccion.bulk_write(operaciones[i:i + BATCH], ordered=False)
+        print(f"   ✅ Lote {i // BATCH + 1}: {res.modified_count} modificados")
+
+    database.asegurar_indices()
+    print("🏁 Índice comuna_norm_operacion listo.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de universo_obelix.comuna_norm")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    ejecutar(dry_run=args.dry_run)
@@ -0,0 +1,98 @@
+# migrar_lead_messages.py → BACKFILL DE lead_messages DESDE leads.messages
+"""
+Copia a lead_messages (buckets, ver chatbot/message_store.py) los mensajes
+que hoy solo están en leads.messages.
+
+Se puede correr con el bot en línea: los buckets que el bot ya escribió
+después del deploy se respetan, y lo embebido que es anterior a ellos se
+inserta con seq menores (negativos), marcados cerrado para que el bot no
+siga escribiendo en ellos. Cada lead migrado queda con
+lead_messages_migrado=true (así el script es re-ejecutable) y su
+leads.messages se recorta a la cola corta (storage.MAX_MENSAJES).
+
+También completa leads.last_message_at (fecha del último mensaje, la usa la
+lista del CRM) en los leads anteriores a ese campo.
+
+Uso:
+    python migrar_lead_messages.py            # aplica cambios
+    python migrar_lead_messages.py --dry-run  # solo reporta
+"""
+import argparse
+from datetime import datetime
+
+import database
+from chatbot.message_store import mensajes_anteriores
+from chatbot.storage import MAX_MENSAJES
+from chatbot.utils import normalizar_phone_key
+from config import Config
+
+
+def _buckets(mensajes: list, phone_key: str, primer_seq: int) -> list:
+    tamano = Config.LEAD_MESSAGES_BUCKET
+    trozos = [mensajes[i:i + tamano] for i in range(0, len(mensajes), tamano)]
+    return [{
+        "phone_key": phone_key,
+        "seq": primer_seq - len(trozos) + i,
+        "count": len(trozo),
+        "messages": trozo,
+        "primer_ts": trozo[0].get("timestamp"),
+        "ultimo_ts": trozo[-1].get("timestamp"),
+        "cerrado": True,
+        "updated_at": datetime.utcnow(),
+    } for i, trozo in enumerate(trozos)]
+
+
+def ejecutar(dry_run: bool = False):
+    leads = database.leads()
+    lead_messages = database.lead_messages()
+    if not dry_run:
+        database.asegurar_indices()
+
+    print("🔎 Buscando leads con mensajes sin migrar...")
+    cursor = leads.find(
+        {"messages.0": {"$exists": True}, "lead_messages_migrado": {"$ne": True}},
+        {"phone": 1, "messages": 1}
+    )
+    migrados = mensajes_total = 0
+    for lead in cursor:
+        phone_key = normalizar_phone_key(lead.get("phone", ""))
+        if not phone_key:
+            print(f"⚠️ Lead {lead['_id']} sin teléfono válido, se omite")
+            continue
+
+        primero = lead_messages.find_one({"phone_key": phone_key}, {"seq": 1, "messages": {"$slice": 1}}, sort=[("seq", 1)])
+        primer_seq = primero["seq"] if primero else 0
+        primer_ts = (primero.get("messages") or [{}])[0].get("timestamp") if primero else None
+        anteriores = mensajes_anteriores(lead.get("messages") or [], primer_ts)
+
+        migrados += 1
+        mensajes_total += len(anteriores)
+        if dry_run:
+            continue
+        if anteriores:
+            lead_messages.insert_many(_buckets(anteriores, phone_key, primer_seq))
+        leads.update_one({"_id": lead["_id"]}, {
+            "$set": {"lead_messages_migrado": True},
+            "$push": {"messages": {"$each": [], "$slice": -MAX_MENSAJES}},
+        })
+        if migrados % 500 == 0:
+            print(f"   ✅ {migrados} leads migrados...")
+
+    print(f"📊 {migrados} leads | {mensajes_total} mensajes copiados a lead_messages")
+
+    sin_fecha = {"last_message_at": {"$exists": False}, "messages.0": {"$exists": True}}
+    if dry_run:
+        print(f"📊 {leads.count_documents(sin_fecha)} leads sin last_message_at")
+        print("🧪 Dry run: no se escribió nada.")
+        return
+    # Update con pipeline: el servidor toma el timestamp del último mensaje sin traer los documentos
+    res = leads.update_many(sin_fecha, [{"$set": {"last_message_at": {"$arrayElemAt": ["$messages.timestamp", -1]}}}])
+    print(f"📊 {res.modified_count} leads con last_message_at completado")
+    print("🏁 Migración lista.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de lead_messages desde leads.messages")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    ejecutar(dry_run=args.dry_run)
@@ -0,0 +1,70 @@
+# migrar_phone_key.py → BACKFILL DE leads.phone_key + ÍNDICE ÚNICO
+"""
+Completa phone_key (E.164 solo dígitos) en los leads que no lo tienen y crea
+el índice único que usa el CRM para sus búsquedas exactas.
+
+Si dos leads caen en la misma clave (ej: '+56912345678' y '56912345678'), se
+listan y se deja sin phone_key al más antiguo: hay que fusionarlos a mano
+antes de volver a correr el script.
+
+Uso:
+    python migrar_phone_key.py            # aplica cambios
+    python migrar_phone_key.py --dry-run  # solo reporta
+"""
+import argparse
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+import database
+from chatbot.utils import normalizar_phone_key
+
+BATCH = 500
+
+
+def ejecutar(dry_run: bool = False):
+    coleccion = database.leads()
+    print("🔎 Calculando phone_key de todos los leads...")
+
+    por_clave = defaultdict(list)
+    for doc in coleccion.find({}, {"phone": 1, "phone_key": 1, "updated_at": 1}):
+        clave = normalizar_phone_key(doc.get("phone", ""))
+        if clave:
+            por_clave[clave].append(doc)
+
+    liberar, asignar = [], []
+    duplicados = 0
+    for clave, docs in por_clave.items():
+        # El más reciente se queda con la clave
+        docs.sort(key=lambda d: str(d.get("updated_at", "")), reverse=True)
+        principal, *resto = docs
+        if resto:
+            duplicados += 1
+            print(f"⚠️ DUPLICADO {clave}: se conserva {principal.get('phone')} ({principal['_id']}), "
+                  f"revisar {[d.get('phone') for d in resto]}")
+            for d in resto:
+                if "phone_key" in d:
+                    liberar.append(UpdateOne({"_id": d["_id"]}, {"$unset": {"phone_key": ""}}))
+        if principal.get("phone_key") != clave:
+            asignar.append(UpdateOne({"_id": principal["_id"]}, {"$set": {"phone_key": clave}}))
+
+    # Primero se liberan las claves de duplicados, así el índice único no rechaza los $set
+    operaciones = liberar + asignar
+    print(f"📊 {len(por_clave)} claves | {len(operaciones)} cambios | {duplicados} duplicados")
+    if dry_run:
+        print("🧪 Dry run: no se escribió nada.")
+        return
+
+    for i in range(0, len(operaciones), BATCH):
+        res = coleccion.bulk_write(operaciones[i:i + BATCH])
+        print(f"   ✅ Lote {i // BATCH + 1}: {res.modified_count} modificados")
+
+    database.asegurar_indices()
+    print("🏁 Índice phone_key_unique listo.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de leads.phone_key")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    ejecutar(dry_run=args.dry_run)
@@ -8,9 +8,9 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 from pathlib import Path
-from pymongo import MongoClient
 from fastapi.responses import HTMLResponse
 from config import Config
+import database
 
 logger = logging.getLogger(__name__)
 
@@ -221,9 +221,7 @@ async def handle_retiro_confirmacion(email: str, codigo: str, ip: str):
         logger.warning(f"Bloqueado intento de confirmación desde correo no autorizado: {email_norm} (IP: {ip}) - Propiedad {codigo_norm}")
         return pantalla_acceso_denegado(codigo_norm)
 
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    col = db["retiros_propiedades"]
+    col = database.retiros_propiedades()
     
     # Verificar si ya existe el retiro
     ya_confirmado = col.find_one({
@@ -251,7 +249,7 @@ async def handle_retiro_confirmacion(email: str, codigo: str, ip: str):
         """)
 
     # Datos del ejecutivo
-    prop_data = db["universo_obelix"].find_one({"codigo": codigo_norm})
+    prop_data = database.propiedades().find_one({"codigo": codigo_norm})
     email_ejecutivo = prop_data.get("email_ejecutivo") if prop_data else None
 
     # Hora local Chile para guardar en DB
@@ -278,7 +276,7 @@ async def handle_retiro_confirmacion(email: str, codigo: str, ip: str):
         upsert=True
     )
 
-    db["universo_obelix"].update_one(
+    database.propiedades().update_one(
         {"codigo": codigo_norm},
         {"$set": { "disponible": False, "fecha_no_disponible": datetime.utcnow(), "motivo": "retiro_propietario" }}
     )
@@ -322,16 +320,13 @@ async def handle_solicitud_contacto(email: str, codigo: str, ip: str):
         logger.warning(f"Bloqueado intento de solicitud de contacto desde correo no autorizado: {email_norm} (IP: {ip}) - Propiedad {codigo_norm}")
         return pantalla_acceso_denegado(codigo_norm)
 
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    
-    prop_data = db["universo_obelix"].find_one({"codigo": codigo_norm})
+    prop_data = database.propiedades().find_one({"codigo": codigo_norm})
     email_ejecutivo = prop_data.get("email_ejecutivo") if prop_data else None
 
     # Hora local Chile para guardar en DB
     ahora_chile = datetime.now(TZ_CHILE)
 
-    db["retiros_propiedades"].update_one(
+    database.retiros_propiedades().update_one(
         {"codigo_propiedad": codigo_norm},
         {
             "$set": {
@@ -0,0 +1,345 @@
+# wasender_client.py → CLIENTE WHATSAPP (WASENDERAPI) COMPARTIDO
+"""
+Cliente único para enviar mensajes por WasenderAPI.
+
+- httpx con keep-alive: reutiliza conexiones TCP/TLS entre envíos.
+- Reintentos con backoff exponencial + jitter (errores de red, 429 y 5xx).
+- Rate limiter por cuenta (token bucket compartido por todos los clientes del mismo token).
+- Outbox persistente en Mongo: si un envío se agota, queda en cola y un worker
+  lo reintenta más tarde, así una caída de Wasender no pierde respuestas.
+
+Uso async (webhook):   await get_wasender_client().send_text(phone, texto)
+Uso sync (scripts):    get_wasender_client().send_text_sync(phone, texto)
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+
+import database
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+
+# Estados del outbox
+PENDIENTE = "pendiente"
+ENVIANDO = "enviando"
+ENVIADO = "enviado"
+FALLIDO = "fallido"
+
+
+def normalizar_destino(number: str) -> str:
+    """Deja solo dígitos y corrige los formatos chilenos más comunes."""
+    clean = "".join(filter(str.isdigit, number or ""))
+    if len(clean) == 9 and clean.startswith("9"):
+        clean = "569" + clean
+    elif len(clean) == 12 and clean.startswith("569"):
+        clean = clean[1:]
+    return clean
+
+
+def calcular_backoff(intento: int, base: float, maximo: float) -> float:
+    """Backoff exponencial con 'full jitter' (intento empieza en 0)."""
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+
+# ==========================================
+# RATE LIMITER POR CUENTA
+# ==========================================
+class RateLimiter:
+    """Token bucket thread-safe. reservar() devuelve cuántos segundos hay que esperar."""
+
+    def __init__(self, por_minuto: float, rafaga: int):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = float(max(1, rafaga))
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        with self._lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.tasa
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter_para(token: str) -> RateLimiter:
+    with _limiters_lock:
+        if token not in _limiters:
+            _limiters[token] = RateLimiter(Config.WASENDER_MAX_POR_MINUTO, Config.WASENDER_RAFAGA)
+        return _limiters[token]
+
+
+# ==========================================
+# CLIENTE
+# ==========================================
+class WasenderError(Exception):
+    def __init__(self, mensaje: str, reintentable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+        self.retry_after = retry_after
+
+
+class WasenderClient:
+    def __init__(self, token: str = None, base_url: str = None):
+        self.token = token or Config.WASENDER_TOKEN or ""
+        self.url = f"{(base_url or Config.WASENDER_BASE_URL).rstrip('/')}/send-message"
+        self.headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        self.max_intentos = Config.WASENDER_MAX_INTENTOS
+        self.limiter = _limiter_para(self.token)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_lock = threading.Lock()
+
+    # --- Conexiones (perezosas, reutilizadas) ---
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(limits=LIMITS, timeout=TIMEOUT, headers=self.headers)
+        return self._async_client
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._sync_lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                self._sync_client = httpx.Client(limits=LIMITS, timeout=TIMEOUT, headers=self.headers)
+            return self._sync_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    # --- Respuesta HTTP ---
+    @staticmethod
+    def _validar(resp: httpx.Response):
+        if resp.status_code == 200:
+            try:
+                ok = resp.json().get("success", True)
+            except ValueError:
+                ok = True
+            if ok is not False:
+                return
+            raise WasenderError(f"success=false: {resp.text[:200]}")
+
+        retry_after = None
+        if resp.status_code == 429:
+            try:
+                retry_after = float(resp.headers.get("Retry-After", ""))
+            except ValueError:
+                retry_after = None
+        reintentable = resp.status_code == 429 or resp.status_code >= 500
+        raise WasenderError(f"HTTP {resp.status_code}: {resp.text[:200]}", reintentable, retry_after)
+
+    def _espera(self, intento: int, error: WasenderError) -> float:
+        if error.retry_after:
+            return error.retry_after
+        return calcular_backoff(intento, Config.WASENDER_BACKOFF_BASE, Config.WASENDER_BACKOFF_MAX)
+
+    # --- Envío async ---
+    async def _enviar_async(self, clean: str, text: str):
+        """Envía con reintentos. Lanza WasenderError si se agotan."""
+        client = self._get_async_client()
+        payload = {"to": clean, "text": text}
+        ultimo_error = WasenderError("sin intentos")
+        for intento in range(self.max_intentos):
+            espera = self.limiter.reservar()
+            if espera:
+                await asyncio.sleep(espera)
+            try:
+                resp = await client.post(self.url, json=payload)
+                self._validar(resp)
+                return
+            except WasenderError as e:
+                ultimo_error = e
+            except httpx.HTTPError as e:
+                ultimo_error = WasenderError(f"{type(e).__name__}: {e}")
+
+            logger.warning(f"[WASENDER] Fallo envío {intento + 1}/{self.max_intentos} a {clean}: {ultimo_error}")
+            if not ultimo_error.reintentable or intento == self.max_intentos - 1:
+                break
+            metrics.WHATSAPP_REINTENTOS.inc()
+            await asyncio.sleep(self._espera(intento, ultimo_error))
+        raise ultimo_error
+
+    async def send_text(self, number: str, text: str, encolar_si_falla: bool = True) -> bool:
+        if not text:
+            return False
+        clean = normalizar_destino(number)
+        try:
+            await self._enviar_async(clean, text)
+            logger.info(f"Enviado correctamente a {clean}")
+            metrics.WHATSAPP_ENVIOS.inc(resultado="ok")
+            return True
+        except WasenderError as e:
+            logger.error(f"[WASENDER] Envío agotado a {clean}: {e}")
+            encolar = encolar_si_falla and e.reintentable
+            metrics.WHATSAPP_ENVIOS.inc(resultado="encolado" if encolar else "fallido")
+            if encolar:
+                await asyncio.to_thread(encolar_outbox, clean, text, str(e))
+            return False
+
+    # --- Envío sync (scripts / campañas) ---
+    def _enviar_sync(self, clean: str, text: str):
+        client = self._get_sync_client()
+        payload = {"to": clean, "text": text}
+        ultimo_error = WasenderError("sin intentos")
+        for intento in range(self.max_intentos):
+            espera = self.limiter.reservar()
+            if espera:
+                time.sleep(espera)
+            try:
+                resp = client.post(self.url, json=payload)
+                self._validar(resp)
+                return
+            except WasenderError as e:
+                ultimo_error = e
+            except httpx.HTTPError as e:
+                ultimo_error = WasenderError(f"{type(e).__name__}: {e}")
+
+            logger.warning(f"[WASENDER] Fallo envío {intento + 1}/{self.max_intentos} a {clean}: {ultimo_error}")
+            if not ultimo_error.reintentable or intento == self.max_intentos - 1:
+                break
+            metrics.WHATSAPP_REINTENTOS.inc()
+            time.sleep(self._espera(intento, ultimo_error))
+        raise ultimo_error
+
+    def send_text_sync(self, number: str, text: str, encolar_si_falla: bool = True) -> bool:
+        if not text:
+            return False
+        clean = normalizar_destino(number)
+        try:
+            self._enviar_sync(clean, text)
+            logger.info(f"Enviado correctamente a {clean}")
+            metrics.WHATSAPP_ENVIOS.inc(resultado="ok")
+            return True
+        except WasenderError as e:
+            logger.error(f"[WASENDER] Envío agotado a {clean}: {e}")
+            encolar = encolar_si_falla and e.reintentable
+            metrics.WHATSAPP_ENVIOS.inc(resultado="encolado" if encolar else "fallido")
+            if encolar:
+                encolar_outbox(clean, text, str(e))
+            return False
+
+    # --- Outbox ---
+    async def drain_outbox(self, limite: int = 20) -> int:
+        """Reintenta los mensajes pendientes del outbox cuyo próximo intento ya venció. Retorna cuántos se enviaron."""
+        enviados = 0
+        for _ in range(limite):
+            doc = await asyncio.to_thread(_reclamar_pendiente)
+            if not doc:
+                break
+            try:
+                await self._enviar_async(doc["to"], doc["text"])
+                await asyncio.to_thread(_marcar_enviado, doc["_id"])
+                metrics.WHATSAPP_ENVIOS.inc(resultado="outbox_ok")
+                enviados += 1
+            except WasenderError as e:
+                metrics.WHATSAPP_ENVIOS.inc(resultado="outbox_reprogramado")
+                await asyncio.to_thread(_reprogramar, doc, str(e), e.reintentable)
+        if enviados:
+            logger.info(f"[WASENDER] Outbox: {enviados} mensajes reenviados")
+        return enviados
+
+    async def run_outbox_worker(self, intervalo: float = None):
+        intervalo = intervalo or Config.WASENDER_OUTBOX_INTERVALO
+        while True:
+            try:
+                await self.drain_outbox()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[WASENDER] Error drenando outbox: {e}")
+            await asyncio.sleep(intervalo)
+
+
+# ==========================================
+# OUTBOX PERSISTENTE (MONGO)
+# ==========================================
+def _outbox():
+    return database.whatsapp_outbox()
+
+
+def encolar_outbox(to: str, text: str, error: str = ""):
+    ahora = datetime.utcnow()
+    try:
+        _outbox().insert_one({
+            "to": to,
+            "text": text,
+            "status": PENDIENTE,
+            "intentos": 0,
+            "ultimo_error": error,
+            "created_at": ahora,
+            "proximo_intento": ahora + timedelta(seconds=Config.WASENDER_OUTBOX_INTERVALO)
+        })
+        logger.info(f"[WASENDER] Mensaje a {to} guardado en outbox para reintento")
+    except Exception as e:
+        logger.error(f"[WASENDER] No se pudo guardar en outbox ({to}): {e}")
+
+
+def _reclamar_pendiente() -> Optional[dict]:
+    """Toma un pendiente de forma atómica (seguro con varios workers). Recupera 'enviando' abandonados."""
+    ahora = datetime.utcnow()
+    return _outbox().find_one_and_update(
+        {"$or": [
+            {"status": PENDIENTE, "proximo_intento": {"$lte": ahora}},
+            {"status": ENVIANDO, "lease_hasta": {"$lt": ahora}}
+        ]},
+        {"$set": {"status": ENVIANDO, "lease_hasta": ahora + timedelta(minutes=2)}},
+        sort=[("proximo_intento", 1)]
+    )
+
+
+def _marcar_enviado(doc_id):
+    _outbox().update_one({"_id": doc_id}, {"$set": {"status": ENVIADO, "sent_at": datetime.utcnow()}})
+
+
+def _reprogramar(doc: dict, error: str, reintentable: bool):
+    intentos = doc.get("intentos", 0) + 1
+    agotado = not reintentable or intentos >= Config.WASENDER_OUTBOX_MAX_INTENTOS
+    espera = Config.WASENDER_OUTBOX_INTERVALO * (2 ** min(intentos, 6))
+    _outbox().update_one({"_id": doc["_id"]}, {"$set": {
+        "status": FALLIDO if agotado else PENDIENTE,
+        "intentos": intentos,
+        "ultimo_error": error,
+        "proximo_intento": datetime.utcnow() + timedelta(seconds=espera)
+    }})
+    if agotado:
+        logger.error(f"[WASENDER] Outbox: mensaje a {doc.get('to')} marcado como fallido tras {intentos} intentos")
+
+
+# ==========================================
+# INSTANCIA COMPARTIDA
+# ==========================================
+_default_client: Optional[WasenderClient] = None
+
+
+def get_wasender_client() -> WasenderClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = WasenderClient()
+    return _default_client
@@ -6,11 +6,10 @@ import logging
 import time
 import hmac
 import hashlib
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import re
 import os
 import secrets
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 from pathlib import Path
 import uvicorn
@@ -21,11 +20,11 @@ import pytz # Importante para la hora local
 import httpx 
 from urllib.parse import urlencode
 
-import requests
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Header, Query, Form, Depends, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Cookie
 
@@ -34,9 +33,22 @@ from campanas.handler import handle_campana_respuesta
 from retiro.handler import handle_retiro_confirmacion, handle_solicitud_contacto
 from api_leads_intelligence import get_leads_executive_report, get_specific_lead_chat
 from api_crm import get_crm_leads_list, get_lead_detail_data, update_lead_crm_data, log_crm_event, manage_crm_notes
+from wasender_client import get_wasender_client
+from chatbot.owner_directory import owner_directory
+from chatbot.catalog import property_catalog
+from chatbot.link_extractor import link_resolver
+from chatbot.response_cache import response_cache
+from chatbot.intent_router import router_stats
+from chatbot import tracing
+from chatbot.semantic_index import semantic_index
 
 # ========================= CONFIGURACIÓN =========================
 from config import Config
+import database
+import metrics
+from debounce import MongoDebounce, crear_backend, ventana_adaptativa
+from dispatcher import despachador
+from inbox import clave_idempotencia, mensajes_vistos, webhook_inbox
 
 logging.basicConfig(
     level=logging.INFO,
@@ -53,7 +65,40 @@ BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
 TEMPLATES_DIR = BASE_DIR / "templates"
 
-app = FastAPI(title="Procasa WhatsApp Bot - PRO PAGADO 2025")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool Mongo único para todo el proceso (se abre después del fork de gunicorn)
+    try:
+        await asyncio.to_thread(database.connect)
+        await asyncio.to_thread(database.asegurar_indices)
+        await asyncio.to_thread(crear_admin_si_no_existe)
+        await asyncio.to_thread(owner_directory.cargar)
+        await asyncio.to_thread(property_catalog.cargar)
+    except Exception as e:
+        logger.error(f"Error conectando a MongoDB al iniciar: {e}")
+
+    # Índice híbrido del RAG: se construye en segundo plano (mientras tanto el RAG usa Mongo)
+    if Config.SEMANTIC_ENABLED:
+        semantic_index.construir_en_background()
+
+    # Worker que reintenta los WhatsApp que quedaron en el outbox
+    wasender = get_wasender_client()
+    outbox_task = asyncio.create_task(wasender.run_outbox_worker())
+    # Con backend compartido, los buffers que quedaron de un reinicio se procesan al vencer
+    barrido_task = asyncio.create_task(barrer_debounce()) if isinstance(debounce_backend, MongoDebounce) else None
+    despachador.iniciar()
+    inbox_task = asyncio.create_task(consumir_inbox()) if Config.INBOX_ENABLED else None
+    yield
+    if inbox_task:
+        inbox_task.cancel()
+    outbox_task.cancel()
+    if barrido_task:
+        barrido_task.cancel()
+    await despachador.detener()
+    await wasender.aclose()
+    database.close()
+
+app = FastAPI(title="Procasa WhatsApp Bot - PRO PAGADO 2025", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
@@ -89,6 +134,18 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, Config.SECRET_KEY, algorithm="HS256")
 
+# --- LATENCIA HTTP POR RUTA (CRM, API, webhook) PARA /metrics ---
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    inicio = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        ruta = request.scope.get("route")
+        # Plantilla de ruta (/crm/lead/{phone}) para no crear una serie por teléfono
+        if ruta is not None and not request.url.path.startswith("/static"):
+            metrics.HTTP_SEGUNDOS.observe(time.perf_counter() - inicio, ruta=getattr(ruta, "path", "-"), metodo=request.method)
+
 # --- MIDDLEWARE DE SESIÓN SLIDING (SOLUCIÓN TIMEOUT) ---
 @app.middleware("http")
 async def slide_session_middleware(request: Request, call_next):
@@ -134,9 +191,7 @@ async def get_current_user(request: Request):
 
 def crear_admin_si_no_existe():
     try:
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-        usuarios = db["usuarios"]
+        usuarios = database.usuarios()
         if usuarios.count_documents({"username": "admin"}) == 0:
             hashed = get_password_hash("procasa2025")
             usuarios.insert_one({
@@ -152,8 +207,6 @@ def crear_admin_si_no_existe():
     except Exception as e:
         logger.error(f"Error creando admin: {e}")
 
-crear_admin_si_no_existe()
-
 # ========================= 3. LOGIN CON GOOGLE =========================
 
 @app.get("/login/google")
@@ -207,11 +260,7 @@ async def auth_google_callback(request: Request, code: str):
         email = user_info.get("email")
         
         # 3. Guardar o Buscar en MongoDB
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-        usuarios = db["usuarios"]
-        
-        user = usuarios.find_one({
+        user = await asyncio.to_thread(database.usuarios().find_one, {
             "$or": [
                 {"email": email}, 
                 {"username": email}
@@ -271,12 +320,10 @@ async def login_get(request: Request):
 @app.post("/login")
 async def login_post(request: Request, username: str = Form(...), password: str = Form(...)):
     try:
-        client = MongoClient(Config.MONGO_URI)
-        db = client[Config.DB_NAME]
-        usuarios = db["usuarios"]
-        user = usuarios.find_one({"username": username})
+        user = await asyncio.to_thread(database.usuarios().find_one, {"username": username})
         
-        if user and verify_password(password, user.get("hashed_password", "")):
+        # bcrypt también va a un hilo: son cientos de ms de CPU
+        if user and await asyncio.to_thread(verify_password, password, user.get("hashed_password", "")):
             user_rol = user.get("rol", "agente")
             target_url = "/leads-dashboard" if user_rol == "supervisor" else "/crm"
 
@@ -327,18 +374,16 @@ async def api_leads_reporte(request: Request):
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="No autorizado")
-    return get_leads_executive_report()
+    return await asyncio.to_thread(get_leads_executive_report)
 
 @app.get("/api/leads-intelligence")
 async def leads_intelligence_endpoint():
-    return get_leads_executive_report()
+    return await asyncio.to_thread(get_leads_executive_report)
 
 @app.get("/leads-dashboard", response_class=HTMLResponse)
 async def ver_leads(request: Request):
     username = await get_current_user(request)
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    user = db["usuarios"].find_one({"username": username})
+    user = await asyncio.to_thread(database.usuarios().find_one, {"username": username})
     
     if not user or user.get("rol") != "supervisor":
         return RedirectResponse(url="/crm?error=acceso_denegado")
@@ -348,10 +393,10 @@ async def ver_leads(request: Request):
 @app.get("/chat-detail/{phone}", response_class=HTMLResponse)
 async def ver_detalle_chat(request: Request, phone: str):
     phone_clean = phone.replace(" ", "").replace("+", "")
-    chat_data = get_specific_lead_chat(phone_clean)
+    chat_data = await asyncio.to_thread(get_specific_lead_chat, phone_clean)
     
     if not chat_data:
-        chat_data = get_specific_lead_chat(phone)
+        chat_data = await asyncio.to_thread(get_specific_lead_chat, phone)
         
     return templates.TemplateResponse("chat_detail.html", {
         "request": request, 
@@ -360,10 +405,11 @@ async def ver_detalle_chat(request: Request, phone: str):
     })
 
 # ========================= 6. RUTAS CRM (MODIFICADAS PARA HORA LOCAL) =========================
+# api_crm usa pymongo síncrono: cada llamada va a un hilo para no frenar los turnos del webhook
 
 @app.get("/crm", response_class=HTMLResponse)
 async def view_crm_list(request: Request, estado: str = None, busqueda: str = None, orden: str = "prioridad"):
-    leads, kpis = get_crm_leads_list(filtro_estado=estado, busqueda=busqueda, ordenar_por=orden)
+    leads, kpis = await asyncio.to_thread(get_crm_leads_list, filtro_estado=estado, busqueda=busqueda, ordenar_por=orden)
     return templates.TemplateResponse("crm_leads_list.html", {
         "request": request, 
         "leads": leads, 
@@ -373,11 +419,9 @@ async def view_crm_list(request: Request, estado: str = None, busqueda: str = No
 @app.get("/crm/lead/{phone}", response_class=HTMLResponse)
 async def view_crm_detail(request: Request, phone: str):
     username = await get_current_user(request)
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    user = db["usuarios"].find_one({"username": username})
+    user = await asyncio.to_thread(database.usuarios().find_one, {"username": username})
     
-    data = get_lead_detail_data(phone)
+    data = await asyncio.to_thread(get_lead_detail_data, phone)
     if not data: 
         return HTMLResponse("Lead no encontrado")
     
@@ -412,7 +456,8 @@ async def api_crm_log_action(request: Request):
             payload["meta"] = {}
         payload["meta"]["server_time_cl"] = now_cl.strftime("%Y-%m-%d %H:%M:%S")
 
-        log_crm_event(
+        await asyncio.to_thread(
+            log_crm_event,
             phone=phone, 
             event_type=payload.get("type"), 
             meta_data=payload.get("meta")
@@ -433,7 +478,7 @@ async def api_crm_update_lead(request: Request):
         # Aseguramos que se guarde la hora de actualización en CL
         data["updated_at_cl"] = datetime.now(CHILE_TZ).isoformat()
 
-        result = update_lead_crm_data(phone, data)
+        result = await asyncio.to_thread(update_lead_crm_data, phone, data)
         if result and isinstance(result, dict) and result.get("status") == "ok":
             return result
         elif result is True: # Fallback just in case
@@ -460,7 +505,7 @@ async def api_crm_notes(request: Request):
             # Añadimos timestamp ISO para ordenamiento backend
             note_data["timestamp_iso"] = now_cl.isoformat()
 
-        result = manage_crm_notes(phone, note_data, action)
+        result = await asyncio.to_thread(manage_crm_notes, phone, note_data, action)
         if result:
             return {"status": "ok", "note": result}
         return {"status": "error"}
@@ -468,88 +513,124 @@ async def api_crm_notes(request: Request):
         return {"status": "error", "detail": str(e)}
 
 # ========================= 7. WHATSAPP LOGIC (CORE) =========================
+# Buffer de la ráfaga en el backend (memoria o Mongo, ver debounce.py); aquí solo los timers locales
+debounce_backend = crear_backend()
 pending_tasks: Dict[str, Any] = {}
-last_message_time: Dict[str, float] = {}
-accumulated_messages: Dict[str, str] = {}
-DEBOUNCE_SECONDS = 15.0
 
 try:
-    from chatbot import process_user_message
+    from chatbot import process_user_message_async
 except ImportError:
-    def process_user_message(phone, message):
+    async def process_user_message_async(phone, message, on_respuesta=None):
         return f"Respuesta de prueba para {phone}: {message[:50]}..."
 
 async def send_whatsapp_message(number: str, text: str) -> bool:
-    if not text:
-        return False
-    clean = "".join(filter(str.isdigit, number))
-    if len(clean) == 9 and clean.startswith("9"):
-        clean = "569" + clean
-    elif len(clean) == 12 and clean.startswith("569"):
-        clean = clean[1:] 
-
-    url = f"{Config.WASENDER_BASE_URL}/send-message"
-    payload = {"to": clean, "text": text}
-    headers = {
-        "Authorization": f"Bearer {Config.WASENDER_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=15)
-        if resp.status_code == 200 and resp.json().get("success"):
-            logger.info(f"Enviado correctamente a {clean}")
-            return True
-        else:
-            logger.warning(f"Fallo envío 1: {resp.text}")
-    except Exception as e:
-        logger.error(f"Excepción envío 1: {e}")
-
-    await asyncio.sleep(2)
-    try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=15)
-        if resp.status_code == 200:
-            logger.info(f"Enviado en reintento a {clean}")
-            return True
-    except Exception as e:
-        logger.error(f"Excepción reintento: {e}")
-    return False
-
-async def process_with_debounce(phone: str, full_text: str):
+    # Cliente compartido: keep-alive, backoff con jitter, rate limit y outbox persistente
+    with tracing.span("envio_whatsapp") as span:
+        span["ok_envio"] = await get_wasender_client().send_text(number, text)
+        return span["ok_envio"]
+
+async def process_with_debounce(phone: str, full_text: str, clave: str = None):
+    espera, motivo = ventana_adaptativa.calcular(phone, full_text)
+    await asyncio.to_thread(debounce_backend.agregar, phone, full_text.strip(), espera, clave)
     if phone in pending_tasks and not pending_tasks[phone].done():
         pending_tasks[phone].cancel()
         logger.info(f"[DEBOUNCE] Tarea anterior cancelada para {phone}")
-    
-    current_text = accumulated_messages.get(phone, "")
-    if current_text:
-        accumulated_messages[phone] = current_text + " " + full_text.strip()
-    else:
-        accumulated_messages[phone] = full_text.strip()
-        
-    last_message_time[phone] = time.time()
+    logger.info(f"[DEBOUNCE] {phone}: espera {espera:.1f}s ({motivo})")
+    programar_turno(phone, espera, motivo)
 
+def programar_turno(phone: str, espera: float, motivo: str):
     async def delayed_process():
         try:
-            await asyncio.sleep(DEBOUNCE_SECONDS)
-            if time.time() - last_message_time.get(phone, 0) < DEBOUNCE_SECONDS - 0.1:
-                return
-            final_message = accumulated_messages.pop(phone, "").strip()
-            if not final_message:
-                return
-            logger.info(f"[PROCESS] Procesando mensaje AGRUPADO de {phone}: {final_message[:80]}...")
-            bot_response = process_user_message(phone, final_message)
-            if bot_response and bot_response.strip():
-                await send_whatsapp_message(phone, bot_response)
+            await asyncio.sleep(espera)
         except asyncio.CancelledError:
-            pass
+            return
+        # Desde aquí un mensaje nuevo ya no cancela el turno: queda en el buffer para el siguiente
+        if pending_tasks.get(phone) is asyncio.current_task():
+            pending_tasks.pop(phone, None)
+        # Un turno a la vez por teléfono y en orden de llegada (ver dispatcher.py)
+        if not await despachador.encolar(phone, lambda: procesar_turno(phone, espera, motivo)):
+            logger.warning(f"[DISPATCH] Cola llena, turno de {phone} reprogramado")
+            if phone not in pending_tasks:
+                programar_turno(phone, Config.DEBOUNCE_BASE_SECONDS, "contrapresion")
+
+    pending_tasks[phone] = asyncio.create_task(delayed_process())
+
+async def procesar_turno(phone: str, espera: float, motivo: str):
+    # Solo un worker gana el reclamo, y solo si la ráfaga ya venció
+    try:
+        reclamado = await asyncio.to_thread(debounce_backend.reclamar, phone)
+    except Exception as e:
+        logger.error(f"[DEBOUNCE] No se pudo reclamar el buffer de {phone}: {e}")
+        return
+    if not reclamado:
+        return
+    final_message, claves_inbox = reclamado
+    if not final_message:
+        return
+    # Lo que esperó la ráfaga desde su último mensaje (el timer que gana es el de ese mensaje)
+    metrics.DEBOUNCE_ESPERA_SEGUNDOS.observe(espera, motivo=motivo)
+    restante = None
+    try:
+        logger.info(f"[PROCESS] Procesando mensaje AGRUPADO de {phone}: {final_message[:80]}...")
+        # Con streaming, respuesta_bot se envía apenas Grok la cierra (antes de intencion/BI)
+        enviado = []
+        async def enviar_temprano(texto: str):
+            await send_whatsapp_message(phone, texto)
+            enviado.append(texto)
+
+        # Un turno trazado = procesamiento + envío (ver /metrics/turnos)
+        with tracing.turno(phone):
+            bot_response = await process_user_message_async(phone, final_message, on_respuesta=enviar_temprano)
+            if bot_response and bot_response.strip() and bot_response.strip() not in enviado:
+                await send_whatsapp_message(phone, bot_response)
+        metrics.MENSAJES_PROCESADOS.inc(resultado="ok")
+    except Exception as e:
+        metrics.MENSAJES_PROCESADOS.inc(resultado="error")
+        logger.error(f"Error procesando {phone}: {e}", exc_info=True)
+    finally:
+        try:
+            restante = await asyncio.to_thread(debounce_backend.confirmar, phone)
+            # Recién ahora los eventos de la bandeja dejan de poder reprocesarse
+            await asyncio.to_thread(webhook_inbox.completar, claves_inbox)
         except Exception as e:
-            logger.error(f"Error procesando {phone}: {e}", exc_info=True)
-        finally:
-            if phone in pending_tasks:
-                pending_tasks.pop(phone, None)
-
-    task = asyncio.create_task(delayed_process())
-    pending_tasks[phone] = task
+            logger.error(f"[DEBOUNCE] No se pudo confirmar el turno de {phone}: {e}")
+    # Mensajes que llegaron durante el turno: su timer pudo fallar el reclamo por el lease
+    if restante is not None and phone not in pending_tasks:
+        programar_turno(phone, restante, "durante_turno")
+
+async def barrer_debounce():
+    """Retoma buffers sin timer vivo: reinicios y workers caídos (lease vencido)."""
+    while True:
+        await asyncio.sleep(Config.DEBOUNCE_SWEEP_SECONDS)
+        try:
+            phones = await asyncio.to_thread(debounce_backend.vencidos)
+        except Exception as e:
+            logger.error(f"[DEBOUNCE] Error en el barrido: {e}")
+            continue
+        for phone in phones:
+            if phone not in pending_tasks:
+                logger.info(f"[DEBOUNCE] Retomando buffer huérfano de {phone}")
+                programar_turno(phone, 0, "barrido")
+
+# Métricas que se leen al momento del scrape desde los stats() de cada módulo
+metrics.gauge_funcion("procasa_debounce_pendientes", "Conversaciones esperando el debounce (todas las instancias si es mongo)",
+                      debounce_backend.pendientes)
+metrics.gauge_funcion("procasa_turno_cola_pendientes", "Turnos encolados esperando worker",
+                      despachador.pendientes)
+metrics.gauge_funcion("procasa_turno_cola_en_curso", "Turnos en proceso en este worker",
+                      lambda: despachador.en_curso)
+metrics.gauge_funcion("procasa_webhook_inbox_pendientes", "Eventos de Wasender en webhook_inbox sin procesar",
+                      webhook_inbox.pendientes)
+metrics.gauge_funcion("procasa_catalogo_propiedades", "Propiedades en el catálogo en memoria",
+                      lambda: property_catalog.stats()["propiedades"])
+metrics.gauge_funcion("procasa_catalogo_edad_segundos", "Antigüedad del snapshot del catálogo",
+                      lambda: property_catalog.stats()["edad_segundos"])
+metrics.gauge_funcion("procasa_cache_respuestas_total", "Lecturas del cache de primer contacto",
+                      lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses}, ["resultado"], tipo="counter")
+metrics.gauge_funcion("procasa_ruta_rapida_total", "Turnos resueltos sin LLM por regla",
+                      lambda: router_stats.resumen()["por_regla"], ["regla"], tipo="counter")
+metrics.gauge_funcion("procasa_links_portal_total", "Links de portal resueltos / sin propiedad en el catálogo",
+                      lambda: {("resuelto",): link_resolver.resueltos, ("no_resuelto",): link_resolver.no_resueltos}, ["resultado"], tipo="counter")
 
 # ========================= 8. WEBHOOK & API ENDPOINTS =========================
 
@@ -567,22 +648,77 @@ async def webhook(
         ).hexdigest()
         if not hmac.compare_digest(expected, x_webhook_signature or ""):
             logger.warning("Firma inválida en webhook")
+            metrics.WEBHOOK_REQUESTS.inc(resultado="firma_invalida")
             raise HTTPException(status_code=401, detail="Invalid signature")
 
     try:
         data = json.loads(raw_body.decode("utf-8"))
     except Exception as e:
         logger.error(f"JSON inválido: {e}")
+        metrics.WEBHOOK_REQUESTS.inc(resultado="json_invalido")
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     if data.get("event") == "webhook.test":
         logger.info("TEST WEBHOOK EXITOSO")
+        metrics.WEBHOOK_REQUESTS.inc(resultado="test")
         return JSONResponse({"ok": True}, status_code=200)
 
     messages_data = data.get("data", {}).get("messages", {}) or {}
     if not messages_data:
+        metrics.WEBHOOK_REQUESTS.inc(resultado="sin_mensajes")
         return JSONResponse({"status": "no messages"}, status_code=200)
 
+    # Idempotencia por id de mensaje: Wasender reintenta si no respondemos a tiempo
+    clave = clave_idempotencia(data, raw_body)
+    if not mensajes_vistos.primera_vez(clave):
+        return _respuesta_duplicado(clave)
+
+    # Respuesta rápida: el evento queda en webhook_inbox y lo procesa consumir_inbox
+    # (sin inbox se registra igual, ya procesado, para que el índice único frene los reintentos)
+    estado = "pendiente" if Config.INBOX_ENABLED else "procesado"
+    reservado = False
+    try:
+        nuevo = await asyncio.to_thread(webhook_inbox.guardar, clave, raw_body, estado)
+    except Exception as e:
+        logger.error(f"[INBOX] No se pudo guardar {clave}, se procesa en línea: {e}")
+    else:
+        if not nuevo:
+            return _respuesta_duplicado(clave)
+        if Config.INBOX_ENABLED:
+            metrics.WEBHOOK_REQUESTS.inc(resultado="encolado")
+            if inbox_despertar:
+                inbox_despertar.set()
+            return JSONResponse({"ok": True}, status_code=200)
+        reservado = True
+
+    try:
+        resultado = await procesar_evento(data)
+    except Exception:
+        # No quedó registro durable: se libera la clave para que el reintento de Wasender (500) no se descarte
+        mensajes_vistos.olvidar(clave)
+        if reservado:
+            try:
+                await asyncio.to_thread(webhook_inbox.liberar, clave)
+            except Exception as e:
+                logger.error(f"[INBOX] No se pudo liberar {clave}: {e}")
+        raise
+    if resultado == "ignorado":
+        return JSONResponse({"status": "ignored"}, status_code=200)
+    return JSONResponse({"ok": True}, status_code=200)
+
+def _respuesta_duplicado(clave: str) -> JSONResponse:
+    logger.info(f"[INBOX] Reintento de Wasender descartado: {clave}")
+    metrics.WEBHOOK_REQUESTS.inc(resultado="duplicado")
+    return JSONResponse({"ok": True, "duplicate": True}, status_code=200)
+
+async def procesar_evento(data: dict, clave: str = None) -> str:
+    """
+    Normaliza el mensaje de Wasender y lo suma al debounce. Retorna "aceptado" o "ignorado".
+    clave: id en webhook_inbox, que viaja con el buffer hasta que el turno se confirma.
+    """
+    messages_data = data.get("data", {}).get("messages", {}) or {}
+    if not messages_data:
+        return "ignorado"
     msg_obj = messages_data if isinstance(messages_data, dict) else messages_data[0]
     phone = (
         msg_obj.get("key", {}).get("cleanedSenderPn") or
@@ -598,7 +734,8 @@ async def webhook(
     ).strip()
 
     if not phone or not text:
-        return JSONResponse({"status": "ignored"}, status_code=200)
+        metrics.WEBHOOK_REQUESTS.inc(resultado="ignorado")
+        return "ignorado"
 
     phone = phone.replace("@c.us", "").replace("@s.whatsapp.net", "")
     if phone.startswith("56") and len(phone) == 11:
@@ -607,13 +744,70 @@ async def webhook(
         phone = "+56" + phone.lstrip("0")
 
     logger.info(f"[WHATSAPP] Mensaje recibido de {phone}: {text}")
-    await process_with_debounce(phone, text)
-    return JSONResponse({"ok": True}, status_code=200)
+    metrics.WEBHOOK_REQUESTS.inc(resultado="aceptado")
+    await process_with_debounce(phone, text, clave)
+    return "aceptado"
+
+inbox_despertar: Optional[asyncio.Event] = None  # Lo crea consumir_inbox en el loop del lifespan
+
+async def consumir_inbox():
+    """Drena webhook_inbox en orden de llegada; al arrancar retoma lo que quedó pendiente."""
+    global inbox_despertar
+    inbox_despertar = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(inbox_despertar.wait(), Config.INBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        inbox_despertar.clear()
+        while True:
+            try:
+                evento = await asyncio.to_thread(webhook_inbox.reclamar)
+            except Exception as e:
+                logger.error(f"[INBOX] Error leyendo la bandeja: {e}")
+                break
+            if not evento:
+                break
+            estado, error = "procesado", None
+            try:
+                # Aceptado = el texto está en el debounce; pasa a procesado cuando el turno se confirma
+                if await procesar_evento(json.loads(evento["raw"]), evento["_id"]) == "aceptado":
+                    estado = "en_buffer"
+            except Exception as e:
+                error = str(e)
+                estado = "fallido" if evento.get("intentos", 0) >= Config.INBOX_MAX_INTENTOS else "pendiente"
+                logger.error(f"[INBOX] Error procesando {evento['_id']} (intento {evento.get('intentos')}): {e}", exc_info=True)
+            try:
+                if estado == "en_buffer":
+                    await asyncio.to_thread(webhook_inbox.dejar_en_buffer, evento["_id"])
+                else:
+                    await asyncio.to_thread(webhook_inbox.marcar, evento["_id"], estado, error)
+            except Exception as e:
+                logger.error(f"[INBOX] No se pudo marcar {evento['_id']}: {e}")
+            if estado == "pendiente":
+                break  # Se reintenta en el próximo ciclo
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "active_conversations": len(pending_tasks), "uptime": time.strftime("%Y-%m-%d %H:%M:%S")}
 
+@app.get("/metrics")
+async def metrics_prometheus():
+    """Formato de texto de Prometheus (ver metrics.py)."""
+    # En un hilo: los gauges de bandeja y debounce consultan Mongo y no deben frenar al webhook
+    texto = await asyncio.to_thread(metrics.exportar)
+    return PlainTextResponse(texto, media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/links")
+async def metrics_links(top: int = Query(50, ge=1, le=500)):
+    """Avisos de portal que pegan los clientes y no están en universo_obelix (brechas del catálogo)."""
+    return link_resolver.stats(top)
+
+@app.get("/metrics/turnos")
+async def metrics_turnos():
+    """p50/p95/p99 por etapa de los últimos turnos (chatbot/tracing.py)."""
+    return tracing.latencias.resumen()
+
 @app.post("/api/keep-alive")
 async def api_keep_alive(request: Request):
     """Endpoint ligero para renovar la cookie de sesión sin recargar"""
@@ -632,7 +826,7 @@ async def campana_respuesta(
 @app.get("/api/reporte_real")
 async def api_reporte_real():
     from api_reporte_real import get_reporte_real
-    data = get_reporte_real()
+    data = await asyncio.to_thread(get_reporte_real)
     return data
 
 @app.post("/api/marcar_gestionado")
@@ -642,15 +836,15 @@ async def marcar_gestionado(request: Request):
     gestionado = data.get("gestionado", False)
     if not email:
         return {"error": "Falta email"}
-    client = MongoClient(Config.MONGO_URI)
-    db = client[Config.DB_NAME]
-    col = db[Config.COLLECTION_CONTACTOS]
-    result = col.update_one(
+    col = database.contactos()
+    result = await asyncio.to_thread(
+        col.update_one,
         {"email_propietario": email.lower()},
         {"$set": {"gestionado": gestionado}}
     )
     if result.matched_count == 0:
-        col.update_one(
+        await asyncio.to_thread(
+            col.update_one,
             {"email_propietario": {"$regex": f"^{re.escape(email.lower())}$", "$options": "i"}},
             {"$set": {"gestionado": gestionado}}
         )